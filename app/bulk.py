@@ -0,0 +1,262 @@
+"""
+Bulk vCard and QR generation from CSV or JSONL input, streamed out as a ZIP.
+"""
+import io
+import os
+import csv
+import json
+import codecs
+import uuid
+import asyncio
+import zipfile
+import argparse
+import itertools
+from typing import AsyncIterator, BinaryIO, Iterator, List, Optional, Union
+
+from .cards import INSERT_VCARD_SQL, VCARD_FIELDS, build_card, card_row
+from .executor import RenderExecutor, render_executor
+from .db import Database, db, db_executor
+
+
+# Number of input rows inserted and rendered together
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "100"))
+
+
+def detect_input_kind(filename: Optional[str], content_type: Optional[str] = None) -> str:
+    """
+    Decide whether an upload is CSV or JSONL.
+
+    Args:
+        filename: Name of the uploaded file
+        content_type: MIME type sent by the client
+
+    Returns:
+        "jsonl" or "csv"
+    """
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in (content_type or ""):
+        return "jsonl"
+    return "csv"
+
+
+class InvalidRecord(ValueError):
+    """Stands in for an input record that could not be read."""
+
+
+def iter_records(stream: BinaryIO, kind: str) -> Iterator[Union[dict, InvalidRecord]]:
+    """
+    Read contact records one at a time from a CSV or JSONL byte stream.
+
+    CSV input needs a header row naming the columns; JSONL input has one
+    object per line. Only the vCard fields are kept and blank values become None.
+    A record that cannot be parsed is yielded as an InvalidRecord instead of
+    raising, so one bad line does not abort the whole upload. JSONL lines are
+    independent and reading carries on after a bad one; a CSV reader cannot
+    resynchronize, so reading stops at the first unreadable row.
+
+    Args:
+        stream: Binary file-like object
+        kind: "csv" or "jsonl"
+
+    Yields:
+        Dicts with the vCard fields, or an InvalidRecord per unreadable record
+    """
+    if kind == "jsonl":
+        yield from _iter_jsonl(stream)
+        return
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        try:
+            for row in csv.DictReader(text):
+                yield _fields(row)
+        except (csv.Error, UnicodeDecodeError) as e:
+            yield InvalidRecord(f"unreadable CSV: {e}")
+    finally:
+        # The caller owns the stream
+        text.detach()
+
+
+def _iter_jsonl(stream: BinaryIO) -> Iterator[Union[dict, InvalidRecord]]:
+    for number, raw in enumerate(stream):
+        if number == 0:
+            raw = raw.removeprefix(codecs.BOM_UTF8)
+        if not raw.strip():
+            continue
+        try:
+            # JSONDecodeError and UnicodeDecodeError are both ValueErrors
+            row = json.loads(raw.decode("utf-8"))
+        except ValueError as e:
+            yield InvalidRecord(f"invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield InvalidRecord(f"expected a JSON object, got {type(row).__name__}")
+            continue
+        yield _fields(row)
+
+
+def _fields(row: dict) -> dict:
+    return {field: _clean(row.get(field)) for field in VCARD_FIELDS}
+
+
+def _clean(value) -> Optional[str]:
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+class _ZipBuffer:
+    """Write-only, non-seekable sink that lets ZipFile stream its output."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        """Return and forget everything written since the last drain."""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def stream_bulk_zip(
+    records: Iterator[dict],
+    formats: List[str],
+    database: Database = db,
+    executor: RenderExecutor = render_executor,
+    batch_size: int = BULK_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Create vCards and QR codes for every record and stream them as a ZIP.
+
+    Records are handled batch_size at a time: each batch is inserted in one
+    transaction, rendered in parallel and written to the archive before the
+    next batch is read, so memory stays bounded whatever the input size.
+    Reading the input and deflating the archive both block, so they run in
+    a worker thread rather than on the event loop.
+    Each card gets a folder named after its id holding the .vcf file and one
+    QR code per format; manifest.csv lists every input line and its result,
+    including lines that could not be read.
+
+    Args:
+        records: Contact records, e.g. from iter_records
+        formats: QR formats to include
+        database: Database the vcards rows are written to
+        executor: Render executor used for the QR codes
+        batch_size: Records per batch
+
+    Yields:
+        Consecutive chunks of the ZIP file
+    """
+    loop = asyncio.get_running_loop()
+    buffer = _ZipBuffer()
+    archive = zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED)
+    manifest = io.StringIO()
+    manifest_writer = csv.writer(manifest)
+    manifest_writer.writerow(["line", "vcard_id", "name", "path", "error"])
+
+    line = 0
+    while True:
+        batch = await loop.run_in_executor(None, _read_batch, records, batch_size, line)
+        if batch:
+            await _write_batch(archive, manifest_writer, batch, formats, database, executor)
+            line = batch[-1][0]
+        if len(batch) < batch_size:
+            break
+        yield buffer.drain()
+
+    await loop.run_in_executor(None, _finish_archive, archive, manifest.getvalue())
+    yield buffer.drain()
+
+
+def _read_batch(records: Iterator, batch_size: int, line: int) -> List[tuple]:
+    return list(enumerate(itertools.islice(records, batch_size), start=line + 1))
+
+
+def _finish_archive(archive: zipfile.ZipFile, manifest: str) -> None:
+    archive.writestr("manifest.csv", manifest)
+    archive.close()
+
+
+def _insert_cards(database: Database, rows: List[tuple]) -> None:
+    with database.writer() as conn:
+        conn.executemany(INSERT_VCARD_SQL, rows)
+
+
+async def _write_batch(archive, manifest_writer, batch, formats, database, executor) -> None:
+    cards = []
+    for line, record in batch:
+        if isinstance(record, InvalidRecord) or not record.get("name"):
+            cards.append((line, None, record, None))
+            continue
+        cards.append((line, str(uuid.uuid4()), record, build_card(record)))
+    valid = [card for card in cards if card[1] is not None]
+
+    # The insert blocks, so it runs in the database pool rather than on the event loop
+    await db_executor.run(_insert_cards, database, [
+        card_row(vcard_id, record, card) for _, vcard_id, record, card in valid
+    ])
+
+    rendered = await asyncio.gather(*(
+        executor.render_many(card.content, formats, cache=False) for _, _, _, card in valid
+    ))
+    qr_by_id = {card[1]: qr_files for card, qr_files in zip(valid, rendered)}
+
+    await asyncio.get_running_loop().run_in_executor(
+        None, _archive_cards, archive, manifest_writer, cards, qr_by_id
+    )
+
+
+def _archive_cards(archive, manifest_writer, cards, qr_by_id) -> None:
+    for line, vcard_id, record, card in cards:
+        if vcard_id is None:
+            error = str(record) if isinstance(record, InvalidRecord) else "missing name"
+            manifest_writer.writerow([line, "", "", "", error])
+            continue
+        qr_files = qr_by_id[vcard_id]
+        archive.writestr(f"{vcard_id}/{card.filename}", card.content)
+        for fmt, qr_bytes in qr_files.items():
+            if qr_bytes is not None:
+                archive.writestr(f"{vcard_id}/qr.{fmt}", qr_bytes)
+        failed = [fmt for fmt, qr_bytes in qr_files.items() if qr_bytes is None]
+        error = f"failed to render {', '.join(failed)}" if failed else ""
+        manifest_writer.writerow([line, vcard_id, record["name"], f"{vcard_id}/", error])
+
+
+async def _write_zip(input_path: str, output_path: str, formats: List[str]) -> None:
+    kind = detect_input_kind(input_path)
+    with open(input_path, "rb") as source, open(output_path, "wb") as target:
+        async for chunk in stream_bulk_zip(iter_records(source, kind), formats):
+            target.write(chunk)
+
+
+def main(argv=None) -> None:
+    """Command line entry point: python -m app.bulk contacts.csv -o cards.zip"""
+    parser = argparse.ArgumentParser(description="Generate vCards and QR codes in bulk")
+    parser.add_argument("input", help="CSV (with a header row) or JSONL file of contacts")
+    parser.add_argument("-o", "--output", default="vcards.zip", help="ZIP file to write")
+    parser.add_argument("--formats", default="png,svg,eps,pdf", help="Comma-separated QR formats")
+    args = parser.parse_args(argv)
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip()]
+    try:
+        asyncio.run(_write_zip(args.input, args.output, formats))
+    finally:
+        render_executor.shutdown()
+        db.close()
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
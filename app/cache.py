@@ -0,0 +1,137 @@
+"""
+Bounded in-memory cache of generated vCards.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Union
+
+from .conditional import make_etag
+
+
+# Limits for the per-process vCard cache
+VCARD_CACHE_MAX_ENTRIES = int(os.getenv("VCARD_CACHE_MAX_ENTRIES", "10000"))
+VCARD_CACHE_MAX_BYTES = int(os.getenv("VCARD_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+VCARD_CACHE_TTL = float(os.getenv("VCARD_CACHE_TTL", "3600"))
+
+
+class VCardRecord:
+    """Compact record of a generated vCard and the ETag of its content."""
+
+    __slots__ = ("content", "filename", "name", "etag", "size", "expires_at")
+
+    def __init__(self, content: str, filename: str, name: str, etag: Optional[str] = None):
+        self.content = content
+        self.filename = filename
+        self.name = name
+        # Records loaded from the database pass the stored ETag instead of rehashing
+        self.etag = etag or make_etag(content)
+        self.size = len(content.encode('utf-8')) + len(filename) + len(name.encode('utf-8'))
+        self.expires_at = 0.0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "VCardRecord":
+        """Build a record from a dict with content, filename and name keys, and an optional etag."""
+        return cls(content=data["content"], filename=data["filename"], name=data["name"], etag=data.get("etag"))
+
+
+class VCardCache:
+    """
+    LRU cache of vCard records with entry, byte and age limits.
+
+    Entries older than ttl seconds are treated as misses. Callers fall back
+    to the database on a miss and put the result back in the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = VCARD_CACHE_MAX_ENTRIES,
+        max_bytes: int = VCARD_CACHE_MAX_BYTES,
+        ttl: float = VCARD_CACHE_TTL,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, vcard_id: str) -> Optional[VCardRecord]:
+        """Return the record for vcard_id, or None if it is missing or expired."""
+        with self._lock:
+            record = self._entries.get(vcard_id)
+            if record is None:
+                self.misses += 1
+                return None
+            if record.expires_at <= self._clock():
+                self._remove(vcard_id)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(vcard_id)
+            self.hits += 1
+            return record
+
+    def put(self, vcard_id: str, record: Union[VCardRecord, dict]) -> VCardRecord:
+        """Store a record, evicting least recently used entries as needed."""
+        if isinstance(record, dict):
+            record = VCardRecord.from_dict(record)
+        record.expires_at = self._clock() + self.ttl
+
+        with self._lock:
+            if vcard_id in self._entries:
+                self._remove(vcard_id)
+            self._entries[vcard_id] = record
+            self.current_bytes += record.size
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                evicted_id = next(iter(self._entries))
+                self._remove(evicted_id)
+                self.evictions += 1
+        return record
+
+    def delete(self, vcard_id: str) -> None:
+        """Drop the entry for vcard_id, if any."""
+        with self._lock:
+            if vcard_id in self._entries:
+                self._remove(vcard_id)
+
+    def _remove(self, vcard_id: str) -> None:
+        record = self._entries.pop(vcard_id)
+        self.current_bytes -= record.size
+
+    def __setitem__(self, vcard_id: str, record: Union[VCardRecord, dict]) -> None:
+        self.put(vcard_id, record)
+
+    def __contains__(self, vcard_id: str) -> bool:
+        return self.get(vcard_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def stats(self) -> dict:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -0,0 +1,134 @@
+"""
+Creating vCards and finding them again: the one path every route uses.
+
+A card is serialized once, when it is created. The vCard text, its ETag
+and its filename are stored on the vcards row next to the form fields, so
+a card that is not in the vCard store costs one primary-key read and no
+formatting or hashing.
+"""
+from typing import Optional
+
+from .cache import VCardRecord
+from .db import Database, DBExecutor, db, db_executor
+from .metrics import DB_QUERY_SECONDS, ERRORS
+from .storage import VCardStore
+from .vcard import generate_vcard, generate_vcard_filename
+
+
+VCARD_FIELDS = ("name", "company", "title", "email", "phone", "website")
+
+INSERT_VCARD_SQL = '''
+    INSERT OR REPLACE INTO vcards (id, name, company, title, email, phone, website, content, etag, filename)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def build_card(fields: dict) -> VCardRecord:
+    """
+    Serialize a card from its form fields.
+
+    Args:
+        fields: Dict with the VCARD_FIELDS keys; only name is required
+
+    Returns:
+        Record with the vCard text, ETag and download filename
+    """
+    content = generate_vcard(**{field: fields.get(field) for field in VCARD_FIELDS})
+    return VCardRecord(content, generate_vcard_filename(fields["name"]), fields["name"])
+
+
+def card_row(vcard_id: str, fields: dict, record: VCardRecord) -> tuple:
+    """Return the INSERT_VCARD_SQL parameters for a card."""
+    return (
+        (vcard_id,)
+        + tuple(fields.get(field) for field in VCARD_FIELDS)
+        + (record.content, record.etag, record.filename)
+    )
+
+
+def load_card(vcard_id: str, database: Database = db) -> Optional[VCardRecord]:
+    """
+    Read a stored card from the vcards table.
+
+    Args:
+        vcard_id: ID of the card
+        database: Database holding the vcards table
+
+    Returns:
+        The record, or None if the card does not exist or cannot be read
+    """
+    try:
+        with DB_QUERY_SECONDS.time("get_vcard"), database.reader() as conn:
+            row = conn.execute(
+                "SELECT content, filename, name, etag FROM vcards WHERE id = ?", (vcard_id,)
+            ).fetchone()
+    except Exception as e:
+        print(f"Error getting vCard from database: {e}")
+        ERRORS.inc("get_vcard_from_db")
+        return None
+    return VCardRecord(*row) if row else None
+
+
+def resolve_card(vcard_id: str, store: VCardStore, database: Database = db) -> Optional[VCardRecord]:
+    """
+    Find a card in the vCard store, else in the database.
+
+    Cards read from the database are put back in the store, so the next
+    lookup on any worker sharing the store is a hit.
+
+    Args:
+        vcard_id: ID of the card
+        store: vCard store checked first
+        database: Database holding the vcards table
+
+    Returns:
+        The record, or None if the card does not exist
+    """
+    return store.get_nowait(vcard_id) or _resolve_uncached(vcard_id, store, database)
+
+
+async def resolve_card_async(
+    vcard_id: str,
+    store: VCardStore,
+    database: Database = db,
+    executor: DBExecutor = db_executor
+) -> Optional[VCardRecord]:
+    """
+    Like resolve_card, for async handlers.
+
+    In-process cache hits are answered on the event loop; shared stores and
+    the database are only read in the database pool.
+    """
+    record = store.get_nowait(vcard_id)
+    if record is None:
+        record = await executor.run(_resolve_uncached, vcard_id, store, database)
+    return record
+
+
+def _resolve_uncached(vcard_id: str, store: VCardStore, database: Database) -> Optional[VCardRecord]:
+    record = store.get_blocking(vcard_id)
+    if record is None:
+        record = load_card(vcard_id, database)
+        if record is not None:
+            record = store.put(vcard_id, record)
+    return record
+
+
+def save_card(vcard_id: str, fields: dict, record: VCardRecord, store: VCardStore, database: Database = db) -> None:
+    """
+    Put a new card in the vCard store and write its vcards row.
+
+    Args:
+        vcard_id: ID of the new card
+        fields: Form fields the card was built from
+        record: Record from build_card
+        store: vCard store to put the card in
+        database: Database holding the vcards table
+    """
+    store.put(vcard_id, record)
+    try:
+        with DB_QUERY_SECONDS.time("insert_vcard"), database.writer() as conn:
+            conn.execute(INSERT_VCARD_SQL, card_row(vcard_id, fields, record))
+    except Exception as e:
+        print(f"Error storing vCard in database: {e}")
+        ERRORS.inc("store_vcard")
@@ -0,0 +1,71 @@
+"""
+Conditional GET helpers: strong ETags, If-None-Match and Cache-Control.
+"""
+import os
+import hashlib
+from fastapi import Request
+from fastapi.responses import Response
+
+
+# Cache-Control sent with QR images; a rendered symbol never changes
+QR_CACHE_CONTROL = os.getenv("QR_CACHE_CONTROL", "public, max-age=31536000, immutable")
+
+# Cache-Control sent with url-mode QR images; they encode the public base
+# URL, which changes with each tunnel session, so caches must revalidate
+QR_URL_CACHE_CONTROL = os.getenv("QR_URL_CACHE_CONTROL", "public, no-cache")
+
+# Cache-Control sent with direct vCard downloads
+VCARD_CACHE_CONTROL = os.getenv("VCARD_CACHE_CONTROL", "public, max-age=86400")
+
+# Cache-Control sent with scanned vCards; caches must revalidate so every
+# scan still reaches the server and gets logged
+SCAN_CACHE_CONTROL = os.getenv("SCAN_CACHE_CONTROL", "private, no-cache")
+
+
+def make_etag(*parts: str) -> str:
+    """
+    Build a strong ETag from the parts that determine a response body.
+    
+    Args:
+        parts: Content, or content hash plus render parameters
+        
+    Returns:
+        Quoted ETag value
+    """
+    digest = hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Check whether the request's If-None-Match header covers etag.
+    
+    Args:
+        request: Incoming request
+        etag: Current ETag of the resource
+        
+    Returns:
+        True if the client's copy is current
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """
+    Build a 304 Not Modified response.
+    
+    Args:
+        etag: Current ETag of the resource
+        cache_control: Cache-Control value for the resource
+        
+    Returns:
+        Empty 304 response carrying the validators
+    """
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
@@ -0,0 +1,405 @@
+"""
+SQLite data access with long-lived, pooled connections.
+"""
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Iterator, List
+
+from .pools import PooledExecutor
+
+
+# Path of the tracking database
+DATABASE_PATH = os.getenv("DATABASE_PATH", "qr_tracking.db")
+
+# Maximum number of read connections kept open at once
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+
+# How long a connection waits on a locked database before failing
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Prepared statements cached per connection by the sqlite3 module
+DB_STATEMENT_CACHE_SIZE = 128
+
+# Threads that run database work for async handlers; one more than the
+# read pool, so a write can run while every reader is busy
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_READ_POOL_SIZE + 1)))
+
+
+def _create_base_tables(conn: sqlite3.Connection) -> None:
+    """Migration 1: scans and vcards tables."""
+    cursor = conn.cursor()
+
+    # Create scans table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vcard_id TEXT NOT NULL,
+            scan_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ip_address TEXT,
+            user_agent TEXT,
+            country TEXT,
+            city TEXT,
+            latitude REAL,
+            longitude REAL,
+            referer TEXT,
+            device_type TEXT
+        )
+    ''')
+
+    # Create vcards table for reference
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vcards (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            company TEXT,
+            title TEXT,
+            email TEXT,
+            phone TEXT,
+            website TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _create_rollup_tables(conn: sqlite3.Connection) -> None:
+    """Migration 2: scan rollups and visitor sketches, backfilled from existing scans."""
+    from .rollups import backfill_rollups
+
+    # Create scan rollups, maintained by the scan writer as scans are stored
+    for table in ("scan_rollup_hourly", "scan_rollup_daily"):
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                vcard_id TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                device_type TEXT NOT NULL,
+                scans INTEGER NOT NULL DEFAULT 0,
+                first_scan TIMESTAMP,
+                last_scan TIMESTAMP,
+                PRIMARY KEY (vcard_id, bucket, device_type)
+            ) WITHOUT ROWID
+        ''')
+
+    # Create per-day HyperLogLog sketches of visitor IPs
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_visitor_sketches (
+            vcard_id TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            sketch BLOB NOT NULL,
+            PRIMARY KEY (vcard_id, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+    backfill_rollups(conn, dimensions=False)
+
+
+def _create_scan_indexes(conn: sqlite3.Connection) -> None:
+    """Migration 3: indexes for per-card and global recent-scan queries."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scans_vcard_time ON scans (vcard_id, scan_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_scans_scan_time ON scans (scan_time)")
+    # Older databases carry a single-column index that the composite one makes redundant
+    conn.execute("DROP INDEX IF EXISTS idx_scans_vcard_id")
+
+
+def _add_client_columns(conn: sqlite3.Connection) -> None:
+    """Migration 4: OS, browser and bot columns on scans, with a daily breakdown rollup."""
+    from .rollups import backfill_rollups
+    from .useragent import classify_user_agent
+
+    for column in ("os TEXT", "browser TEXT", "is_bot INTEGER DEFAULT 0"):
+        conn.execute(f"ALTER TABLE scans ADD COLUMN {column}")
+
+    # Create per-day scan counts by OS and by browser
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_rollup_dimensions (
+            vcard_id TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            scans INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (vcard_id, dimension, value, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+    # Classify existing scans once per distinct user agent; this also
+    # corrects device types recorded by the old substring checks
+    user_agents = [row[0] for row in conn.execute(
+        "SELECT DISTINCT user_agent FROM scans WHERE user_agent IS NOT NULL AND user_agent != ''"
+    )]
+    for user_agent in user_agents:
+        info = classify_user_agent(user_agent)
+        conn.execute(
+            "UPDATE scans SET device_type = ?, os = ?, browser = ?, is_bot = ? WHERE user_agent = ?",
+            (info.device_type, info.os, info.browser, int(info.is_bot), user_agent)
+        )
+
+    backfill_rollups(conn)
+
+
+def _create_archive_table(conn: sqlite3.Connection) -> None:
+    """Migration 5: registry of per-month scan archive files."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_archives (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            scans INTEGER NOT NULL DEFAULT 0,
+            archived_before TEXT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _create_vcard_store_table(conn: sqlite3.Connection) -> None:
+    """Migration 6: generated vCards shared by every worker of the SQLite store."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vcard_store (
+            id TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            name TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def _create_short_codes_table(conn: sqlite3.Connection) -> None:
+    """Migration 7: short codes that url-mode QR codes resolve to a vCard."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS short_codes (
+            code TEXT PRIMARY KEY,
+            vcard_id TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_vcard_content_columns(conn: sqlite3.Connection) -> None:
+    """Migration 8: the serialized vCard, its ETag and filename on each vcards row."""
+    from .conditional import make_etag
+    from .vcard import generate_vcard, generate_vcard_filename
+
+    for column in ("content TEXT", "etag TEXT", "filename TEXT"):
+        conn.execute(f"ALTER TABLE vcards ADD COLUMN {column}")
+
+    # Serialize existing cards once, so reads never have to
+    rows = conn.execute(
+        "SELECT id, name, company, title, email, phone, website FROM vcards"
+    ).fetchall()
+    for vcard_id, name, company, title, email, phone, website in rows:
+        content = generate_vcard(name, company, title, email, phone, website)
+        conn.execute(
+            "UPDATE vcards SET content = ?, etag = ?, filename = ? WHERE id = ?",
+            (content, make_etag(content), generate_vcard_filename(name), vcard_id)
+        )
+
+
+def _add_vcard_store_etag(conn: sqlite3.Connection) -> None:
+    """Migration 9: the ETag of each shared vCard, so store hits are not rehashed."""
+    # Rows stored before this have no tag and are hashed once when read
+    conn.execute("ALTER TABLE vcard_store ADD COLUMN etag TEXT")
+
+
+def _drop_vcard_store_table(conn: sqlite3.Connection) -> None:
+    """Migration 10: drop vcard_store; the SQLite store reads the vcards rows instead."""
+    conn.execute("DROP TABLE IF EXISTS vcard_store")
+
+
+# Schema migrations, applied in order; the database's user_version records
+# how many have run. Append new steps, never edit or reorder existing ones.
+MIGRATIONS = [
+    _create_base_tables,
+    _create_rollup_tables,
+    _create_scan_indexes,
+    _add_client_columns,
+    _create_archive_table,
+    _create_vcard_store_table,
+    _create_short_codes_table,
+    _add_vcard_content_columns,
+    _add_vcard_store_etag,
+    _drop_vcard_store_table,
+]
+
+
+def init_schema(conn: sqlite3.Connection) -> None:
+    """Bring the schema up to date by running any pending migrations."""
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read inside the transaction in case another process migrated first
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if current < version:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+class Database:
+    """
+    Pool of SQLite connections with a single writer and several readers.
+
+    Connections stay open for the life of the process, run in WAL mode so
+    readers never block the writer, and keep their prepared statements
+    cached between calls. All writes go through one connection guarded by a
+    lock, which matches SQLite's single-writer model and avoids busy retries.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, read_pool_size: int = DB_READ_POOL_SIZE):
+        self.path = path
+        self.read_pool_size = read_pool_size
+        self._readers = queue.LifoQueue(maxsize=read_pool_size)
+        self._all_readers: List[sqlite3.Connection] = []
+        self._writer = None
+        self._write_lock = threading.RLock()
+        self._pool_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        """Open a connection configured for concurrent use."""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE
+        )
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -8000")
+        if readonly:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def _get_writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            conn = self._connect()
+            # Only takes effect on a new database; older files need one full VACUUM
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            self._writer = conn
+        return self._writer
+
+    def initialize(self) -> None:
+        """Create the schema, once per process."""
+        # Checked before taking the writer lock, so reads never wait for a write
+        if self._initialized:
+            return
+        with self._write_lock:
+            if self._initialized:
+                return
+            init_schema(self._get_writer())
+            self._initialized = True
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow the writer connection for one transaction.
+
+        The transaction commits when the block exits and rolls back if it raises.
+        """
+        self.initialize()
+        with self._write_lock:
+            conn = self._get_writer()
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a read-only connection from the pool."""
+        self.initialize()
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def dedicated_reader(self) -> Iterator[sqlite3.Connection]:
+        """
+        Open a read-only connection outside the pool for a long-running read.
+
+        Streaming exports hold their cursor open for as long as the client
+        takes to download, so they must not tie up a pooled connection. In
+        WAL mode the open read transaction does not block the writer.
+        """
+        self.initialize()
+        conn = self._connect(readonly=True)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._pool_lock:
+            if len(self._all_readers) < self.read_pool_size:
+                conn = self._connect(readonly=True)
+                self._all_readers.append(conn)
+                return conn
+
+        # Pool is exhausted, wait for a connection to be returned
+        return self._readers.get(timeout=DB_BUSY_TIMEOUT_MS / 1000)
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        with self._write_lock, self._pool_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers = []
+            self._readers = queue.LifoQueue(maxsize=self.read_pool_size)
+            self._initialized = False
+
+
+db = Database()
+
+
+class DBExecutor(PooledExecutor):
+    """
+    Dedicated thread pool that async route handlers await for database work.
+
+    SQLite calls block, on disk reads and on lock waits, so running them on
+    the event loop would stall every other request. Handlers pass the
+    blocking function to run() instead and await the result; the pool is
+    separate from the render pool so a burst of renders cannot hold up
+    queries, and the reverse.
+    """
+
+    def __init__(self, max_workers: int = DB_EXECUTOR_WORKERS):
+        super().__init__(max_workers)
+
+    def _create_executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking function in the pool and return its result.
+
+        Args:
+            fn: Function that uses the database
+            args: Positional arguments for fn
+            kwargs: Keyword arguments for fn
+
+        Returns:
+            Whatever fn returns; exceptions are raised in the caller
+        """
+        return await self._submit(partial(fn, *args, **kwargs))
+
+
+db_executor = DBExecutor()
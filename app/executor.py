@@ -0,0 +1,141 @@
+"""
+Render executor that keeps CPU-bound QR rendering off the event loop.
+"""
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .qr import RenderCache, describe_qr, render_cache, render_qr_code, render_qr_formats
+from .metrics import ERRORS, QR_RENDER_SECONDS
+from .pools import PooledExecutor
+
+
+# Pool type used for rendering: "thread" or "process"
+QR_RENDER_EXECUTOR = os.getenv("QR_RENDER_EXECUTOR", "thread")
+
+# Number of renders that may run at the same time
+QR_RENDER_WORKERS = int(os.getenv("QR_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+class RenderExecutor(PooledExecutor):
+    """
+    Pluggable pool that route handlers await for QR rendering.
+
+    Cache lookups happen on the calling side so hits never leave the event
+    loop; only misses are submitted to the pool.
+    """
+
+    def __init__(self, kind: str = QR_RENDER_EXECUTOR, max_workers: int = QR_RENDER_WORKERS):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown render executor: {kind}")
+        super().__init__(max_workers)
+        self.kind = kind
+
+    def _create_executor(self) -> Executor:
+        if self.kind == "process":
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="qr-render")
+
+    async def render(
+        self,
+        data: str,
+        format: str = "png",
+        size: int = 10,
+        border: int = 4,
+        cache: bool = True
+    ) -> bytes:
+        """
+        Render a QR code in the pool, serving repeat requests from the render cache.
+
+        Args:
+            data: Data to encode in the QR code
+            format: Output format (png, svg, eps, pdf)
+            size: QR code size multiplier
+            border: Border size in modules
+            cache: Whether to use the render cache; one-off bulk renders skip
+                it so they do not evict frequently downloaded codes
+
+        Returns:
+            QR code as bytes
+        """
+        key = RenderCache.make_key(data, format, size, border)
+        if cache:
+            cached = render_cache.get(key)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        qr_bytes = await self._submit(render_qr_code, data, format, size, border)
+        # Includes time spent waiting for a worker, which is what callers feel
+        QR_RENDER_SECONDS.observe(time.perf_counter() - start, format)
+
+        if cache:
+            render_cache.put(key, qr_bytes)
+        return qr_bytes
+
+    async def render_many(
+        self,
+        data: str,
+        formats: List[str],
+        size: int = 10,
+        border: int = 4,
+        cache: bool = True
+    ) -> Dict[str, Optional[bytes]]:
+        """
+        Render several formats of the same payload from one encode.
+
+        Formats already in the render cache are answered here; the rest are
+        handed to the pool as a single job, so a cold payload is encoded once
+        instead of once per format.
+
+        Args:
+            data: Data to encode in the QR code
+            formats: Output formats to render
+            size: QR code size multiplier
+            border: Border size in modules
+            cache: Whether to use the render cache
+
+        Returns:
+            Mapping of format to bytes, or None where rendering failed
+        """
+        results = {}
+        keys = {fmt: RenderCache.make_key(data, fmt, size, border) for fmt in formats}
+        if cache:
+            for fmt in formats:
+                cached = render_cache.get(keys[fmt])
+                if cached is not None:
+                    results[fmt] = cached
+
+        missing = tuple(fmt for fmt in formats if fmt not in results)
+        if missing:
+            start = time.perf_counter()
+            try:
+                rendered = await self._submit(render_qr_formats, data, missing, size, border)
+            except Exception as e:
+                rendered = {fmt: e for fmt in missing}
+            elapsed = time.perf_counter() - start
+            for fmt in missing:
+                result = rendered[fmt]
+                if isinstance(result, Exception):
+                    print(f"Error generating {fmt} QR code: {result}")
+                    ERRORS.inc("qr_render")
+                    results[fmt] = None
+                    continue
+                QR_RENDER_SECONDS.observe(elapsed, fmt)
+                if cache:
+                    render_cache.put(keys[fmt], result)
+                results[fmt] = result
+
+        return {fmt: results[fmt] for fmt in formats}
+
+    async def describe(self, data: str) -> dict:
+        """Run describe_qr in the pool, since it encodes the payload."""
+        return await self._submit(describe_qr, data)
+
+    def stats(self) -> dict:
+        """Return a snapshot of the executor state."""
+        return {"kind": self.kind, **super().stats()}
+
+
+render_executor = RenderExecutor()
@@ -0,0 +1,200 @@
+"""
+Streaming export of raw scan events as NDJSON or CSV.
+"""
+import io
+import os
+import csv
+import json
+import zlib
+import sqlite3
+import argparse
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+from .db import DATABASE_PATH, Database, db
+from .retention import list_archives, open_archive
+from .scan_writer import SCAN_COLUMNS
+
+
+# Rows fetched from the cursor, and encoded, per chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+EXPORT_COLUMNS = ("id",) + SCAN_COLUMNS
+
+
+def parse_utc(value: str) -> datetime:
+    """
+    Parse an ISO date or date-time as a naive UTC datetime, the form scan times are stored in.
+
+    Values with a UTC offset are converted rather than having the offset
+    dropped; values without one are taken to be UTC already. Raises
+    ValueError if the value is not ISO 8601 or is out of range.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        try:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        except OverflowError as e:
+            raise ValueError(f"{value} is out of range") from e
+    return parsed
+
+
+def normalize_time(value: Optional[str]) -> Optional[str]:
+    """
+    Convert an ISO date or date-time to the scans table's timestamp format.
+
+    Values with a UTC offset are converted to UTC first. Raises ValueError
+    if the value is not ISO 8601.
+    """
+    if not value:
+        return None
+    return parse_utc(value).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def build_export_query(vcard_id: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None):
+    """
+    Build the SELECT for an export.
+
+    Args:
+        vcard_id: Only export scans of this vCard, or None for all
+        start: Only scans at or after this time (YYYY-MM-DD[ HH:MM:SS])
+        end: Only scans before this time
+
+    Returns:
+        (sql, params) ordered by scan_time so the scan-time indexes drive it
+    """
+    conditions, params = [], []
+    if vcard_id:
+        conditions.append("vcard_id = ?")
+        params.append(vcard_id)
+    if start:
+        conditions.append("scan_time >= ?")
+        params.append(start)
+    if end:
+        conditions.append("scan_time < ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM scans {where} ORDER BY scan_time, id"
+    return sql, params
+
+
+def _encode_ndjson(rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, row)), separators=(",", ":")) + "\n" for row in rows
+    )
+
+
+def _encode_csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def iter_scan_export(
+    format: str = "ndjson",
+    vcard_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    compress: bool = False,
+    database: Database = db,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """
+    Stream scans out of the database in constant memory.
+
+    Rows come from server-side cursors read batch_size at a time, so memory
+    does not grow with the number of rows: first the archive files that
+    overlap the range, oldest first, then the live table on a dedicated
+    read-only connection, which lets the scan writer keep committing
+    meanwhile. The live part sees the database as of its first read.
+
+    Args:
+        format: "ndjson" (one object per line) or "csv" (with a header row)
+        vcard_id: Only export scans of this vCard, or None for all
+        start: Only scans at or after this time
+        end: Only scans before this time
+        compress: Gzip the output
+        database: Database to read from
+        batch_size: Rows per chunk
+
+    Yields:
+        Consecutive chunks of the export
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {format}")
+    encode = _encode_ndjson if format == "ndjson" else _encode_csv
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def output(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    def stream(conn: sqlite3.Connection) -> Iterator[bytes]:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            chunk = output(encode(rows))
+            if chunk:
+                yield chunk
+        cursor.close()
+
+    sql, params = build_export_query(vcard_id, start, end)
+    if format == "csv":
+        yield output(_encode_csv([EXPORT_COLUMNS]))
+
+    for month, path in list_archives(database):
+        # Skip months entirely outside the range
+        if (end and f"{month}-01" >= end) or (start and f"{month}-31 23:59:59" < start):
+            continue
+        with open_archive(path) as conn:
+            yield from stream(conn)
+
+    with database.dedicated_reader() as conn:
+        yield from stream(conn)
+
+    if compressor:
+        yield compressor.flush()
+
+
+def export_filename(format: str, vcard_id: Optional[str] = None, compress: bool = False) -> str:
+    """Return the download file name for an export."""
+    name = f"scans-{vcard_id or 'all'}.{format}"
+    return f"{name}.gz" if compress else name
+
+
+def main(argv=None) -> None:
+    """Command line entry point: python -m app.export -o scans.ndjson"""
+    parser = argparse.ArgumentParser(description="Export scan events")
+    parser.add_argument("-o", "--output", required=True, help="File to write")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson")
+    parser.add_argument("--vcard-id", help="Only export scans of this vCard")
+    parser.add_argument("--from", dest="start", help="Only scans at or after this time")
+    parser.add_argument("--to", dest="end", help="Only scans before this time")
+    parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path of the tracking database")
+    args = parser.parse_args(argv)
+
+    database = Database(args.db)
+    try:
+        with open(args.output, "wb") as f:
+            chunks = iter_scan_export(
+                args.format, args.vcard_id, normalize_time(args.start), normalize_time(args.end),
+                args.gzip, database
+            )
+            for chunk in chunks:
+                f.write(chunk)
+    finally:
+        database.close()
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,38 @@ FastAPI QR → vCard generator application.
 """
 import uuid
 import os
-import sqlite3
 import json
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import FastAPI, Form, Request, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, Response
+from fastapi import FastAPI, Form, Query, Request, HTTPException, BackgroundTasks, File, UploadFile
+from fastapi.responses import (
+    HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+)
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from pyngrok import ngrok
 
-from .vcard import generate_vcard, generate_vcard_filename
-from .qr import create_qr_response, generate_qr_code
+from .qr import encode_qr, qr_response, render_cache, render_qr_code
+from .executor import render_executor
+from .db import db, db_executor
+from .scan_writer import scan_writer
+from .rollups import ROLLUP_TABLES, read_breakdown, read_series, read_totals, read_unique_visitors
+from .useragent import classify_user_agent
+from .cache import VCardRecord
+from .cards import build_card, resolve_card_async, save_card
+from .storage import create_store
+from .shortcodes import (
+    SHORT_CODE_LENGTH, allocate_short_code, is_short_code, peek_short_code, resolve_short_code, short_code_for
+)
+from .bulk import detect_input_kind, iter_records, stream_bulk_zip
+from .export import EXPORT_FORMATS, export_filename, iter_scan_export, normalize_time, parse_utc
+from .retention import RETENTION_INTERVAL, list_archives, open_archive, run_retention
+from .conditional import (
+    QR_CACHE_CONTROL, QR_URL_CACHE_CONTROL, SCAN_CACHE_CONTROL, VCARD_CACHE_CONTROL,
+    etag_matches, make_etag, not_modified
+)
+from .metrics import DB_QUERY_SECONDS, ERRORS, MetricsMiddleware, cache_family, registry
+from .profiling import PROFILING_ENABLED, ProfilingMiddleware, profile_store, token_matches
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -23,6 +43,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Time every request by route template for /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Profile requests that ask for it with X-Profile, or a sample of them (off by default)
+app.add_middleware(ProfilingMiddleware)
+
 # Setup templates and static files
 templates = Jinja2Templates(directory="app/templates")
 
@@ -32,58 +58,57 @@ templates.env.filters["b64encode"] = lambda x: base64.b64encode(x).decode('utf-8
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# In-memory storage for vCard data (no DB in v1)
-vcard_storage = {}
+# Generated vCards, in the backend chosen by VCARD_STORE_BACKEND; misses fall
+# back to the database. Use a shared backend when running several workers.
+vcard_storage = create_store()
 
 # Global variable to store the public URL
 public_url = None
 
+# Open an ngrok tunnel at startup; pyngrok is only imported when this is on
+NGROK_ENABLED = os.getenv("NGROK_ENABLED", "false").lower() == "true"
+NGROK_PORT = int(os.getenv("NGROK_PORT", "8000"))
+
+# Scheduled archive and compaction task, started with the app
+retention_task = None
+
+# Readiness of the pieces /readyz reports on, filled in during startup
+startup_state = {
+    "warmed": False,
+    "tunnel": "disabled"
+}
+
+# QR formats offered for download; the preview is inlined into success.html
+QR_FORMATS = ["png", "svg", "eps", "pdf"]
+QR_PREVIEW_FORMAT = "png"
+
+# How /generate renders QR codes: "eager" renders every format on the request
+# path, "lazy" renders only the preview and leaves the rest to /qr/{id}.{fmt},
+# "background" does the same but warms the other formats after the response
+QR_RENDER_MODE = os.getenv("QR_RENDER_MODE", "background")
+
+# What /generate encodes: "vcard" puts the whole vCard in the symbol, "url"
+# a short /scan link that downloads it
+QR_MODES = ("vcard", "url")
+
+# Page sizes for the scan history endpoints
+SCAN_PAGE_SIZE = 50
+SCAN_PAGE_MAX = 500
+
+# Longest range, in buckets, the series endpoints return, and the range used
+# when the caller gives no from/to
+SERIES_MAX_BUCKETS = 1000
+SERIES_DEFAULT_SPAN = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+SERIES_STEP = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
 # Initialize database
 def init_database():
     """Initialize SQLite database for tracking."""
-    conn = sqlite3.connect('qr_tracking.db')
-    cursor = conn.cursor()
-    
-    # Create scans table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS scans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            vcard_id TEXT NOT NULL,
-            scan_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            ip_address TEXT,
-            user_agent TEXT,
-            country TEXT,
-            city TEXT,
-            latitude REAL,
-            longitude REAL,
-            referer TEXT,
-            device_type TEXT
-        )
-    ''')
-    
-    # Create vcards table for reference
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS vcards (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            company TEXT,
-            title TEXT,
-            email TEXT,
-            phone TEXT,
-            website TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    db.initialize()
 
-def log_scan(vcard_id: str, request: Request, location_data: dict = None):
-    """Log a scan event to the database."""
+async def log_scan(vcard_id: str, request: Request, location_data: dict = None):
+    """Queue a scan event for the background writer."""
     try:
-        conn = sqlite3.connect('qr_tracking.db')
-        cursor = conn.cursor()
-        
         # Get client IP
         ip_address = request.client.host
         if request.headers.get("x-forwarded-for"):
@@ -92,21 +117,12 @@ def log_scan(vcard_id: str, request: Request, location_data: dict = None):
         # Get user agent
         user_agent = request.headers.get("user-agent", "")
         
-        # Determine device type from user agent
-        device_type = "unknown"
-        if "Mobile" in user_agent or "Android" in user_agent or "iPhone" in user_agent:
-            device_type = "mobile"
-        elif "Tablet" in user_agent or "iPad" in user_agent:
-            device_type = "tablet"
-        elif "Windows" in user_agent or "Macintosh" in user_agent or "Linux" in user_agent:
-            device_type = "desktop"
+        # Classify device, OS and browser from the user agent
+        client = classify_user_agent(user_agent)
         
-        # Insert scan record
-        cursor.execute('''
-            INSERT INTO scans (vcard_id, ip_address, user_agent, country, city, latitude, longitude, referer, device_type)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        row = (
             vcard_id,
+            datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
             ip_address,
             user_agent,
             location_data.get('country') if location_data else None,
@@ -114,106 +130,223 @@ def log_scan(vcard_id: str, request: Request, location_data: dict = None):
             location_data.get('latitude') if location_data else None,
             location_data.get('longitude') if location_data else None,
             request.headers.get("referer"),
-            device_type
-        ))
+            client.device_type,
+            client.os,
+            client.browser,
+            int(client.is_bot)
+        )
         
-        conn.commit()
-        conn.close()
+        # Queue the scan record for the background writer; a full queue is
+        # waited on from the event loop, never from the database pool
+        await scan_writer.submit_async(row)
     except Exception as e:
         print(f"Error logging scan: {e}")
+        ERRORS.inc("log_scan")
 
-def get_vcard_from_db(vcard_id: str):
-    """Get vCard data from database."""
-    try:
-        conn = sqlite3.connect('qr_tracking.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, name, company, title, email, phone, website
-            FROM vcards 
-            WHERE id = ?
-        ''', (vcard_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
-        
-        if row:
-            return {
-                "id": row[0],
-                "name": row[1],
-                "company": row[2],
-                "title": row[3],
-                "email": row[4],
-                "phone": row[5],
-                "website": row[6]
-            }
-        return None
-    except Exception as e:
-        print(f"Error getting vCard from database: {e}")
-        return None
+async def resolve_vcard(vcard_id: str) -> Optional[VCardRecord]:
+    """Find a card in the vCard store, else read its stored vCard from the database."""
+    return await resolve_card_async(vcard_id, vcard_storage, db)
+
+async def vcard_exists(vcard_id: str) -> bool:
+    """Check the vCard store, then the database, for a card."""
+    return await resolve_vcard(vcard_id) is not None
 
-def get_scan_stats(vcard_id: str = None):
-    """Get scan statistics."""
+def get_scan_stats(vcard_id: str = None, exact: bool = False):
+    """
+    Get scan statistics.
+    
+    Unique visitors are estimated from HyperLogLog sketches unless exact is
+    set, which counts distinct IPs over the whole scans table instead.
+    """
     try:
-        conn = sqlite3.connect('qr_tracking.db')
-        cursor = conn.cursor()
-        
-        if vcard_id:
-            # Get stats for specific vCard
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_scans,
-                    COUNT(DISTINCT ip_address) as unique_visitors,
-                    COUNT(CASE WHEN device_type = 'mobile' THEN 1 END) as mobile_scans,
-                    COUNT(CASE WHEN device_type = 'desktop' THEN 1 END) as desktop_scans,
-                    COUNT(CASE WHEN device_type = 'tablet' THEN 1 END) as tablet_scans,
-                    MIN(scan_time) as first_scan,
-                    MAX(scan_time) as last_scan
-                FROM scans 
-                WHERE vcard_id = ?
-            ''', (vcard_id,))
-        else:
-            # Get global stats
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_scans,
-                    COUNT(DISTINCT ip_address) as unique_visitors,
-                    COUNT(CASE WHEN device_type = 'mobile' THEN 1 END) as mobile_scans,
-                    COUNT(CASE WHEN device_type = 'desktop' THEN 1 END) as desktop_scans,
-                    COUNT(CASE WHEN device_type = 'tablet' THEN 1 END) as tablet_scans,
-                    MIN(scan_time) as first_scan,
-                    MAX(scan_time) as last_scan
-                FROM scans
-            ''')
-        
-        stats = cursor.fetchone()
+        # Exact counts must also read the scans that retention moved to archives
+        archives = list_archives(db) if exact else []
         
-        # Get recent scans
-        cursor.execute('''
-            SELECT scan_time, country, city, device_type, ip_address
-            FROM scans 
-            WHERE vcard_id = ? OR ? IS NULL
-            ORDER BY scan_time DESC 
-            LIMIT 10
-        ''', (vcard_id, vcard_id))
-        
-        recent_scans = cursor.fetchall()
-        
-        conn.close()
+        with DB_QUERY_SECONDS.time("scan_stats"), db.reader() as conn:
+            cursor = conn.cursor()
+            
+            # Totals come from the daily rollup, so cost grows with buckets, not scans
+            totals = read_totals(conn, vcard_id)
+            
+            if not exact:
+                unique_visitors = read_unique_visitors(conn, vcard_id)
+            elif archives:
+                # Distinct counts cannot be summed across files, so union the IPs instead
+                ip_sql = "SELECT DISTINCT ip_address FROM scans" + (" WHERE vcard_id = ?" if vcard_id else "")
+                ip_params = (vcard_id,) if vcard_id else ()
+                visitors = {ip for (ip,) in conn.execute(ip_sql, ip_params)}
+                for _, path in archives:
+                    with open_archive(path) as archive:
+                        visitors.update(ip for (ip,) in archive.execute(ip_sql, ip_params))
+                visitors.discard(None)
+                unique_visitors = len(visitors)
+            elif vcard_id:
+                cursor.execute('''
+                    SELECT COUNT(DISTINCT ip_address)
+                    FROM scans 
+                    WHERE vcard_id = ?
+                ''', (vcard_id,))
+                unique_visitors = cursor.fetchone()[0]
+            else:
+                cursor.execute('''
+                    SELECT COUNT(DISTINCT ip_address)
+                    FROM scans
+                ''')
+                unique_visitors = cursor.fetchone()[0]
+            
+            # Get recent scans; separate statements so each can use its index
+            if vcard_id:
+                cursor.execute('''
+                    SELECT scan_time, country, city, device_type, ip_address
+                    FROM scans 
+                    WHERE vcard_id = ?
+                    ORDER BY scan_time DESC 
+                    LIMIT 10
+                ''', (vcard_id,))
+            else:
+                cursor.execute('''
+                    SELECT scan_time, country, city, device_type, ip_address
+                    FROM scans 
+                    ORDER BY scan_time DESC 
+                    LIMIT 10
+                ''')
+            
+            recent_scans = cursor.fetchall()
+            
+            # OS and browser breakdowns come from the daily dimension rollup
+            os_breakdown = read_breakdown(conn, "os", vcard_id)
+            browser_breakdown = read_breakdown(conn, "browser", vcard_id)
         
         return {
-            'total_scans': stats[0] or 0,
-            'unique_visitors': stats[1] or 0,
-            'mobile_scans': stats[2] or 0,
-            'desktop_scans': stats[3] or 0,
-            'tablet_scans': stats[4] or 0,
-            'first_scan': stats[5],
-            'last_scan': stats[6],
+            'total_scans': totals['total_scans'],
+            'unique_visitors': unique_visitors or 0,
+            'mobile_scans': totals['mobile_scans'],
+            'desktop_scans': totals['desktop_scans'],
+            'tablet_scans': totals['tablet_scans'],
+            'first_scan': totals['first_scan'],
+            'last_scan': totals['last_scan'],
+            'os_breakdown': os_breakdown,
+            'browser_breakdown': browser_breakdown,
             'recent_scans': recent_scans
         }
     except Exception as e:
         print(f"Error getting scan stats: {e}")
+        ERRORS.inc("get_scan_stats")
         return None
 
+def encode_scan_cursor(scan_time: str, scan_id: int) -> str:
+    """Build the opaque cursor that resumes scan history after a row."""
+    return base64.urlsafe_b64encode(f"{scan_time}|{scan_id}".encode('utf-8')).decode('ascii')
+
+def decode_scan_cursor(cursor: str):
+    """Split a cursor from encode_scan_cursor; raises ValueError if it is malformed."""
+    scan_time, scan_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit("|", 1)
+    return scan_time, int(scan_id)
+
+def get_scan_history(vcard_id: str = None, limit: int = SCAN_PAGE_SIZE, cursor: str = None):
+    """
+    Get one page of scans, newest first, using keyset pagination.
+    
+    Pages are keyed on (scan_time, id) rather than OFFSET, so every page is
+    an index seek no matter how deep into the history it is. Once the live
+    table runs out, paging continues into the retention archives.
+    """
+    conditions, params = [], []
+    if vcard_id:
+        conditions.append("vcard_id = ?")
+        params.append(vcard_id)
+    if cursor:
+        conditions.append("(scan_time, id) < (?, ?)")
+        params.extend(decode_scan_cursor(cursor))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    sql = f'''
+        SELECT id, vcard_id, scan_time, country, city, device_type, os, browser, ip_address
+        FROM scans
+        {where}
+        ORDER BY scan_time DESC, id DESC
+        LIMIT ?
+    '''
+    
+    try:
+        with DB_QUERY_SECONDS.time("scan_history"), db.reader() as conn:
+            rows = conn.execute(sql, params + [limit + 1]).fetchall()
+        
+        # Archives only hold scans older than anything live, newest month first
+        if len(rows) <= limit:
+            for _, path in reversed(list_archives(db)):
+                with open_archive(path) as archive:
+                    rows += archive.execute(sql, params + [limit + 1 - len(rows)]).fetchall()
+                if len(rows) > limit:
+                    break
+    except Exception as e:
+        print(f"Error getting scan history: {e}")
+        ERRORS.inc("get_scan_history")
+        return None
+    
+    columns = ("id", "vcard_id", "scan_time", "country", "city", "device_type", "os", "browser", "ip_address")
+    scans = [dict(zip(columns, row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = scans[-1]
+        next_cursor = encode_scan_cursor(last["scan_time"], last["id"])
+    return {"scans": scans, "next_cursor": next_cursor}
+
+def parse_series_range(bucket: str, start: Optional[str], end: Optional[str]):
+    """
+    Turn from/to query values into the first and last bucket of a series.
+    
+    Accepts ISO dates or date-times, converting values with an offset to
+    UTC; missing ends default to a window that finishes now. Raises
+    ValueError for bad values or oversized ranges.
+    """
+    if bucket not in ROLLUP_TABLES:
+        raise ValueError(f"bucket must be one of {', '.join(ROLLUP_TABLES)}")
+    
+    end_time = parse_utc(end) if end else datetime.utcnow()
+    try:
+        start_time = parse_utc(start) if start else end_time - SERIES_DEFAULT_SPAN[bucket]
+    except OverflowError as e:
+        raise ValueError("date out of range") from e
+    if bucket == "hour":
+        start_time = start_time.replace(minute=0, second=0, microsecond=0)
+        end_time = end_time.replace(minute=0, second=0, microsecond=0)
+    else:
+        start_time = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_time = end_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    if start_time > end_time:
+        raise ValueError("from must not be after to")
+    if (end_time - start_time) / SERIES_STEP[bucket] >= SERIES_MAX_BUCKETS:
+        raise ValueError(f"range covers more than {SERIES_MAX_BUCKETS} buckets")
+    return start_time, end_time
+
+def get_scan_series(vcard_id: str = None, bucket: str = "day", start: datetime = None, end: datetime = None):
+    """
+    Get scan counts per hour or day from the rollups, with empty buckets filled in.
+    """
+    bucket_format = ROLLUP_TABLES[bucket][1]
+    try:
+        with DB_QUERY_SECONDS.time("scan_series"), db.reader() as conn:
+            rows = read_series(
+                conn, bucket, start.strftime(bucket_format), end.strftime(bucket_format), vcard_id
+            )
+    except Exception as e:
+        print(f"Error getting scan series: {e}")
+        ERRORS.inc("get_scan_series")
+        return None
+    
+    by_bucket = {row["bucket"]: row for row in rows}
+    series = []
+    current = start
+    while current <= end:
+        label = current.strftime(bucket_format)
+        series.append(by_bucket.get(label) or {
+            "bucket": label, "scans": 0, "mobile": 0, "desktop": 0, "tablet": 0
+        })
+        current += SERIES_STEP[bucket]
+    return series
+
 def get_base_url(request: Request) -> str:
     """Get the base URL for QR codes, preferring public URL."""
     global public_url
@@ -230,21 +363,73 @@ def get_base_url(request: Request) -> str:
     # Fallback to request URL
     return str(request.base_url).rstrip('/')
 
+def short_scan_url(request: Request, code: str) -> str:
+    """Build the link a url-mode QR code encodes."""
+    return f"{get_base_url(request)}/scan/{code}"
+
+async def compare_qr_modes(vcard_content: str, url_payload: str) -> dict:
+    """Report the QR version and payload size of both modes, and what url mode saves."""
+    # Describing a payload encodes it, so it runs in the render pool
+    vcard_info, url_info = await asyncio.gather(
+        render_executor.describe(vcard_content),
+        render_executor.describe(url_payload)
+    )
+    return {
+        "vcard": vcard_info,
+        "url": url_info,
+        "bytes_saved": vcard_info["bytes"] - url_info["bytes"],
+        "versions_saved": vcard_info["version"] - url_info["version"]
+    }
+
 def setup_public_tunnel():
     """Set up ngrok tunnel for public access."""
     global public_url
     try:
+        # Imported here so workers without a tunnel never load pyngrok
+        from pyngrok import ngrok
+        
         # Create a public tunnel
-        tunnel = ngrok.connect(8000)
+        tunnel = ngrok.connect(NGROK_PORT)
         public_url = tunnel.public_url
+        startup_state["tunnel"] = "ready"
         print(f"🌐 Public URL created: {public_url}")
         print(f"📱 QR codes will now work for anyone!")
         return public_url
     except Exception as e:
+        startup_state["tunnel"] = "failed"
         print(f"❌ Failed to create public tunnel: {e}")
         print("📱 QR codes will only work on local network")
         return None
 
+def warm_up():
+    """Compile the templates and render a QR code so the first request is not slow."""
+    try:
+        for template in ("form.html", "success.html", "dashboard.html"):
+            templates.get_template(template)
+        render_qr_code("warm-up", "png")
+        startup_state["warmed"] = True
+    except Exception as e:
+        print(f"Error warming up: {e}")
+        ERRORS.inc("warm_up")
+
+def readiness_checks():
+    """Return whether the database, warm-up and base URL are ready."""
+    try:
+        with db.reader() as conn:
+            conn.execute("SELECT 1").fetchone()
+        database_ready = True
+    except Exception as e:
+        print(f"Error checking database: {e}")
+        database_ready = False
+    
+    # A failed tunnel still leaves the request URL as a usable base URL
+    base_url_ready = bool(os.getenv("BASE_URL")) or startup_state["tunnel"] != "pending"
+    return {
+        "database": database_ready,
+        "warmed": startup_state["warmed"],
+        "base_url": base_url_ready
+    }
+
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
@@ -255,6 +440,7 @@ async def home(request: Request):
 @app.post("/generate", response_class=HTMLResponse)
 async def generate_vcard_and_qr(
     request: Request,
+    background_tasks: BackgroundTasks,
     name: str = Form(...),
     company: Optional[str] = Form(None),
     title: Optional[str] = Form(None),
@@ -266,63 +452,93 @@ async def generate_vcard_and_qr(
     """
     Generate vCard and QR code, return success page with download links.
     """
-    # Generate vCard content
-    vcard_content = generate_vcard(
-        name=name,
-        company=company,
-        title=title,
-        email=email,
-        phone=phone,
-        website=website
-    )
+    if qr_mode not in QR_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported QR mode: {qr_mode}")
     
-    # Generate unique ID for this vCard
-    vcard_id = str(uuid.uuid4())
-    vcard_storage[vcard_id] = {
-        "content": vcard_content,
-        "filename": generate_vcard_filename(name),
-        "name": name
+    # Serialize the vCard once; the store and the vcards row both keep the result
+    fields = {
+        "name": name,
+        "company": company,
+        "title": title,
+        "email": email,
+        "phone": phone,
+        "website": website
     }
+    record = build_card(fields)
+    vcard_content = record.content
     
+    # Generate unique ID for this vCard
+    vcard_id = str(uuid.uuid4())
     
-    # Store in database for analytics
-    try:
-        conn = sqlite3.connect('qr_tracking.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO vcards (id, name, company, title, email, phone, website)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (vcard_id, name, company, title, email, phone, website))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error storing vCard in database: {e}")
+    # Store in the vCard store, and in the database for analytics and for
+    # lookups that miss the store
+    await db_executor.run(save_card, vcard_id, fields, record, vcard_storage, db)
     
-    # Always use vCard data directly for immediate contact import
-    # This ensures all QR codes trigger "Add to Contacts" when scanned
+    # vcard mode encodes the contact itself, so scanning works offline; url
+    # mode encodes a short /scan link, for a much smaller symbol
     qr_data = vcard_content
-    
-    # Generate QR codes in all formats
-    qr_formats = ["png", "svg", "eps", "pdf"]
-    qr_files = {}
-    
-    for fmt in qr_formats:
+    # A placeholder code of the real length sizes the url-mode payload for the report
+    url_payload = short_scan_url(request, "0" * SHORT_CODE_LENGTH)
+    if qr_mode == "url":
         try:
-            qr_bytes = generate_qr_code(qr_data, fmt)
-            qr_files[fmt] = qr_bytes
+            qr_data = url_payload = short_scan_url(request, await db_executor.run(allocate_short_code, vcard_id))
         except Exception as e:
-            print(f"Error generating {fmt} QR code: {e}")
-            qr_files[fmt] = None
+            print(f"Error allocating short code: {e}")
+            ERRORS.inc("allocate_short_code")
+            qr_mode = "vcard"
+    
+    # Only the preview is needed to render the page unless running eagerly
+    eager = QR_RENDER_MODE == "eager"
+    render_formats = QR_FORMATS if eager else [QR_PREVIEW_FORMAT]
+    qr_files = await render_executor.render_many(qr_data, render_formats)
+    
+    if eager:
+        qr_formats = [fmt for fmt in QR_FORMATS if qr_files[fmt]]
+    else:
+        # Remaining formats are rendered on demand by /qr/{id}.{fmt}
+        qr_formats = QR_FORMATS
+        if QR_RENDER_MODE == "background":
+            deferred = [fmt for fmt in QR_FORMATS if fmt not in qr_files]
+            background_tasks.add_task(render_executor.render_many, qr_data, deferred)
     
     return templates.TemplateResponse(
         "success.html",
         {
             "request": request,
             "vcard_id": vcard_id,
-            "vcard_filename": generate_vcard_filename(name),
+            "vcard_filename": record.filename,
             "name": name,
-            "qr_mode": "vcard",  # Always use vcard mode now
-            "qr_files": qr_files
+            "qr_mode": qr_mode,
+            "qr_files": qr_files,
+            "qr_formats": qr_formats,
+            "qr_comparison": await compare_qr_modes(vcard_content, url_payload)
+        }
+    )
+
+
+@app.post("/bulk")
+async def bulk_generate(
+    file: UploadFile = File(...),
+    formats: str = Form(",".join(QR_FORMATS))
+):
+    """
+    Create vCards and QR codes for every contact in a CSV or JSONL upload.
+    
+    The ZIP is streamed back while the input is still being processed.
+    """
+    qr_formats = [fmt.strip() for fmt in formats.split(",") if fmt.strip()]
+    unknown = [fmt for fmt in qr_formats if fmt not in QR_FORMATS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unsupported QR formats: {', '.join(unknown)}")
+    
+    kind = detect_input_kind(file.filename, file.content_type)
+    records = iter_records(file.file, kind)
+    
+    return StreamingResponse(
+        stream_bulk_zip(records, qr_formats),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": "attachment; filename=\"vcards.zip\""
         }
     )
 
@@ -332,37 +548,29 @@ async def scan_qr(vcard_id: str, request: Request):
     """
     Download vCard file immediately when QR code is scanned.
     No landing page - direct download trigger.
+    
+    vcard_id may also be the short code of a url-mode QR code.
     """
-    # Try to get vCard data from memory first, then database
-    if vcard_id in vcard_storage:
-        vcard_data = vcard_storage[vcard_id]
-        vcard_content = vcard_data["content"]
-        filename = vcard_data["filename"]
-    else:
-        # Try to get from database and regenerate vCard
-        db_data = get_vcard_from_db(vcard_id)
-        if not db_data:
-            raise HTTPException(status_code=404, detail="vCard not found")
-        
-        # Regenerate vCard content
-        vcard_content = generate_vcard(
-            name=db_data["name"],
-            company=db_data["company"],
-            title=db_data["title"],
-            email=db_data["email"],
-            phone=db_data["phone"],
-            website=db_data["website"]
-        )
-        filename = generate_vcard_filename(db_data["name"])
+    if is_short_code(vcard_id):
+        vcard_id = await db_executor.run(resolve_short_code, vcard_id) or vcard_id
+    
+    record = await resolve_vcard(vcard_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="vCard not found")
     
-    # Log the scan event
-    log_scan(vcard_id, request)
+    # Log the scan event, even when the client already has the file
+    await log_scan(vcard_id, request)
+    
+    if etag_matches(request, record.etag):
+        return not_modified(record.etag, SCAN_CACHE_CONTROL)
     
     return Response(
-        content=vcard_content,
+        content=record.content,
         media_type="text/vcard",
         headers={
-            "Content-Disposition": f"attachment; filename=\"{filename}\""
+            "Content-Disposition": f"attachment; filename=\"{record.filename}\"",
+            "ETag": record.etag,
+            "Cache-Control": SCAN_CACHE_CONTROL
         }
     )
 
@@ -373,96 +581,172 @@ async def get_qr_code(vcard_id: str, format: str, request: Request):
     Download QR code in the specified format.
     """
     
-    # Try to get vCard data from memory first, then database
-    if vcard_id in vcard_storage:
-        vcard_data = vcard_storage[vcard_id]
-        qr_data = vcard_data["content"]
-    else:
-        # Try to get from database and regenerate vCard
-        db_data = get_vcard_from_db(vcard_id)
-        if not db_data:
-            raise HTTPException(status_code=404, detail="vCard not found")
-        
-        # Regenerate vCard content
-        vcard_content = generate_vcard(
-            name=db_data["name"],
-            company=db_data["company"],
-            title=db_data["title"],
-            email=db_data["email"],
-            phone=db_data["phone"],
-            website=db_data["website"]
-        )
-        qr_data = vcard_content
+    record = await resolve_vcard(vcard_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="vCard not found")
     
-    # Get name for filename
-    if vcard_id in vcard_storage:
-        name = vcard_storage[vcard_id]["name"]
-    else:
-        name = db_data["name"]
+    # url-mode cards encode their short link instead of the vCard
+    known, code = peek_short_code(vcard_id)
+    if not known:
+        code = await db_executor.run(short_code_for, vcard_id)
+    payload = short_scan_url(request, code) if code else record.content
+    # The short link embeds the current base URL, so only vCard symbols are immutable
+    cache_control = QR_URL_CACHE_CONTROL if code else QR_CACHE_CONTROL
+    
+    # Rendering is deterministic, so the tag is known without rendering
+    etag = make_etag(payload, format) if code else make_etag(record.etag, format)
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
     
-    return create_qr_response(
-        data=qr_data,
+    qr_bytes = await render_executor.render(payload, format)
+    response = qr_response(
+        qr_bytes,
         format=format,
-        filename=f"qr_{name.replace(' ', '_')}"
+        filename=f"qr_{record.name.replace(' ', '_')}"
     )
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control
+    return response
 
 
 @app.get("/vcard/{vcard_id}")
-async def get_vcard(vcard_id: str):
+async def get_vcard(vcard_id: str, request: Request):
     """
     Download vCard file directly.
     """
-    # Try to get vCard data from memory first, then database
-    if vcard_id in vcard_storage:
-        vcard_data = vcard_storage[vcard_id]
-        vcard_content = vcard_data["content"]
-        filename = vcard_data["filename"]
-    else:
-        # Try to get from database and regenerate vCard
-        db_data = get_vcard_from_db(vcard_id)
-        if not db_data:
-            raise HTTPException(status_code=404, detail="vCard not found")
-        
-        # Regenerate vCard content
-        vcard_content = generate_vcard(
-            name=db_data["name"],
-            company=db_data["company"],
-            title=db_data["title"],
-            email=db_data["email"],
-            phone=db_data["phone"],
-            website=db_data["website"]
-        )
-        filename = generate_vcard_filename(db_data["name"])
+    record = await resolve_vcard(vcard_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="vCard not found")
+    
+    if etag_matches(request, record.etag):
+        return not_modified(record.etag, VCARD_CACHE_CONTROL)
     
     return Response(
-        content=vcard_content,
+        content=record.content,
         media_type="text/vcard",
         headers={
-            "Content-Disposition": f"attachment; filename=\"{filename}\""
+            "Content-Disposition": f"attachment; filename=\"{record.filename}\"",
+            "ETag": record.etag,
+            "Cache-Control": VCARD_CACHE_CONTROL
         }
     )
 
 
+async def scan_history_response(vcard_id: Optional[str], limit: int, cursor: Optional[str]):
+    """Build the scan history response shared by the global and per-card routes."""
+    try:
+        page = await db_executor.run(get_scan_history, vcard_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if page is None:
+        raise HTTPException(status_code=500, detail="Failed to retrieve scans")
+    return {"vcard_id": vcard_id, **page}
+
+async def scan_series_response(vcard_id: Optional[str], bucket: str, start: Optional[str], end: Optional[str]):
+    """Build the series response shared by the global and per-card routes."""
+    try:
+        start_time, end_time = parse_series_range(bucket, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    series = await db_executor.run(get_scan_series, vcard_id, bucket, start_time, end_time)
+    if series is None:
+        raise HTTPException(status_code=500, detail="Failed to retrieve series")
+    return {"vcard_id": vcard_id, "bucket": bucket, "series": series}
+
+# Fixed /analytics/... routes are declared before /analytics/{vcard_id} so they win the match
+@app.get("/analytics/scans")
+async def get_global_scan_history(
+    cursor: Optional[str] = None,
+    limit: int = Query(SCAN_PAGE_SIZE, ge=1, le=SCAN_PAGE_MAX)
+):
+    """Page through scans of every vCard, newest first; pass next_cursor back as cursor."""
+    return await scan_history_response(None, limit, cursor)
+
+@app.get("/analytics/series")
+async def get_global_scan_series(
+    bucket: str = "day",
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to")
+):
+    """Scan counts of every vCard per hour or day between from and to."""
+    return await scan_series_response(None, bucket, start, end)
+
+@app.get("/analytics/export")
+async def export_scans(
+    format: str = "ndjson",
+    vcard_id: Optional[str] = None,
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    gzip: bool = False
+):
+    """
+    Stream raw scan events as NDJSON or CSV, optionally gzipped.
+    
+    from is inclusive and to is exclusive; both take ISO dates or date-times.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    try:
+        start, end = normalize_time(start), normalize_time(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="from and to must be ISO dates or date-times")
+    if vcard_id and not await vcard_exists(vcard_id):
+        raise HTTPException(status_code=404, detail="vCard not found")
+    
+    # A sync iterator, so Starlette pulls each chunk in its thread pool off the event loop
+    return StreamingResponse(
+        iter_scan_export(format, vcard_id, start, end, compress=gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={
+            "Content-Disposition": f"attachment; filename=\"{export_filename(format, vcard_id, gzip)}\"",
+            "Cache-Control": "no-store"
+        }
+    )
+
+@app.get("/analytics/{vcard_id}/scans")
+async def get_vcard_scan_history(
+    vcard_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(SCAN_PAGE_SIZE, ge=1, le=SCAN_PAGE_MAX)
+):
+    """Page through scans of one vCard, newest first; pass next_cursor back as cursor."""
+    if not await vcard_exists(vcard_id):
+        raise HTTPException(status_code=404, detail="vCard not found")
+    return await scan_history_response(vcard_id, limit, cursor)
+
+@app.get("/analytics/{vcard_id}/series")
+async def get_vcard_scan_series(
+    vcard_id: str,
+    bucket: str = "day",
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to")
+):
+    """Scan counts of one vCard per hour or day between from and to."""
+    if not await vcard_exists(vcard_id):
+        raise HTTPException(status_code=404, detail="vCard not found")
+    return await scan_series_response(vcard_id, bucket, start, end)
+
 @app.get("/analytics/{vcard_id}")
-async def get_vcard_analytics(vcard_id: str):
-    """Get analytics for a specific vCard."""
-    if vcard_id not in vcard_storage:
+async def get_vcard_analytics(vcard_id: str, exact: bool = False):
+    """Get analytics for a specific vCard; exact=true counts unique visitors exactly."""
+    record = await resolve_vcard(vcard_id)
+    if not record:
         raise HTTPException(status_code=404, detail="vCard not found")
     
-    stats = get_scan_stats(vcard_id)
+    stats = await db_executor.run(get_scan_stats, vcard_id, exact=exact)
     if not stats:
         raise HTTPException(status_code=500, detail="Failed to retrieve analytics")
     
     return {
         "vcard_id": vcard_id,
-        "vcard_name": vcard_storage[vcard_id]["name"],
+        "vcard_name": record.name,
         "analytics": stats
     }
 
 @app.get("/analytics")
-async def get_global_analytics():
-    """Get global analytics for all vCards."""
-    stats = get_scan_stats()
+async def get_global_analytics(exact: bool = False):
+    """Get global analytics for all vCards; exact=true counts unique visitors exactly."""
+    stats = await db_executor.run(get_scan_stats, exact=exact)
     if not stats:
         raise HTTPException(status_code=500, detail="Failed to retrieve analytics")
     
@@ -473,7 +757,7 @@ async def get_global_analytics():
 @app.get("/dashboard")
 async def analytics_dashboard(request: Request):
     """Global analytics dashboard page."""
-    stats = get_scan_stats()
+    stats = await db_executor.run(get_scan_stats)
     return templates.TemplateResponse(
         "dashboard.html",
         {
@@ -487,12 +771,10 @@ async def analytics_dashboard(request: Request):
 async def personal_analytics_dashboard(vcard_id: str, request: Request):
     """Personal analytics dashboard for a specific vCard."""
     # Check if vCard exists
-    vcard_exists = (vcard_id in vcard_storage or get_vcard_from_db(vcard_id) is not None)
-    
-    if not vcard_exists:
+    if not await vcard_exists(vcard_id):
         raise HTTPException(status_code=404, detail="vCard not found")
     
-    stats = get_scan_stats(vcard_id)
+    stats = await db_executor.run(get_scan_stats, vcard_id)
     return templates.TemplateResponse(
         "dashboard.html",
         {
@@ -506,10 +788,8 @@ async def personal_analytics_dashboard(vcard_id: str, request: Request):
 @app.post("/track/{vcard_id}")
 async def track_scan_with_location(vcard_id: str, request: Request):
     """Track a scan with location data from client."""
-    # Check if vCard exists in memory or database
-    vcard_exists = (vcard_id in vcard_storage or get_vcard_from_db(vcard_id) is not None)
-    
-    if not vcard_exists:
+    # Check if vCard exists in the store or database
+    if not await vcard_exists(vcard_id):
         raise HTTPException(status_code=404, detail="vCard not found")
     
     # Get location data from request body
@@ -520,15 +800,118 @@ async def track_scan_with_location(vcard_id: str, request: Request):
         location_data = {}
     
     # Log the scan with location data
-    log_scan(vcard_id, request, location_data)
+    await log_scan(vcard_id, request, location_data)
     
     return {"status": "tracked"}
 
+def collect_runtime_metrics():
+    """Report cache, scan queue, render pool and database pool counters at scrape time."""
+    encode_info = encode_qr.cache_info()
+    user_agent_info = classify_user_agent.cache_info()
+    yield from cache_family("cache", {
+        "qr_render": render_cache.stats(),
+        "vcard": vcard_storage.stats(),
+        "qr_encode": {"hits": encode_info.hits, "misses": encode_info.misses},
+        "user_agent": {"hits": user_agent_info.hits, "misses": user_agent_info.misses}
+    })
+    
+    writer_stats = scan_writer.stats()
+    yield ("scan_queue_depth", "gauge", "Scan events waiting for the writer",
+           [({}, writer_stats["queue_depth"])])
+    yield ("scan_events_total", "counter", "Scan events by outcome", [
+        ({"outcome": outcome}, writer_stats[outcome])
+        for outcome in ("written", "dropped", "spilled", "failed")
+    ])
+    
+    executor_stats = render_executor.stats()
+    yield ("qr_render_in_flight", "gauge", "QR renders running in the pool",
+           [({}, executor_stats["in_flight"])])
+    yield ("qr_render_queue_depth", "gauge", "QR renders waiting for a worker",
+           [({}, executor_stats["queue_depth"])])
+    
+    db_stats = db_executor.stats()
+    yield ("db_calls_in_flight", "gauge", "Database calls running in the database pool",
+           [({}, db_stats["in_flight"])])
+    yield ("db_calls_queue_depth", "gauge", "Database calls waiting for a pool thread",
+           [({}, db_stats["queue_depth"])])
+
+registry.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Expose metrics in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def require_profile_access(request: Request):
+    """Reject admin profile requests unless profiling is on and the token matches."""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not token_matches(request.headers.get("x-profile")):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+@app.get("/admin/profiles")
+async def list_profiles(request: Request):
+    """List saved request profiles, newest first."""
+    require_profile_access(request)
+    return {"profiles": profile_store.list()}
+
+@app.get("/admin/profiles/{name}")
+async def download_profile(name: str, request: Request):
+    """Download a saved profile for pstats or snakeviz."""
+    require_profile_access(request)
+    path = profile_store.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: database, warm-up and base URL are all ready."""
+    checks = await db_executor.run(readiness_checks)
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "starting",
+            "checks": checks,
+            "tunnel": startup_state["tunnel"]
+        }
+    )
+
+async def retention_loop():
+    """Archive old scans and compact the database every RETENTION_INTERVAL seconds."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL)
+        await loop.run_in_executor(None, run_retention)
+
 @app.on_event("startup")
 async def startup_event():
-    """Set up public tunnel and database on startup."""
+    """Set up the database and warm caches; the tunnel opens in the background."""
+    global retention_task
     init_database()
-    setup_public_tunnel()
+    warm_up()
+    if RETENTION_INTERVAL > 0:
+        retention_task = asyncio.create_task(retention_loop())
+    if NGROK_ENABLED and not os.getenv("BASE_URL"):
+        # Connecting can take until a timeout when offline; serve traffic meanwhile
+        startup_state["tunnel"] = "pending"
+        asyncio.get_running_loop().run_in_executor(None, setup_public_tunnel)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending scans, stop the render and database pools and close database connections."""
+    if retention_task is not None:
+        retention_task.cancel()
+    scan_writer.stop()
+    render_executor.shutdown()
+    db_executor.shutdown()
+    db.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,253 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+
+# Set to "false" to skip request timing entirely
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Monotonically increasing count, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Add amount to the series for label_values."""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        """Return the current value of a series."""
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value:g}"
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, per label combination."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: one count per bucket plus +Inf, then the sum
+        self._series: Dict[LabelValues, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Record one observation."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        """Observe the duration of the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        """Return the number of observations in a series."""
+        series = self._series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(bounds, series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), label_values + (bound,))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {series[-1]:.6f}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+# A collector returns (name, type, help, [(label dict, value), ...]) families at scrape time
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+class Registry:
+    """
+    Set of metrics rendered together by the /metrics endpoint.
+
+    Counters and histograms are updated as events happen. Values other
+    modules already track, such as cache and queue counters, are read by
+    collectors only when the endpoint is scraped, so they cost nothing on
+    the request path.
+    """
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        """Create and register a counter."""
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Create and register a histogram."""
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Register a function that reports metric families at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status")
+)
+QR_RENDER_SECONDS = registry.histogram(
+    "qr_render_seconds", "Time to render a QR code that was not in the render cache", ("format",)
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_seconds", "Time spent in SQLite per named query", ("query",)
+)
+ERRORS = registry.counter(
+    "app_errors_total", "Errors that were handled by logging and carrying on", ("source",)
+)
+
+
+def cache_family(name: str, stats: Dict[str, Dict[str, float]]) -> List[Family]:
+    """
+    Build hit, miss and hit-ratio families from per-cache hit/miss counters.
+
+    Args:
+        name: Metric name prefix
+        stats: Mapping of cache name to a dict with hits and misses
+
+    Returns:
+        Families for a collector to return
+    """
+    hits, misses, ratios = [], [], []
+    for cache, values in stats.items():
+        labels = {"cache": cache}
+        total = values["hits"] + values["misses"]
+        hits.append((labels, values["hits"]))
+        misses.append((labels, values["misses"]))
+        ratios.append((labels, values["hits"] / total if total else 0))
+    return [
+        (f"{name}_hits_total", "counter", "Cache lookups that found an entry", hits),
+        (f"{name}_misses_total", "counter", "Cache lookups that found nothing", misses),
+        (f"{name}_hit_ratio", "gauge", "Share of cache lookups that were hits", ratios),
+    ]
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that records request latency per route template.
+
+    Timing uses the matched route's path template (e.g. /scan/{vcard_id}),
+    so the number of series stays fixed no matter how many cards exist. It
+    is a plain ASGI wrapper rather than BaseHTTPMiddleware, which would add
+    a task and a response copy to every request.
+    """
+
+    def __init__(self, app, histogram: Histogram = REQUEST_LATENCY):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            self.histogram.observe(time.perf_counter() - start, scope["method"], template, status[0])
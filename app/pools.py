@@ -0,0 +1,74 @@
+"""
+Pool accounting shared by the executors that route handlers await.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import Any, Callable, Optional
+
+
+class PooledExecutor:
+    """
+    Lazily created concurrent.futures pool with pending and completed counts.
+
+    Because a pool runs at most max_workers jobs at once, the number of
+    pending jobs splits into the in-flight count and the queue depth.
+    Subclasses only say which pool to create.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.pending = 0
+        self.completed = 0
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _create_executor(self) -> Executor:
+        """Build the underlying pool; called once, on first use."""
+        raise NotImplementedError
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _finished(self, _future) -> None:
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    async def _submit(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(*args) in the pool and await its result."""
+        executor = self._get_executor()
+        with self._lock:
+            self.pending += 1
+        future = executor.submit(fn, *args)
+        future.add_done_callback(self._finished)
+        return await asyncio.wrap_future(future)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of jobs currently running in the pool."""
+        return min(self.pending, self.max_workers)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a free worker."""
+        return max(0, self.pending - self.max_workers)
+
+    def stats(self) -> dict:
+        """Return a snapshot of the executor state."""
+        return {
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed
+        }
+
+    def shutdown(self) -> None:
+        """Stop the pool, waiting for running jobs to finish."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
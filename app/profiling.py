@@ -0,0 +1,169 @@
+"""
+Opt-in per-request profiling with a bounded on-disk ring of saved profiles.
+"""
+import os
+import re
+import time
+import hmac
+import cProfile
+import itertools
+import threading
+from typing import List, Optional
+
+
+# Master switch; nothing is profiled unless this is "true" and PROFILE_TOKEN is set
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+
+# Also profile every Nth request without a header (0 disables sampling)
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# Secret a client must send in the X-Profile header to request a profile and
+# to use the admin routes; profiling stays off while it is empty
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+# Where profiles are written and how many are kept
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+PROFILE_HEADER = b"x-profile"
+
+_NAME_PATTERN = re.compile(r"^[\w.-]+\.prof$")
+
+
+def token_matches(value: Optional[str], token: Optional[str] = None) -> bool:
+    """Check an X-Profile header value against token (PROFILE_TOKEN by default); nothing matches an empty token."""
+    token = PROFILE_TOKEN if token is None else token
+    if value is None or not token:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), token.encode("utf-8"))
+
+
+class ProfileStore:
+    """Directory of .prof files that keeps only the newest max_profiles."""
+
+    def __init__(self, directory: str = PROFILE_DIR, max_profiles: int = PROFILE_KEEP):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def new_name(self, method: str, route: str) -> str:
+        """
+        Pick a unique file name for a profile of one request.
+
+        Args:
+            method: HTTP method of the profiled request
+            route: Route template or path of the profiled request
+
+        Returns:
+            File name ending in .prof
+        """
+        slug = re.sub(r"[^\w]+", "-", route).strip("-") or "root"
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1_000_000_000:09d}-{method}-{slug}.prof"
+
+    def save(self, profile: cProfile.Profile, name: str) -> None:
+        """Write a profile and drop the oldest ones beyond max_profiles."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, name))
+            for old in self.list()[self.max_profiles:]:
+                try:
+                    os.remove(os.path.join(self.directory, old["name"]))
+                except OSError as e:
+                    print(f"Error removing old profile: {e}")
+
+    def list(self) -> List[dict]:
+        """Return saved profiles, newest first."""
+        try:
+            names = [name for name in os.listdir(self.directory) if _NAME_PATTERN.match(name)]
+        except FileNotFoundError:
+            return []
+
+        profiles = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({"name": name, "size": stat.st_size, "created": stat.st_mtime})
+        profiles.sort(key=lambda profile: (profile["created"], profile["name"]), reverse=True)
+        return profiles
+
+    def path(self, name: str) -> Optional[str]:
+        """Return the path of a saved profile, or None for unknown or unsafe names."""
+        if not _NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+profile_store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that runs selected requests under cProfile.
+
+    A request is profiled when profiling is enabled and it either carries an
+    X-Profile header with the right token or is picked by 1-in-N sampling.
+    Without a token the middleware stays disabled, since profiles leak
+    timings and code paths and could not be fetched safely anyway.
+    cProfile follows the event loop thread, so work from other requests
+    interleaved with the profiled one shows up too; only one request is
+    profiled at a time to keep that noise and the overhead bounded. The
+    saved profile's name is returned in the X-Profile-Id response header.
+    """
+
+    def __init__(self, app, store: ProfileStore = profile_store, enabled: Optional[bool] = None,
+                 sample_rate: Optional[int] = None, token: Optional[str] = None):
+        self.app = app
+        self.store = store
+        self.enabled = PROFILING_ENABLED if enabled is None else enabled
+        self.token = PROFILE_TOKEN if token is None else token
+        if self.enabled and not self.token:
+            print("Profiling is enabled but PROFILE_TOKEN is empty; leaving it off")
+            self.enabled = False
+        self.sample_rate = PROFILE_SAMPLE_RATE if sample_rate is None else sample_rate
+        self._counter = itertools.count(1)
+        self._active = threading.Lock()
+
+    def _wants_profile(self, scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return token_matches(value.decode("latin-1"), self.token)
+        return self.sample_rate > 0 and next(self._counter) % self.sample_rate == 0
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._active.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile = cProfile.Profile()
+        name = None
+
+        async def send_with_profile_id(message):
+            nonlocal name
+            if message["type"] == "http.response.start":
+                # Routing has happened by now, so the route template is known
+                route = getattr(scope.get("route"), "path", scope["path"])
+                name = self.store.new_name(scope["method"], route)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", name.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            profile.enable()
+            try:
+                await self.app(scope, receive, send_with_profile_id)
+            finally:
+                profile.disable()
+        finally:
+            self._active.release()
+            if name is not None:
+                try:
+                    self.store.save(profile, name)
+                except Exception as e:
+                    print(f"Error saving profile: {e}")
@@ -2,22 +2,158 @@
 QR code generation utilities using segno.
 """
 import io
-from typing import Union
+import os
+import zlib
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
 import segno
 from fastapi.responses import Response
 
+from .metrics import QR_RENDER_SECONDS
 
-def generate_qr_code(
-    data: str,
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; PNGs fall back to segno's writer
+    np = None
+
+
+# Byte budget for rendered QR artifacts kept in memory (0 disables the cache)
+QR_RENDER_CACHE_BYTES = int(os.getenv("QR_RENDER_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+
+class RenderCache:
+    """
+    LRU cache of rendered QR codes bounded by the total size of the stored bytes.
+    
+    Keys are built from a hash of the payload plus the render parameters, so
+    a repeat download of the same badge costs a dict lookup instead of a render.
+    """
+    
+    def __init__(self, max_bytes: int = QR_RENDER_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(data: str, format: str, size: int, border: int) -> Tuple[str, str, int, int]:
+        """Build the cache key for a payload and its render parameters."""
+        digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        return (digest, format, size, border)
+    
+    def get(self, key) -> Optional[bytes]:
+        """Return the cached bytes for key and mark them as recently used."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key, value: bytes) -> None:
+        """Store value under key, evicting least recently used entries as needed."""
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+    
+    def clear(self) -> None:
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def stats(self) -> dict:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+render_cache = RenderCache()
+
+# PNG writer: "numpy" uses the array-based fast path when NumPy is installed
+QR_PNG_ENGINE = os.getenv("QR_PNG_ENGINE", "numpy")
+
+# Number of encoded QR symbols kept for reuse across formats and scales
+QR_ENCODE_CACHE_SIZE = int(os.getenv("QR_ENCODE_CACHE_SIZE", "256"))
+
+
+@lru_cache(maxsize=QR_ENCODE_CACHE_SIZE)
+def encode_qr(data: str) -> segno.QRCode:
+    """
+    Encode data into a QR symbol, memoized per distinct payload.
+    
+    Encoding (data analysis, Reed-Solomon and mask selection) is independent
+    of the output format, so every format and scale reuses the same symbol.
+    The returned object is shared and must not be modified.
+    
+    Args:
+        data: Data to encode in the QR code
+        
+    Returns:
+        Encoded segno QR code
+    """
+    return segno.make(data)
+
+
+def describe_qr(data: str) -> dict:
+    """
+    Describe the symbol a payload encodes to.
+    
+    Args:
+        data: Data to encode in the QR code
+        
+    Returns:
+        QR version, modules per side and payload size in bytes
+    """
+    qr = encode_qr(data)
+    return {
+        "version": qr.version,
+        "modules": qr.symbol_size(border=0)[0],
+        "bytes": len(data.encode('utf-8'))
+    }
+
+
+def serialize_qr(
+    qr: segno.QRCode,
     format: str = "png",
     size: int = 10,
     border: int = 4
 ) -> bytes:
     """
-    Generate QR code in the specified format.
+    Serialize an encoded QR symbol to the specified format.
     
     Args:
-        data: Data to encode in the QR code
+        qr: Encoded QR code from encode_qr
         format: Output format (png, svg, eps, pdf)
         size: QR code size multiplier
         border: Border size in modules
@@ -25,22 +161,155 @@ def generate_qr_code(
     Returns:
         QR code as bytes
     """
-    import io
-    
-    qr = segno.make(data)
+    if format == "png" and np is not None and QR_PNG_ENGINE == "numpy":
+        return write_png_numpy(qr, size, border)
     
     if format == "eps":
         # EPS needs text mode
         buffer = io.StringIO()
         qr.save(buffer, kind=format, scale=size, border=border)
-        buffer.seek(0)
         return buffer.getvalue().encode('utf-8')
-    else:
-        # Other formats use binary mode
-        buffer = io.BytesIO()
-        qr.save(buffer, kind=format, scale=size, border=border)
-        buffer.seek(0)
-        return buffer.getvalue()
+    
+    # Other formats use binary mode
+    buffer = io.BytesIO()
+    qr.save(buffer, kind=format, scale=size, border=border)
+    return buffer.getvalue()
+
+
+def _png_chunk(name: bytes, data: bytes) -> bytes:
+    head = name + data
+    return struct.pack(">I", len(data)) + head + struct.pack(">I", zlib.crc32(head) & 0xFFFFFFFF)
+
+
+def write_png_numpy(qr: segno.QRCode, scale: int = 10, border: int = 4) -> bytes:
+    """
+    Serialize an encoded QR symbol as a black and white PNG using NumPy.
+    
+    Produces exactly the bytes segno's PNG writer does for the default
+    colors: a 1-bit greyscale image whose repeated scanlines use the "Up"
+    filter, compressed at level 9. Only the pixel work moves to array
+    operations, so the output is stable across engines.
+    
+    Args:
+        qr: Encoded QR code from encode_qr
+        scale: Pixels per module
+        border: Border size in modules
+        
+    Returns:
+        PNG image as bytes
+    """
+    rows = len(qr.matrix)
+    modules = np.frombuffer(b"".join(qr.matrix), dtype=np.uint8).reshape(rows, -1)
+    
+    # Greyscale index 0 is black (dark modules), 1 is white
+    light = np.pad(1 - modules, ((0, 0), (border, border)), constant_values=1)
+    packed = np.packbits(np.repeat(light, scale, axis=1), axis=1)
+    width = light.shape[1] * scale
+    height = (rows + 2 * border) * scale
+    row_bytes = packed.shape[1] + 1
+    
+    # First scanline of each module row carries the pixels (filter 0); the
+    # other scale - 1 are "Up" filtered, i.e. a filter byte of 2 and zeros
+    body = np.zeros((rows, scale, row_bytes), dtype=np.uint8)
+    body[:, 0, 1:] = packed
+    body[:, 1:, 0] = 2
+    
+    border_line = b"\0" + np.packbits(np.ones(width, dtype=np.uint8)).tobytes()
+    border_rows = border_line * (border * scale)
+    idat = border_rows + body.tobytes() + border_rows
+    
+    return b"".join([
+        b"\211PNG\r\n\032\n",
+        _png_chunk(b"IHDR", struct.pack(">2I5B", width, height, 1, 0, 0, 0, 0)),
+        _png_chunk(b"IDAT", zlib.compress(idat, 9)),
+        _png_chunk(b"IEND", b"")
+    ])
+
+
+def generate_qr_code(
+    data: str,
+    format: str = "png",
+    size: int = 10,
+    border: int = 4
+) -> bytes:
+    """
+    Generate QR code in the specified format.
+    
+    Args:
+        data: Data to encode in the QR code
+        format: Output format (png, svg, eps, pdf)
+        size: QR code size multiplier
+        border: Border size in modules
+        
+    Returns:
+        QR code as bytes
+    """
+    key = RenderCache.make_key(data, format, size, border)
+    cached = render_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    with QR_RENDER_SECONDS.time(format):
+        qr_bytes = render_qr_code(data, format, size, border)
+    render_cache.put(key, qr_bytes)
+    return qr_bytes
+
+
+def render_qr_code(
+    data: str,
+    format: str = "png",
+    size: int = 10,
+    border: int = 4
+) -> bytes:
+    """
+    Render a QR code without consulting the render cache.
+    
+    This is the unit of work handed to the render executor, so it must stay a
+    module-level function that can be pickled for a process pool.
+    
+    Args:
+        data: Data to encode in the QR code
+        format: Output format (png, svg, eps, pdf)
+        size: QR code size multiplier
+        border: Border size in modules
+        
+    Returns:
+        QR code as bytes
+    """
+    return serialize_qr(encode_qr(data), format, size, border)
+
+
+def render_qr_formats(
+    data: str,
+    formats: Tuple[str, ...],
+    size: int = 10,
+    border: int = 4
+) -> Dict[str, Union[bytes, Exception]]:
+    """
+    Render several formats of one payload from a single encode.
+    
+    Like render_qr_code this runs in the render executor. Encoding is the
+    expensive half of a render, so it happens once here rather than once per
+    format in separate jobs (which, in a process pool, would not even share
+    the encode cache).
+    
+    Args:
+        data: Data to encode in the QR code
+        formats: Output formats to serialize
+        size: QR code size multiplier
+        border: Border size in modules
+    
+    Returns:
+        Mapping of format to bytes, or to the exception serializing it raised
+    """
+    qr = encode_qr(data)
+    results = {}
+    for fmt in formats:
+        try:
+            results[fmt] = serialize_qr(qr, fmt, size, border)
+        except Exception as e:
+            results[fmt] = e
+    return results
 
 
 def get_qr_content_type(format: str) -> str:
@@ -83,11 +352,24 @@ def create_qr_response(
         FastAPI Response with QR code
     """
     qr_data = generate_qr_code(data, format, size, border)
-    content_type = get_qr_content_type(format)
+    return qr_response(qr_data, format, filename)
+
+
+def qr_response(qr_data: bytes, format: str, filename: str) -> Response:
+    """
+    Wrap already rendered QR code bytes in a download Response.
     
+    Args:
+        qr_data: Rendered QR code
+        format: Output format (png, svg, eps, pdf)
+        filename: Base filename for download
+        
+    Returns:
+        FastAPI Response with QR code
+    """
     return Response(
         content=qr_data,
-        media_type=content_type,
+        media_type=get_qr_content_type(format),
         headers={
             "Content-Disposition": f"attachment; filename=\"{filename}.{format}\""
         }
@@ -0,0 +1,331 @@
+"""
+Scan-log retention: per-month archive databases and incremental compaction.
+"""
+import os
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+from .db import DATABASE_PATH, Database, db
+from .metrics import DB_QUERY_SECONDS, ERRORS
+from .rollups import ALL_VCARDS, backfill_rollups
+from .scan_writer import SCAN_COLUMNS
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; runs are then not serialized across processes
+    fcntl = None
+
+
+# Scans older than this many days move to the archives (0, the default, keeps everything live)
+ANALYTICS_RETENTION_DAYS = int(os.getenv("ANALYTICS_RETENTION_DAYS", "0"))
+
+# Directory holding one scans-YYYY-MM.db file per archived month
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archives")
+
+# Scans moved per transaction, so each write lock stays short
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+
+# Seconds between scheduled archive and compaction runs (0, the default, disables the schedule)
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "0"))
+
+# Free pages released per incremental vacuum step, and per run at most
+VACUUM_STEP_PAGES = int(os.getenv("VACUUM_STEP_PAGES", "256"))
+VACUUM_MAX_PAGES = int(os.getenv("VACUUM_MAX_PAGES", "65536"))
+
+ARCHIVE_COLUMNS = ("id",) + SCAN_COLUMNS
+
+ARCHIVE_SCHEMA = [
+    f'''
+    CREATE TABLE IF NOT EXISTS scans (
+        id INTEGER PRIMARY KEY,
+        {", ".join(column for column in SCAN_COLUMNS)}
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_scans_vcard_time ON scans (vcard_id, scan_time)",
+    "CREATE INDEX IF NOT EXISTS idx_scans_scan_time ON scans (scan_time)",
+]
+
+
+def archive_path(month: str, archive_dir: str = ARCHIVE_DIR) -> str:
+    """Return the archive file for a month (YYYY-MM)."""
+    return os.path.join(archive_dir, f"scans-{month}.db")
+
+
+def list_archives(database: Database = db) -> List[Tuple[str, str]]:
+    """
+    List archived months, oldest first.
+
+    Args:
+        database: Database whose scan_archives table records the archives
+
+    Returns:
+        (month, path) pairs for archive files that exist
+    """
+    with database.reader() as conn:
+        rows = conn.execute("SELECT month, path FROM scan_archives ORDER BY month").fetchall()
+    return [(month, path) for month, path in rows if os.path.exists(path)]
+
+
+@contextmanager
+def open_archive(path: str) -> Iterator[sqlite3.Connection]:
+    """Open an archive file read-only."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def _next_month(month: str) -> str:
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{year + number // 12}-{number % 12 + 1:02d}"
+
+
+def _ensure_folded(conn: sqlite3.Connection, cutoff: str) -> None:
+    """Rebuild the rollups if any day about to be archived is missing from them."""
+    missing = conn.execute('''
+        SELECT 1
+        FROM (
+            SELECT date(scan_time) AS day, COUNT(*) AS scans
+            FROM scans
+            WHERE scan_time < ?
+            GROUP BY 1
+        ) live
+        LEFT JOIN (
+            SELECT bucket, SUM(scans) AS scans
+            FROM scan_rollup_daily
+            WHERE vcard_id = ? AND bucket < ?
+            GROUP BY bucket
+        ) rolled ON rolled.bucket = live.day
+        WHERE rolled.scans IS NULL OR rolled.scans < live.scans
+        LIMIT 1
+    ''', (cutoff, ALL_VCARDS, cutoff)).fetchone()
+    if missing:
+        backfill_rollups(conn)
+
+
+def archive_scans(
+    database: Database = db,
+    retention_days: int = ANALYTICS_RETENTION_DAYS,
+    archive_dir: str = ARCHIVE_DIR,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    now: Optional[datetime] = None
+) -> dict:
+    """
+    Move scans older than retention_days into per-month archive databases.
+
+    Every scan is already counted in the rollups by the scan writer; any
+    day that is not is folded in first, so totals, series and unique
+    visitors keep covering archived history. Rows are copied and committed
+    to the archive before they are deleted from the live table, in batches
+    of batch_size, so an interrupted run is simply repeated. Only whole
+    days are archived.
+
+    Args:
+        database: Live tracking database
+        retention_days: Days of scans to keep live
+        archive_dir: Directory for the archive files
+        batch_size: Scans moved per transaction
+        now: Current time, for tests
+
+    Returns:
+        Number of scans archived per month
+    """
+    if retention_days <= 0:
+        return {}
+
+    cutoff_day = ((now or datetime.utcnow()) - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    with database.writer() as conn:
+        _ensure_folded(conn, cutoff_day)
+
+    moved = {}
+    os.makedirs(archive_dir, exist_ok=True)
+    while True:
+        with database.reader() as conn:
+            row = conn.execute(
+                "SELECT MIN(scan_time) FROM scans WHERE scan_time < ?", (cutoff_day,)
+            ).fetchone()
+        if not row or row[0] is None:
+            break
+        month = row[0][:7]
+        end = min(f"{_next_month(month)}-01", cutoff_day)
+        path = archive_path(month, archive_dir)
+        moved[month] = moved.get(month, 0) + _archive_range(database, path, month, end, cutoff_day, batch_size)
+
+    return moved
+
+
+def _archive_range(
+    database: Database,
+    path: str,
+    month: str,
+    end: str,
+    cutoff_day: str,
+    batch_size: int
+) -> int:
+    """Move the scans of one month, up to end, into its archive file."""
+    archive = sqlite3.connect(path)
+    moved = 0
+    try:
+        for statement in ARCHIVE_SCHEMA:
+            archive.execute(statement)
+        archive.commit()
+
+        while True:
+            with DB_QUERY_SECONDS.time("archive_select"), database.reader() as conn:
+                rows = conn.execute(f'''
+                    SELECT {", ".join(ARCHIVE_COLUMNS)}
+                    FROM scans
+                    WHERE scan_time >= ? AND scan_time < ?
+                    ORDER BY scan_time
+                    LIMIT ?
+                ''', (f"{month}-01", end, batch_size)).fetchall()
+            if not rows:
+                break
+
+            # Copy first; a crash before the delete leaves duplicates that the next run skips
+            archive.executemany(
+                f'''INSERT OR IGNORE INTO scans ({", ".join(ARCHIVE_COLUMNS)})
+                    VALUES ({", ".join("?" for _ in ARCHIVE_COLUMNS)})''',
+                rows
+            )
+            archive.commit()
+
+            ids = [row[0] for row in rows]
+            with DB_QUERY_SECONDS.time("archive_delete"), database.writer() as conn:
+                # Count what this run deleted, not what it selected; rows another
+                # run removed in the meantime are already counted there
+                deleted = conn.execute(
+                    f"DELETE FROM scans WHERE id IN ({', '.join('?' for _ in ids)})", ids
+                ).rowcount
+                conn.execute('''
+                    INSERT INTO scan_archives (month, path, scans, archived_before)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (month) DO UPDATE SET
+                        scans = scans + excluded.scans,
+                        archived_before = MAX(archived_before, excluded.archived_before),
+                        archived_at = CURRENT_TIMESTAMP
+                ''', (month, path, deleted, cutoff_day))
+            moved += deleted
+    finally:
+        archive.close()
+    return moved
+
+
+def compact(
+    database: Database = db,
+    step_pages: int = VACUUM_STEP_PAGES,
+    max_pages: int = VACUUM_MAX_PAGES
+) -> int:
+    """
+    Return free pages to the filesystem a few at a time.
+
+    Each step holds the write lock only for step_pages pages. Databases
+    created before incremental auto-vacuum was enabled need one full
+    VACUUM (python -m app.retention vacuum-full) before this does anything.
+
+    Args:
+        database: Live tracking database
+        step_pages: Pages released per transaction
+        max_pages: Pages released per call at most
+
+    Returns:
+        Number of pages released
+    """
+    with database.reader() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("Incremental vacuum is off for this database; run a full VACUUM once to enable it")
+            return 0
+
+    released = 0
+    while released < max_pages:
+        with DB_QUERY_SECONDS.time("incremental_vacuum"), database.writer() as conn:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free == 0:
+                break
+            pages = min(step_pages, free, max_pages - released)
+            # The pragma releases pages as its rows are stepped, so consume them all
+            conn.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+        released += pages
+    return released
+
+
+def vacuum_full(database: Database = db) -> None:
+    """Rebuild the database file once so incremental auto-vacuum takes effect."""
+    with database.writer() as conn:
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+@contextmanager
+def retention_lock(database: Database = db) -> Iterator[bool]:
+    """
+    Hold the retention lock of a database for the duration of the block.
+
+    Every worker process runs its own schedule, so the lock (a file next to
+    the database) makes sure only one of them archives at a time. It is
+    released automatically if the holder dies.
+
+    Yields:
+        True if the lock was taken, False if another process holds it
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(f"{database.path}.retention.lock", "a") as handle:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def run_retention(database: Database = db) -> None:
+    """Archive old scans and compact the database; used by the scheduled task."""
+    try:
+        with retention_lock(database) as locked:
+            if not locked:
+                print("Retention is already running in another process")
+                return
+            moved = archive_scans(database)
+            if moved:
+                print(f"Archived scans: {moved}")
+            compact(database)
+    except Exception as e:
+        print(f"Error running retention: {e}")
+        ERRORS.inc("retention")
+
+
+def main(argv=None) -> None:
+    """Command line entry point: python -m app.retention archive|compact|vacuum-full"""
+    parser = argparse.ArgumentParser(description="Archive old scans and compact the tracking database")
+    parser.add_argument("command", choices=["archive", "compact", "vacuum-full"])
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path of the tracking database")
+    parser.add_argument("--days", type=int, default=ANALYTICS_RETENTION_DAYS, help="Days of scans to keep live")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="Directory for the archive files")
+    args = parser.parse_args(argv)
+
+    database = Database(args.db)
+    try:
+        if args.command == "archive":
+            moved = archive_scans(database, args.days, args.archive_dir)
+            print(f"Archived {sum(moved.values())} scans from {len(moved)} month(s)")
+        elif args.command == "compact":
+            print(f"Released {compact(database)} pages")
+        else:
+            vacuum_full(database)
+            print("Rebuilt the database with incremental auto-vacuum")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Incrementally maintained scan rollups used by the analytics queries.
+"""
+import sqlite3
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .hll import HyperLogLog
+
+
+# Rollup rows under this id aggregate the scans of every vCard
+ALL_VCARDS = "*"
+
+# Rollup table for each granularity and how a scan_time maps to its bucket
+ROLLUP_TABLES = {
+    "hour": ("scan_rollup_hourly", "%Y-%m-%d %H:00:00"),
+    "day": ("scan_rollup_daily", "%Y-%m-%d")
+}
+
+DEVICE_TYPES = ("mobile", "desktop", "tablet")
+
+# Scan columns broken down per day in scan_rollup_dimensions
+DIMENSIONS = ("os", "browser")
+
+
+def bucket_for(scan_time: str, granularity: str) -> str:
+    """
+    Return the rollup bucket a scan time falls into.
+    
+    Args:
+        scan_time: Scan timestamp as stored in the scans table
+        granularity: "hour" or "day"
+        
+    Returns:
+        Bucket label in the same format SQLite's strftime produces
+    """
+    if granularity == "hour":
+        return f"{scan_time[:10]} {scan_time[11:13]}:00:00"
+    return scan_time[:10]
+
+
+def update_rollups(
+    conn: sqlite3.Connection,
+    scans: Iterable[Tuple[str, str, Optional[str], Optional[str], Optional[str], Optional[str]]]
+) -> None:
+    """
+    Fold newly written scans into the rollup tables and visitor sketches.
+    
+    Must run in the same transaction as the scan inserts so the rollups never
+    drift from the scans table.
+    
+    Args:
+        conn: Connection with an open write transaction
+        scans: (vcard_id, scan_time, device_type, ip_address, os, browser)
+            for each new scan
+    """
+    scans = list(scans)
+    for granularity, (table, _) in ROLLUP_TABLES.items():
+        counts: Dict[Tuple[str, str, str], list] = {}
+        for vcard_id, scan_time, device_type, *_ in scans:
+            bucket = bucket_for(scan_time, granularity)
+            for owner in (vcard_id, ALL_VCARDS):
+                key = (owner, bucket, device_type or "unknown")
+                entry = counts.get(key)
+                if entry is None:
+                    counts[key] = [1, scan_time, scan_time]
+                else:
+                    entry[0] += 1
+                    entry[1] = min(entry[1], scan_time)
+                    entry[2] = max(entry[2], scan_time)
+        
+        conn.executemany(f'''
+            INSERT INTO {table} (vcard_id, bucket, device_type, scans, first_scan, last_scan)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (vcard_id, bucket, device_type) DO UPDATE SET
+                scans = scans + excluded.scans,
+                first_scan = MIN(first_scan, excluded.first_scan),
+                last_scan = MAX(last_scan, excluded.last_scan)
+        ''', [key + tuple(entry) for key, entry in counts.items()])
+    
+    dimension_counts: Dict[Tuple[str, str, str, str], int] = {}
+    for vcard_id, scan_time, _, _, *values in scans:
+        bucket = bucket_for(scan_time, "day")
+        for dimension, value in zip(DIMENSIONS, values):
+            for owner in (vcard_id, ALL_VCARDS):
+                key = (owner, dimension, value or "unknown", bucket)
+                dimension_counts[key] = dimension_counts.get(key, 0) + 1
+    
+    conn.executemany('''
+        INSERT INTO scan_rollup_dimensions (vcard_id, dimension, value, bucket, scans)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (vcard_id, dimension, value, bucket) DO UPDATE SET
+            scans = scans + excluded.scans
+    ''', [key + (count,) for key, count in dimension_counts.items()])
+    
+    visitors: Dict[Tuple[str, str], list] = {}
+    for vcard_id, scan_time, _, ip_address, *_ in scans:
+        if ip_address:
+            bucket = bucket_for(scan_time, "day")
+            visitors.setdefault((vcard_id, bucket), []).append(ip_address)
+            visitors.setdefault((ALL_VCARDS, bucket), []).append(ip_address)
+    
+    for (vcard_id, bucket), ips in visitors.items():
+        row = conn.execute(
+            "SELECT sketch FROM scan_visitor_sketches WHERE vcard_id = ? AND bucket = ?",
+            (vcard_id, bucket)
+        ).fetchone()
+        sketch = HyperLogLog.from_bytes(row[0]) if row else HyperLogLog()
+        sketch.update(ips)
+        conn.execute(
+            "INSERT OR REPLACE INTO scan_visitor_sketches (vcard_id, bucket, sketch) VALUES (?, ?, ?)",
+            (vcard_id, bucket, sketch.to_bytes())
+        )
+
+
+def archive_watermark(conn: sqlite3.Connection) -> str:
+    """
+    Return the day before which scans have been moved to archives.
+    
+    Rollup buckets before this day cannot be rebuilt from the scans table,
+    so backfills leave them alone. Empty when nothing has been archived.
+    """
+    try:
+        row = conn.execute("SELECT MAX(archived_before) FROM scan_archives").fetchone()
+    except sqlite3.OperationalError:
+        # Migrations that backfill run before the archive table exists
+        return ""
+    return row[0] or ""
+
+
+def backfill_rollups(conn: sqlite3.Connection, dimensions: bool = True) -> None:
+    """
+    Rebuild the rollup tables from the scans table.
+    
+    Buckets older than the archive watermark are kept as they are, since
+    their scans now live in the archive files.
+    
+    Args:
+        conn: Connection with an open write transaction
+        dimensions: Whether to rebuild the OS and browser breakdowns; off
+            only for migrations that run before those columns exist
+    """
+    since = archive_watermark(conn)
+    for table, bucket_format in ROLLUP_TABLES.values():
+        conn.execute(f"DELETE FROM {table} WHERE bucket >= ?", (since,))
+        for owner in ("vcard_id", f"'{ALL_VCARDS}'"):
+            conn.execute(f'''
+                INSERT INTO {table} (vcard_id, bucket, device_type, scans, first_scan, last_scan)
+                SELECT
+                    {owner},
+                    strftime('{bucket_format}', scan_time),
+                    COALESCE(device_type, 'unknown'),
+                    COUNT(*),
+                    MIN(scan_time),
+                    MAX(scan_time)
+                FROM scans
+                WHERE scan_time IS NOT NULL AND scan_time >= ?
+                GROUP BY 1, 2, 3
+            ''', (since,))
+    
+    if dimensions:
+        conn.execute("DELETE FROM scan_rollup_dimensions WHERE bucket >= ?", (since,))
+        for owner in ("vcard_id", f"'{ALL_VCARDS}'"):
+            for dimension in DIMENSIONS:
+                conn.execute(f'''
+                    INSERT INTO scan_rollup_dimensions (vcard_id, dimension, value, bucket, scans)
+                    SELECT {owner}, '{dimension}', COALESCE({dimension}, 'unknown'), date(scan_time), COUNT(*)
+                    FROM scans
+                    WHERE scan_time IS NOT NULL AND scan_time >= ?
+                    GROUP BY 1, 3, 4
+                ''', (since,))
+    
+    conn.execute("DELETE FROM scan_visitor_sketches WHERE bucket >= ?", (since,))
+    # Scans arrive sorted by group, so only one sketch is held at a time
+    for owner in ("vcard_id", f"'{ALL_VCARDS}'"):
+        current_key, sketch = None, None
+        rows = conn.execute(f'''
+            SELECT {owner}, date(scan_time), ip_address
+            FROM scans
+            WHERE scan_time IS NOT NULL AND scan_time >= ? AND ip_address IS NOT NULL
+            ORDER BY 1, 2
+        ''', (since,))
+        for vcard_id, bucket, ip_address in rows:
+            if (vcard_id, bucket) != current_key:
+                if sketch is not None:
+                    _save_sketch(conn, current_key, sketch)
+                current_key, sketch = (vcard_id, bucket), HyperLogLog()
+            sketch.add(ip_address)
+        if sketch is not None:
+            _save_sketch(conn, current_key, sketch)
+
+
+def _save_sketch(conn: sqlite3.Connection, key: Tuple[str, str], sketch: HyperLogLog) -> None:
+    conn.execute(
+        "INSERT INTO scan_visitor_sketches (vcard_id, bucket, sketch) VALUES (?, ?, ?)",
+        key + (sketch.to_bytes(),)
+    )
+
+
+def read_totals(conn: sqlite3.Connection, vcard_id: Optional[str] = None) -> dict:
+    """
+    Read scan totals for one vCard, or all of them, from the daily rollup.
+    
+    Args:
+        conn: Database connection
+        vcard_id: vCard to summarize, or None for the global view
+        
+    Returns:
+        Total, per-device counts and first/last scan times
+    """
+    row = conn.execute('''
+        SELECT
+            SUM(scans),
+            SUM(CASE WHEN device_type = 'mobile' THEN scans END),
+            SUM(CASE WHEN device_type = 'desktop' THEN scans END),
+            SUM(CASE WHEN device_type = 'tablet' THEN scans END),
+            MIN(first_scan),
+            MAX(last_scan)
+        FROM scan_rollup_daily
+        WHERE vcard_id = ?
+    ''', (vcard_id or ALL_VCARDS,)).fetchone()
+    
+    return {
+        'total_scans': row[0] or 0,
+        'mobile_scans': row[1] or 0,
+        'desktop_scans': row[2] or 0,
+        'tablet_scans': row[3] or 0,
+        'first_scan': row[4],
+        'last_scan': row[5]
+    }
+
+
+def read_series(
+    conn: sqlite3.Connection,
+    granularity: str,
+    start: str,
+    end: str,
+    vcard_id: Optional[str] = None
+) -> List[dict]:
+    """
+    Read scan counts per time bucket from the hourly or daily rollup.
+    
+    Buckets without scans are left out; callers that draw charts fill them in.
+    
+    Args:
+        conn: Database connection
+        granularity: "hour" or "day"
+        start: First bucket to include, in the rollup's bucket format
+        end: Last bucket to include, in the rollup's bucket format
+        vcard_id: vCard to summarize, or None for the global view
+        
+    Returns:
+        One dict per bucket with total and per-device scan counts, oldest first
+    """
+    table, _ = ROLLUP_TABLES[granularity]
+    rows = conn.execute(f'''
+        SELECT
+            bucket,
+            SUM(scans),
+            SUM(CASE WHEN device_type = 'mobile' THEN scans ELSE 0 END),
+            SUM(CASE WHEN device_type = 'desktop' THEN scans ELSE 0 END),
+            SUM(CASE WHEN device_type = 'tablet' THEN scans ELSE 0 END)
+        FROM {table}
+        WHERE vcard_id = ? AND bucket >= ? AND bucket <= ?
+        GROUP BY bucket
+        ORDER BY bucket
+    ''', (vcard_id or ALL_VCARDS, start, end))
+    
+    return [
+        {"bucket": bucket, "scans": scans, "mobile": mobile, "desktop": desktop, "tablet": tablet}
+        for bucket, scans, mobile, desktop, tablet in rows
+    ]
+
+
+def read_breakdown(
+    conn: sqlite3.Connection,
+    dimension: str,
+    vcard_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Count scans per OS or browser from the daily dimension rollup.
+    
+    Args:
+        conn: Database connection
+        dimension: One of DIMENSIONS
+        vcard_id: vCard to summarize, or None for the global view
+        start: First day to include (YYYY-MM-DD), or None for no lower bound
+        end: Last day to include (YYYY-MM-DD), or None for no upper bound
+        
+    Returns:
+        Mapping of value to scan count, largest first
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension: {dimension}")
+    
+    rows = conn.execute('''
+        SELECT value, SUM(scans)
+        FROM scan_rollup_dimensions
+        WHERE vcard_id = ? AND dimension = ? AND bucket >= ? AND bucket <= ?
+        GROUP BY value
+    ''', (vcard_id or ALL_VCARDS, dimension, start or "", end or "9999-12-31")).fetchall()
+    return dict(sorted(rows, key=lambda row: (-row[1], row[0])))
+
+
+def read_unique_visitors(
+    conn: sqlite3.Connection,
+    vcard_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None
+) -> int:
+    """
+    Estimate unique visitors by merging the daily visitor sketches.
+    
+    Args:
+        conn: Database connection
+        vcard_id: vCard to summarize, or None for the global view
+        start: First day to include (YYYY-MM-DD), or None for no lower bound
+        end: Last day to include (YYYY-MM-DD), or None for no upper bound
+        
+    Returns:
+        Approximate number of distinct visitor IPs
+    """
+    rows = conn.execute('''
+        SELECT sketch
+        FROM scan_visitor_sketches
+        WHERE vcard_id = ? AND bucket >= ? AND bucket <= ?
+    ''', (vcard_id or ALL_VCARDS, start or "", end or "9999-12-31"))
+    
+    merged = HyperLogLog()
+    for (sketch,) in rows:
+        merged.merge(HyperLogLog.from_bytes(sketch))
+    return merged.count()
+
+
+def main(argv=None) -> None:
+    """Command line entry point: python -m app.rollups backfill"""
+    from .db import Database, DATABASE_PATH
+    
+    parser = argparse.ArgumentParser(description="Maintain scan rollup tables")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path of the tracking database")
+    args = parser.parse_args(argv)
+    
+    database = Database(args.db)
+    try:
+        with database.writer() as conn:
+            backfill_rollups(conn)
+            rows = conn.execute("SELECT COUNT(*) FROM scan_rollup_daily").fetchone()[0]
+        print(f"Rebuilt rollups: {rows} daily buckets")
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
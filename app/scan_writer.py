@@ -0,0 +1,382 @@
+"""
+Background writer that batches scan events into group commits.
+"""
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+from typing import List, Optional, Sequence
+
+from .db import Database, db
+from .rollups import update_rollups
+from .metrics import DB_QUERY_SECONDS, ERRORS
+
+
+# Maximum number of scan events waiting to be written
+SCAN_QUEUE_SIZE = int(os.getenv("SCAN_QUEUE_SIZE", "10000"))
+
+# Largest number of events committed in one transaction
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "500"))
+
+# Longest time in seconds an event waits before its batch is committed
+SCAN_FLUSH_INTERVAL = float(os.getenv("SCAN_FLUSH_INTERVAL", "0.5"))
+
+# What to do when the queue is full: "block", "drop" or "spill" to disk
+SCAN_QUEUE_POLICY = os.getenv("SCAN_QUEUE_POLICY", "block")
+
+# How long "block" waits for room before giving up on an event
+SCAN_QUEUE_BLOCK_TIMEOUT = float(os.getenv("SCAN_QUEUE_BLOCK_TIMEOUT", "5"))
+
+# How often, in seconds, async callers blocked on a full queue retry
+SCAN_QUEUE_RETRY_INTERVAL = 0.01
+
+# File that "spill" appends overflowing events to until they can be replayed
+SCAN_SPILL_PATH = os.getenv("SCAN_SPILL_PATH", "scan_spill.jsonl")
+
+SCAN_COLUMNS = (
+    "vcard_id", "scan_time", "ip_address", "user_agent", "country", "city",
+    "latitude", "longitude", "referer", "device_type", "os", "browser", "is_bot"
+)
+
+_VCARD_ID = SCAN_COLUMNS.index("vcard_id")
+_SCAN_TIME = SCAN_COLUMNS.index("scan_time")
+_DEVICE_TYPE = SCAN_COLUMNS.index("device_type")
+_IP_ADDRESS = SCAN_COLUMNS.index("ip_address")
+_OS = SCAN_COLUMNS.index("os")
+_BROWSER = SCAN_COLUMNS.index("browser")
+
+INSERT_SCAN_SQL = f'''
+    INSERT INTO scans ({", ".join(SCAN_COLUMNS)})
+    VALUES ({", ".join("?" for _ in SCAN_COLUMNS)})
+'''
+
+# Queue markers understood by the writer thread
+_FLUSH = object()
+_STOP = object()
+
+
+class ScanWriter:
+    """
+    Bounded in-memory queue of scan rows drained by a background thread.
+
+    The thread commits rows in batches with executemany, flushing when a
+    batch reaches batch_size or flush_interval has passed since its first
+    row, and whenever flush() or stop() is called. Rows are tuples ordered
+    like SCAN_COLUMNS.
+    """
+
+    def __init__(
+        self,
+        database: Database = db,
+        queue_size: int = SCAN_QUEUE_SIZE,
+        batch_size: int = SCAN_BATCH_SIZE,
+        flush_interval: float = SCAN_FLUSH_INTERVAL,
+        policy: str = SCAN_QUEUE_POLICY,
+        spill_path: str = SCAN_SPILL_PATH,
+        autostart: bool = True
+    ):
+        if policy not in ("block", "drop", "spill"):
+            raise ValueError(f"Unknown scan queue policy: {policy}")
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.spill_path = spill_path
+        self.autostart = autostart
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of events waiting to be written."""
+        return self._queue.qsize()
+
+    def submit(self, row: Sequence) -> bool:
+        """
+        Queue a scan row for writing.
+
+        Args:
+            row: Column values ordered like SCAN_COLUMNS
+
+        Returns:
+            True if the row was queued or spilled, False if it was dropped
+        """
+        if self.autostart:
+            self.start()
+
+        try:
+            self._queue.put_nowait(tuple(row))
+            return True
+        except queue.Full:
+            pass
+
+        if self.policy == "block":
+            try:
+                self._queue.put(tuple(row), timeout=SCAN_QUEUE_BLOCK_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        elif self.policy == "spill":
+            self._spill([row])
+            return True
+
+        self.dropped += 1
+        return False
+
+    def submit_nowait(self, row: Sequence) -> bool:
+        """
+        Queue a scan row only if that needs no waiting.
+
+        submit_async uses this first, since the block and spill policies
+        wait or write to disk.
+
+        Returns:
+            True if the row was queued, False if the queue is full
+        """
+        if self.autostart:
+            self.start()
+        try:
+            self._queue.put_nowait(tuple(row))
+            return True
+        except queue.Full:
+            return False
+
+    async def submit_async(self, row: Sequence) -> bool:
+        """
+        Like submit, for callers on the event loop.
+
+        Waiting for room under the block policy happens on the loop, with
+        short sleeps between retries, rather than by parking a thread: a scan
+        burst must not tie up the pools that card lookups and analytics run
+        in. Only spilling, which writes to disk, goes to a thread.
+
+        Args:
+            row: Column values ordered like SCAN_COLUMNS
+
+        Returns:
+            True if the row was queued or spilled, False if it was dropped
+        """
+        if self.submit_nowait(row):
+            return True
+
+        if self.policy == "block":
+            deadline = time.monotonic() + SCAN_QUEUE_BLOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(SCAN_QUEUE_RETRY_INTERVAL)
+                if self.submit_nowait(row):
+                    return True
+        elif self.policy == "spill":
+            await asyncio.get_running_loop().run_in_executor(None, self._spill, [row])
+            return True
+
+        self.dropped += 1
+        return False
+
+    def start(self) -> None:
+        """Start the writer thread if it is not running."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scan-writer", daemon=True)
+                self._thread.start()
+
+    def flush(self) -> None:
+        """Write every queued event, and any spilled ones, before returning."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_FLUSH)
+            self._queue.join()
+        else:
+            self._drain()
+        self._replay_spill()
+
+    def stop(self) -> None:
+        """Flush outstanding events and stop the writer thread."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join()
+        self._drain()
+        self._replay_spill()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch: List[tuple] = []
+            taken = 1
+            stop = item is _STOP
+
+            if item is not _FLUSH and not stop:
+                batch.append(item)
+                # Collect more rows until the batch is full or its time is up
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    taken += 1
+                    if item is _FLUSH:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+                if not self._queue.qsize():
+                    self._replay_spill()
+            except Exception as e:
+                # Nothing may end the thread, or no scan would be written again
+                print(f"Error in scan writer: {e}")
+                ERRORS.inc("scan_writer")
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _drain(self) -> None:
+        """Write queued rows from the calling thread."""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _FLUSH and item is not _STOP:
+                batch.append(item)
+            self._queue.task_done()
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch)
+                batch = []
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        """Commit a batch of rows, and their rollup updates, in a single transaction."""
+        try:
+            with DB_QUERY_SECONDS.time("insert_scan_batch"), self.database.writer() as conn:
+                conn.executemany(INSERT_SCAN_SQL, batch)
+                update_rollups(conn, [
+                    (row[_VCARD_ID], row[_SCAN_TIME], row[_DEVICE_TYPE], row[_IP_ADDRESS],
+                     row[_OS], row[_BROWSER])
+                    for row in batch
+                ])
+            self.written += len(batch)
+            self.batches += 1
+        except Exception as e:
+            print(f"Error writing scan batch: {e}")
+            ERRORS.inc("scan_batch")
+            if self.policy == "spill":
+                self._spill(batch)
+            else:
+                self.failed += len(batch)
+
+    def _spill(self, rows: List[Sequence]) -> None:
+        """Append rows to the spill file."""
+        try:
+            with self._spill_lock, open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(list(row)) + "\n")
+            self.spilled += len(rows)
+        except OSError as e:
+            print(f"Error spilling scan events: {e}")
+            ERRORS.inc("scan_spill")
+            self.dropped += len(rows)
+
+    def _replay_spill(self) -> None:
+        """Move spilled rows back into the database."""
+        replay_path = f"{self.spill_path}.replay"
+        if self.policy != "spill":
+            return
+        if not os.path.exists(self.spill_path) and not os.path.exists(replay_path):
+            return
+
+        with self._replay_lock:
+            # A replay file left behind by a crash is finished before taking a new one
+            with self._spill_lock:
+                if not os.path.exists(replay_path):
+                    if not os.path.exists(self.spill_path):
+                        return
+                    os.replace(self.spill_path, replay_path)
+
+            batch = []
+            bad_lines = []
+            with open(replay_path, encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    row = _parse_spilled(line)
+                    if row is None:
+                        bad_lines.append(line if line.endswith("\n") else line + "\n")
+                        continue
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        self._write_batch(batch)
+                        batch = []
+            if batch:
+                self._write_batch(batch)
+            if bad_lines:
+                self._set_aside(bad_lines)
+            os.remove(replay_path)
+
+    def _set_aside(self, lines: List[str]) -> None:
+        """Keep unreadable spill lines in a .bad file and count them as failed."""
+        print(f"Skipped {len(lines)} unreadable scan spill line(s)")
+        ERRORS.inc("scan_spill_corrupt")
+        self.failed += len(lines)
+        try:
+            with open(f"{self.spill_path}.bad", "a", encoding="utf-8") as f:
+                f.writelines(lines)
+        except OSError as e:
+            print(f"Error saving unreadable scan spill lines: {e}")
+
+    def stats(self) -> dict:
+        """Return a snapshot of the writer counters."""
+        return {
+            "queue_depth": self.queue_depth,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "failed": self.failed
+        }
+
+
+
+def _parse_spilled(line: str) -> Optional[tuple]:
+    """
+    Parse one spill file line back into a scan row.
+
+    A crash or a full disk while spilling can leave a torn last line, so
+    anything that is not a JSON list of at most len(SCAN_COLUMNS) values
+    yields None instead of raising.
+    """
+    try:
+        values = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) > len(SCAN_COLUMNS):
+        return None
+    # Rows spilled before newer columns existed are padded with NULLs
+    return tuple(values) + (None,) * (len(SCAN_COLUMNS) - len(values))
+
+
+scan_writer = ScanWriter()
@@ -0,0 +1,164 @@
+"""
+Short codes for url-mode QR codes.
+
+A url-mode QR code encodes {base_url}/scan/{code} instead of the whole
+vCard. The short payload fits a much lower QR version, which makes the
+symbol faster to render, smaller to serve and quicker for phones to decode.
+"""
+import os
+import re
+import sqlite3
+import secrets
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from .db import Database, db
+from .metrics import DB_QUERY_SECONDS
+
+
+BASE62_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Length of new codes; 62**7 is about 3.5e12, so collisions stay rare
+SHORT_CODE_LENGTH = int(os.getenv("SHORT_CODE_LENGTH", "7"))
+
+# Random codes tried per length before allocation moves to a longer code
+SHORT_CODE_ATTEMPTS = 5
+
+# Resolved codes, and card to code answers, kept per process; a code never
+# changes its card
+SHORT_CODE_CACHE_SIZE = int(os.getenv("SHORT_CODE_CACHE_SIZE", "4096"))
+
+_CODE_PATTERN = re.compile(r"^[0-9A-Za-z]{4,16}$")
+
+# (database, vcard_id) -> short code, or None for vcard-mode cards
+_card_codes: "OrderedDict[tuple, Optional[str]]" = OrderedDict()
+_card_codes_lock = threading.Lock()
+
+
+def generate_code(length: int = SHORT_CODE_LENGTH) -> str:
+    """Return a random base62 code."""
+    return "".join(secrets.choice(BASE62_ALPHABET) for _ in range(length))
+
+
+def is_short_code(value: str) -> bool:
+    """Check whether a /scan path segment could be a short code rather than a vCard ID."""
+    return bool(_CODE_PATTERN.match(value))
+
+
+def allocate_short_code(
+    vcard_id: str,
+    database: Database = db,
+    length: int = SHORT_CODE_LENGTH,
+    attempts: int = SHORT_CODE_ATTEMPTS
+) -> str:
+    """
+    Assign a short code to a vCard, or return the one it already has.
+
+    Codes are random rather than sequential, so they do not reveal how many
+    cards exist. The primary key rejects a code that is already taken; after
+    attempts collisions in a row the code grows by one character.
+
+    Args:
+        vcard_id: vCard to assign a code to
+        database: Database holding the short_codes table
+        length: Length of the first codes tried
+        attempts: Codes tried per length
+
+    Returns:
+        The vCard's short code
+    """
+    existing = _lookup_code(vcard_id, database)
+    if existing:
+        return existing
+
+    while True:
+        for _ in range(attempts):
+            code = generate_code(length)
+            try:
+                with DB_QUERY_SECONDS.time("allocate_short_code"), database.writer() as conn:
+                    conn.execute(
+                        "INSERT INTO short_codes (code, vcard_id) VALUES (?, ?)", (code, vcard_id)
+                    )
+                _remember_code(vcard_id, database, code)
+                return code
+            except sqlite3.IntegrityError:
+                # Either the code is taken, or another request gave this card a code first
+                existing = _lookup_code(vcard_id, database)
+                if existing:
+                    return existing
+        length += 1
+
+
+def resolve_short_code(code: str, database: Database = db) -> Optional[str]:
+    """Return the vCard ID a short code points to, or None if it is unknown."""
+    try:
+        return _resolve_cached(code, database)
+    except KeyError:
+        return None
+
+
+@lru_cache(maxsize=SHORT_CODE_CACHE_SIZE)
+def _resolve_cached(code: str, database: Database) -> str:
+    # Unknown codes raise instead of returning None, so lru_cache never keeps a
+    # miss for a code another worker may allocate later
+    with DB_QUERY_SECONDS.time("resolve_short_code"), database.reader() as conn:
+        row = conn.execute("SELECT vcard_id FROM short_codes WHERE code = ?", (code,)).fetchone()
+    if row is None:
+        raise KeyError(code)
+    return row[0]
+
+
+def short_code_for(vcard_id: str, database: Database = db) -> Optional[str]:
+    """
+    Return a vCard's short code, or None for vcard-mode cards.
+
+    Answers are cached per process, including None: /generate allocates a
+    url-mode card's code before it hands out the card's ID, so no caller can
+    ask about a card whose mode is still going to change.
+
+    Args:
+        vcard_id: ID of the card
+        database: Database holding the short_codes table
+
+    Returns:
+        The card's short code, or None if it has none
+    """
+    known, code = peek_short_code(vcard_id, database)
+    if not known:
+        code = _lookup_code(vcard_id, database)
+        _remember_code(vcard_id, database, code)
+    return code
+
+
+def peek_short_code(vcard_id: str, database: Database = db) -> Tuple[bool, Optional[str]]:
+    """
+    Look a card's short code up in the per-process cache only.
+
+    Cheap enough for the event loop; callers fall back to short_code_for in
+    the database pool when the answer is not known yet.
+
+    Returns:
+        (known, code): whether the cache has an answer, and that answer
+    """
+    key = (database, vcard_id)
+    with _card_codes_lock:
+        if key not in _card_codes:
+            return False, None
+        _card_codes.move_to_end(key)
+        return True, _card_codes[key]
+
+
+def _remember_code(vcard_id: str, database: Database, code: Optional[str]) -> None:
+    with _card_codes_lock:
+        _card_codes[(database, vcard_id)] = code
+        _card_codes.move_to_end((database, vcard_id))
+        while len(_card_codes) > SHORT_CODE_CACHE_SIZE:
+            _card_codes.popitem(last=False)
+
+
+def _lookup_code(vcard_id: str, database: Database) -> Optional[str]:
+    with DB_QUERY_SECONDS.time("short_code_for"), database.reader() as conn:
+        row = conn.execute("SELECT code FROM short_codes WHERE vcard_id = ?", (vcard_id,)).fetchone()
+    return row[0] if row else None
@@ -0,0 +1,421 @@
+"""
+vCard storage backends shared by the request handlers.
+
+The in-memory backend is private to one process. The SQLite and Redis
+backends are shared by every worker, each fronted by a small per-process
+cache, so a card created on one worker is served on all of them. The
+SQLite backend reads the vcards rows themselves; Redis keeps its own copy.
+"""
+import os
+import json
+import socket
+import threading
+from typing import Optional, Tuple, Union
+from urllib.parse import unquote, urlparse
+
+from .cache import VCardCache, VCardRecord
+from .db import Database, db
+from .metrics import DB_QUERY_SECONDS, ERRORS
+
+
+# Where generated vCards are kept: "memory" (per process), "sqlite" or "redis"
+VCARD_STORE_BACKEND = os.getenv("VCARD_STORE_BACKEND", "memory")
+
+# Server for the redis backend; any server speaking the Redis protocol works
+VCARD_STORE_URL = os.getenv("VCARD_STORE_URL", "redis://localhost:6379/0")
+
+# Seconds a card stays in the redis backend; the vcards table is the source of truth
+VCARD_STORE_TTL = int(os.getenv("VCARD_STORE_TTL", str(7 * 24 * 3600)))
+
+# Socket timeout, in seconds, for the redis backend
+VCARD_STORE_TIMEOUT = float(os.getenv("VCARD_STORE_TIMEOUT", "0.5"))
+
+# Key prefix for cards in the redis backend
+VCARD_STORE_PREFIX = os.getenv("VCARD_STORE_PREFIX", "vcard:")
+
+
+class VCardStore:
+    """
+    Interface of a vCard storage backend.
+
+    get returns None for unknown or expired cards, and for backend errors,
+    which callers treat like a miss and answer from the vcards table.
+    """
+
+    name = "base"
+
+    def get(self, vcard_id: str) -> Optional[VCardRecord]:
+        """Return the record for vcard_id, or None."""
+        raise NotImplementedError
+
+    def get_nowait(self, vcard_id: str) -> Optional[VCardRecord]:
+        """
+        Look a card up without blocking I/O, so it is safe on the event loop.
+
+        None means the card may still be found by get_blocking.
+        """
+        return None
+
+    def get_blocking(self, vcard_id: str) -> Optional[VCardRecord]:
+        """Finish a lookup that get_nowait missed; may do network or disk I/O."""
+        return self.get(vcard_id)
+
+    def put(self, vcard_id: str, record: Union[VCardRecord, dict]) -> VCardRecord:
+        """Store a record and return it."""
+        raise NotImplementedError
+
+    def delete(self, vcard_id: str) -> None:
+        """Remove a card."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Remove every card and reset the counters."""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Return counters, including hits and misses."""
+        raise NotImplementedError
+
+    def __setitem__(self, vcard_id: str, record: Union[VCardRecord, dict]) -> None:
+        self.put(vcard_id, record)
+
+    def __contains__(self, vcard_id: str) -> bool:
+        return self.get(vcard_id) is not None
+
+
+class MemoryStore(VCardStore):
+    """Per-process store backed by the bounded LRU cache."""
+
+    name = "memory"
+
+    def __init__(self, cache: Optional[VCardCache] = None):
+        self.cache = cache if cache is not None else VCardCache()
+
+    def get(self, vcard_id: str) -> Optional[VCardRecord]:
+        return self.cache.get(vcard_id)
+
+    def get_nowait(self, vcard_id: str) -> Optional[VCardRecord]:
+        return self.cache.get(vcard_id)
+
+    def get_blocking(self, vcard_id: str) -> Optional[VCardRecord]:
+        # get_nowait already looked in the only tier there is
+        return None
+
+    def put(self, vcard_id: str, record: Union[VCardRecord, dict]) -> VCardRecord:
+        return self.cache.put(vcard_id, record)
+
+    def delete(self, vcard_id: str) -> None:
+        self.cache.delete(vcard_id)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        return {"backend": self.name, **self.cache.stats()}
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+
+class _CountingStore(VCardStore):
+    """Hit and miss counters shared by the backends that do their own lookups."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._counter_lock = threading.Lock()
+
+    def _count(self, record: Optional[VCardRecord]) -> Optional[VCardRecord]:
+        with self._counter_lock:
+            if record is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return record
+
+    def _failed(self, action: str, error: Exception) -> None:
+        print(f"Error in {self.name} vCard store {action}: {error}")
+        ERRORS.inc("vcard_store")
+        with self._counter_lock:
+            self.errors += 1
+
+    def clear(self) -> None:
+        with self._counter_lock:
+            self.hits = self.misses = self.errors = 0
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+class SQLiteStore(_CountingStore):
+    """
+    Store that reads the vcards table, shared by every process that opens the database.
+
+    save_card already writes each card's serialized vCard, ETag and filename
+    to its vcards row, so that row is the shared copy: put, delete and clear have
+    nothing to write, a lookup is one primary-key read, and reads never open
+    a write transaction. Cards live as long as their row, so there is no TTL.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, database: Database = db):
+        super().__init__()
+        self.database = database
+
+    def get(self, vcard_id: str) -> Optional[VCardRecord]:
+        try:
+            with DB_QUERY_SECONDS.time("store_get"), self.database.reader() as conn:
+                row = conn.execute(
+                    "SELECT content, filename, name, etag FROM vcards WHERE id = ?", (vcard_id,)
+                ).fetchone()
+        except Exception as e:
+            self._failed("get", e)
+            return self._count(None)
+        return self._count(VCardRecord(*row) if row else None)
+
+    def put(self, vcard_id: str, record: Union[VCardRecord, dict]) -> VCardRecord:
+        # The vcards row written by save_card is the stored copy
+        if isinstance(record, dict):
+            record = VCardRecord.from_dict(record)
+        return record
+
+    def delete(self, vcard_id: str) -> None:
+        # Cards are only removed with their vcards row
+        pass
+
+
+class RESPError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+
+class RESPClient:
+    """
+    Minimal blocking client for the Redis serialization protocol (RESP2).
+
+    One connection per client, used under a lock; it is reopened on the
+    next command after a socket error. Only what the store needs is
+    supported: commands in, simple/error/integer/bulk/array replies out.
+    """
+
+    def __init__(self, url: str = VCARD_STORE_URL, timeout: float = VCARD_STORE_TIMEOUT):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported store URL: {url}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db_index = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            self._call(("AUTH", self.password))
+        if self.db_index:
+            self._call(("SELECT", str(self.db_index)))
+
+    def close(self) -> None:
+        """Close the connection; the next command reconnects."""
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    @staticmethod
+    def encode(args: Tuple[Union[str, bytes, int], ...]) -> bytes:
+        """Encode a command as a RESP array of bulk strings."""
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by the store server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            raise RESPError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by the store server")
+            return data[:-2]
+        if kind == b"*":
+            count = int(payload)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise RESPError(f"Unexpected reply type: {line!r}")
+
+    def _call(self, args):
+        self._sock.sendall(self.encode(args))
+        return self._read_reply()
+
+    def execute(self, *args):
+        """
+        Send one command and return its reply.
+
+        Raises:
+            RESPError: The server answered with an error
+            OSError: The server could not be reached
+        """
+        with self._lock:
+            try:
+                if self._sock is None:
+                    self._connect()
+                return self._call(args)
+            except RESPError:
+                raise
+            except (OSError, ValueError):
+                # Drop the connection so a half-read reply cannot leak into the next command
+                self.close()
+                raise
+
+
+class RedisStore(_CountingStore):
+    """Store on a Redis-protocol server, with expiry handled by the server."""
+
+    name = "redis"
+
+    def __init__(
+        self,
+        client: Optional[RESPClient] = None,
+        ttl: int = VCARD_STORE_TTL,
+        prefix: str = VCARD_STORE_PREFIX
+    ):
+        super().__init__()
+        self.client = client if client is not None else RESPClient()
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, vcard_id: str) -> Optional[VCardRecord]:
+        try:
+            with DB_QUERY_SECONDS.time("store_get"):
+                data = self.client.execute("GET", self.prefix + vcard_id)
+            record = VCardRecord.from_dict(json.loads(data)) if data is not None else None
+        except (OSError, RESPError, ValueError, KeyError) as e:
+            self._failed("get", e)
+            return self._count(None)
+        return self._count(record)
+
+    def put(self, vcard_id: str, record: Union[VCardRecord, dict]) -> VCardRecord:
+        if isinstance(record, dict):
+            record = VCardRecord.from_dict(record)
+        data = json.dumps({
+            "content": record.content, "filename": record.filename, "name": record.name, "etag": record.etag
+        })
+        try:
+            with DB_QUERY_SECONDS.time("store_put"):
+                self.client.execute("SET", self.prefix + vcard_id, data, "EX", self.ttl)
+        except (OSError, RESPError) as e:
+            self._failed("put", e)
+        return record
+
+    def delete(self, vcard_id: str) -> None:
+        try:
+            self.client.execute("DEL", self.prefix + vcard_id)
+        except (OSError, RESPError) as e:
+            self._failed("delete", e)
+
+    def clear(self) -> None:
+        try:
+            # SCAN by prefix rather than FLUSHDB, so a shared server keeps its other keys
+            cursor = b"0"
+            while True:
+                cursor, keys = self.client.execute("SCAN", cursor, "MATCH", self.prefix + "*", "COUNT", 500)
+                if keys:
+                    self.client.execute("DEL", *keys)
+                if cursor in (b"0", "0"):
+                    break
+        except (OSError, RESPError) as e:
+            self._failed("clear", e)
+        super().clear()
+
+
+class TieredStore(VCardStore):
+    """
+    Per-process cache in front of a shared backend.
+
+    Cards never change once created, so a local hit needs no check against
+    the shared copy; the local cache only bounds how long a deleted card
+    can still be served by other workers.
+    """
+
+    def __init__(self, shared: VCardStore, local: Optional[MemoryStore] = None):
+        self.shared = shared
+        self.local = local if local is not None else MemoryStore()
+        self.name = f"{shared.name}+memory"
+
+    def get(self, vcard_id: str) -> Optional[VCardRecord]:
+        return self.get_nowait(vcard_id) or self.get_blocking(vcard_id)
+
+    def get_nowait(self, vcard_id: str) -> Optional[VCardRecord]:
+        return self.local.get(vcard_id)
+
+    def get_blocking(self, vcard_id: str) -> Optional[VCardRecord]:
+        record = self.shared.get(vcard_id)
+        if record is not None:
+            self.local.put(vcard_id, record)
+        return record
+
+    def put(self, vcard_id: str, record: Union[VCardRecord, dict]) -> VCardRecord:
+        record = self.shared.put(vcard_id, record)
+        return self.local.put(vcard_id, record)
+
+    def delete(self, vcard_id: str) -> None:
+        self.shared.delete(vcard_id)
+        self.local.delete(vcard_id)
+
+    def clear(self) -> None:
+        self.shared.clear()
+        self.local.clear()
+
+    def stats(self) -> dict:
+        local, shared = self.local.stats(), self.shared.stats()
+        return {
+            "backend": self.name,
+            # A lookup misses only when neither tier has the card
+            "hits": local["hits"] + shared["hits"],
+            "misses": shared["misses"],
+            "local": local,
+            "shared": shared
+        }
+
+
+def create_store(backend: str = VCARD_STORE_BACKEND, url: str = VCARD_STORE_URL) -> VCardStore:
+    """
+    Build the configured vCard store.
+
+    Args:
+        backend: "memory", "sqlite" or "redis"
+        url: Server URL for the redis backend
+
+    Returns:
+        The store; shared backends come with a per-process cache in front
+    """
+    if backend == "memory":
+        return MemoryStore()
+    if backend == "sqlite":
+        return TieredStore(SQLiteStore())
+    if backend == "redis":
+        # Connects lazily, so startup does not wait on the server
+        return TieredStore(RedisStore(RESPClient(url)))
+    raise ValueError(f"Unknown vCard store backend: {backend}")
@@ -0,0 +1,87 @@
+"""
+Table-driven user-agent classification for scan logging.
+"""
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+
+# Distinct user-agent strings remembered; real traffic has very few
+UA_CACHE_SIZE = int(os.getenv("UA_CACHE_SIZE", "4096"))
+
+
+class UserAgentInfo(NamedTuple):
+    """Classification of a user-agent string."""
+    device_type: str
+    os: str
+    browser: str
+    is_bot: bool
+
+
+# Each table is checked in order and the first matching pattern wins, so
+# more specific patterns come first (an iPad UA also says "Mobile", Edge
+# also says "Chrome", and Chrome also says "Safari").
+BOT_PATTERN = re.compile(
+    r"bot\b|crawl|spider|slurp|bingpreview|facebookexternalhit|whatsapp|"
+    r"headless|curl/|wget/|python-requests|python-httpx|go-http-client|okhttp",
+    re.IGNORECASE
+)
+
+DEVICE_RULES = [
+    (re.compile(r"iPad|Tablet|PlayBook|Kindle|Silk/|Android(?!.*Mobile)"), "tablet"),
+    (re.compile(r"Mobi|iPhone|iPod|Windows Phone|BlackBerry|Opera Mini"), "mobile"),
+    (re.compile(r"SmartTV|SMART-TV|AppleTV|CrKey|Roku|HbbTV"), "tv"),
+    (re.compile(r"PlayStation|Xbox|Nintendo"), "console"),
+    (re.compile(r"Windows NT|Macintosh|CrOS|X11|Linux"), "desktop"),
+]
+
+OS_RULES = [
+    (re.compile(r"iPhone|iPad|iPod"), "iOS"),
+    (re.compile(r"Android"), "Android"),
+    (re.compile(r"Windows"), "Windows"),
+    (re.compile(r"CrOS"), "ChromeOS"),
+    (re.compile(r"Macintosh|Mac OS X"), "macOS"),
+    (re.compile(r"Linux|X11"), "Linux"),
+]
+
+BROWSER_RULES = [
+    (re.compile(r"Edg(e|A|iOS)?/"), "Edge"),
+    (re.compile(r"OPR/|Opera"), "Opera"),
+    (re.compile(r"SamsungBrowser/"), "Samsung Internet"),
+    (re.compile(r"Firefox/|FxiOS/"), "Firefox"),
+    (re.compile(r"Chrome/|CriOS/|Chromium/"), "Chrome"),
+    (re.compile(r"Safari/|AppleWebKit/"), "Safari"),
+]
+
+
+def _first_match(rules, user_agent: str, default: str = "unknown") -> str:
+    for pattern, label in rules:
+        if pattern.search(user_agent):
+            return label
+    return default
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def classify_user_agent(user_agent: str) -> UserAgentInfo:
+    """
+    Classify a user-agent string by device, OS, browser and bot status.
+
+    Results are memoized per raw string, so repeat visitors cost a dict lookup.
+
+    Args:
+        user_agent: Raw User-Agent header value
+
+    Returns:
+        UserAgentInfo; device_type is "bot" for crawlers and link previewers
+    """
+    if not user_agent:
+        return UserAgentInfo("unknown", "unknown", "unknown", False)
+
+    is_bot = bool(BOT_PATTERN.search(user_agent))
+    return UserAgentInfo(
+        device_type="bot" if is_bot else _first_match(DEVICE_RULES, user_agent),
+        os=_first_match(OS_RULES, user_agent),
+        browser=_first_match(BROWSER_RULES, user_agent),
+        is_bot=is_bot
+    )
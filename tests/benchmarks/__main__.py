@@ -0,0 +1,74 @@
+"""
+Run the benchmark suite and compare it with a recorded baseline.
+
+    python -m tests.benchmarks                 # run and check for regressions
+    python -m tests.benchmarks --save          # record a new baseline
+    python -m tests.benchmarks -k qr.render    # only matching benchmarks
+
+Exits with status 1 when any benchmark is slower than its baseline by more
+than the threshold. Baselines are machine specific, so record one on the
+machine that runs the comparison.
+"""
+import os
+import sys
+import argparse
+import tempfile
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Allowed slowdown before a benchmark counts as a regression
+BENCH_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.2"))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the performance benchmarks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="Record the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=BENCH_THRESHOLD,
+                        help="Allowed slowdown as a fraction (default %(default)s)")
+    parser.add_argument("-k", "--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed rounds per benchmark")
+    args = parser.parse_args(argv)
+
+    # Route benchmarks write scans, so keep them away from the real database
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+    from . import bench_http, bench_render
+    from .harness import find_regressions, load_baseline, measure, save_baseline
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    print(f"{'benchmark':<28} {'ms/call':>10} {'baseline':>10} {'change':>8}")
+    for module in (bench_render, bench_http):
+        for name, func in module.benchmarks():
+            if args.filter not in name:
+                continue
+            results[name] = measure(func, repeat=args.repeat)
+            previous = baseline.get(name)
+            change = f"{(results[name] / previous - 1) * 100:+7.1f}%" if previous else ""
+            previous_text = f"{previous:.3f}" if previous else "-"
+            print(f"{name:<28} {results[name]:>10.3f} {previous_text:>10} {change:>8}")
+
+    if args.save:
+        # Keep baselines of benchmarks that were filtered out of this run
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save to record one")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for name, previous, current in regressions:
+        print(f"REGRESSION {name}: {previous:.3f} ms -> {current:.3f} ms")
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+End-to-end benchmarks of the hot routes through the ASGI app.
+
+DATABASE_PATH must point at a scratch database before this module is
+imported; the runner in __main__ takes care of that.
+"""
+from typing import Callable, Iterator, Tuple
+
+from fastapi.testclient import TestClient
+
+from app.main import app, vcard_storage
+from app.scan_writer import scan_writer
+from app.vcard import generate_vcard
+
+
+BENCH_VCARD_ID = "bench-card"
+
+FORM = {
+    "name": "Jane Smith",
+    "company": "Acme Corp",
+    "title": "Software Engineer",
+    "email": "jane@acme.com",
+    "phone": "+1-555-123-4567",
+    "website": "https://acme.com"
+}
+
+
+def _seed(client: TestClient) -> None:
+    """Store a card and a few hundred scans so analytics has data to read."""
+    vcard_storage[BENCH_VCARD_ID] = {
+        "content": generate_vcard(**FORM),
+        "filename": "jane-smith.vcf",
+        "name": FORM["name"]
+    }
+    for i in range(200):
+        client.get(f"/scan/{BENCH_VCARD_ID}", headers={"x-forwarded-for": f"10.0.{i % 50}.1"})
+    scan_writer.flush()
+
+    # A benchmark of an error page would be meaningless
+    for path in (f"/scan/{BENCH_VCARD_ID}", f"/qr/{BENCH_VCARD_ID}.png", f"/analytics/{BENCH_VCARD_ID}"):
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+    assert client.post("/generate", data=FORM).status_code == 200
+
+
+def benchmarks() -> Iterator[Tuple[str, Callable[[], object]]]:
+    """Yield (name, callable) for every route benchmark."""
+    client = TestClient(app)
+    _seed(client)
+
+    yield "http.generate", lambda: client.post("/generate", data=FORM)
+    yield "http.scan", lambda: client.get(f"/scan/{BENCH_VCARD_ID}")
+    yield "http.qr.png", lambda: client.get(f"/qr/{BENCH_VCARD_ID}.png")
+    yield "http.analytics", lambda: client.get(f"/analytics/{BENCH_VCARD_ID}")
@@ -0,0 +1,51 @@
+"""
+Benchmark the NumPy PNG writer against segno's pure-Python writer.
+
+Run with: python -m tests.benchmarks.bench_png
+"""
+import io
+import timeit
+
+from app.qr import encode_qr, np, write_png_numpy
+from app.vcard import generate_vcard
+
+
+PAYLOADS = {
+    "small": "https://example.com/scan/abc123",
+    "vcard": generate_vcard(
+        name="Jane Smith",
+        company="Acme Corp",
+        title="Software Engineer",
+        email="jane@acme.com",
+        phone="+1-555-123-4567",
+        website="https://acme.com"
+    ),
+    "large": generate_vcard(name="Large Payload", company="x" * 600),
+}
+
+
+def segno_png(qr, scale, border):
+    buffer = io.BytesIO()
+    qr.save(buffer, kind="png", scale=scale, border=border)
+    return buffer.getvalue()
+
+
+def run(scale: int = 10, border: int = 4, number: int = 50) -> None:
+    if np is None:
+        print("NumPy is not installed; only the segno writer is available")
+        return
+    
+    print(f"{'payload':<8} {'version':>7} {'segno ms':>9} {'numpy ms':>9} {'speedup':>8}")
+    for label, payload in PAYLOADS.items():
+        qr = encode_qr(payload)
+        assert segno_png(qr, scale, border) == write_png_numpy(qr, scale, border)
+        segno_time = timeit.timeit(lambda: segno_png(qr, scale, border), number=number) / number
+        numpy_time = timeit.timeit(lambda: write_png_numpy(qr, scale, border), number=number) / number
+        print(
+            f"{label:<8} {qr.version:>7} {segno_time * 1000:>9.2f} "
+            f"{numpy_time * 1000:>9.2f} {segno_time / numpy_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    run()
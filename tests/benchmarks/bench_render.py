@@ -0,0 +1,32 @@
+"""
+Benchmarks for QR rendering and vCard generation.
+"""
+from typing import Callable, Iterator, Tuple
+
+from app.qr import generate_qr_code, render_qr_code
+from app.vcard import generate_vcard, generate_vcard_filename
+
+from .bench_png import PAYLOADS
+
+
+QR_FORMATS = ("png", "svg", "eps", "pdf")
+
+
+def benchmarks() -> Iterator[Tuple[str, Callable[[], object]]]:
+    """Yield (name, callable) for every render and vCard benchmark."""
+    for label, payload in PAYLOADS.items():
+        for fmt in QR_FORMATS:
+            # Render cache misses serialize the memoized symbol every time
+            yield f"qr.render.{fmt}.{label}", lambda p=payload, f=fmt: render_qr_code(p, f)
+        # Repeat downloads are served from the render cache
+        yield f"qr.cached.png.{label}", lambda p=payload: generate_qr_code(p, "png")
+
+    yield "vcard.generate", lambda: generate_vcard(
+        name="Jane Smith",
+        company="Acme Corp",
+        title="Software Engineer",
+        email="jane@acme.com",
+        phone="+1-555-123-4567",
+        website="https://acme.com"
+    )
+    yield "vcard.filename", lambda: generate_vcard_filename("Jane Smith-O'Brien & Co.")
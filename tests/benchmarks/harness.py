@@ -0,0 +1,104 @@
+"""
+Timing, baseline and regression helpers shared by the benchmark modules.
+"""
+import json
+import time
+import platform
+from typing import Callable, Dict, List, Tuple
+
+
+def measure(func: Callable[[], object], repeat: int = 5, min_time: float = 0.05) -> float:
+    """
+    Time a function and return its best per-call duration in milliseconds.
+
+    The call count per round is grown until a round takes at least min_time,
+    then the fastest of repeat rounds is kept, which is the least noisy
+    estimate on a shared machine.
+
+    Args:
+        func: Zero-argument callable to time
+        repeat: Number of timed rounds
+        min_time: Minimum duration of a round in seconds
+
+    Returns:
+        Milliseconds per call
+    """
+    func()  # warm up caches and lazy imports outside the timed rounds
+
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1000
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    """
+    Read a baseline written by save_baseline.
+
+    Args:
+        path: Baseline JSON file
+
+    Returns:
+        Mapping of benchmark name to milliseconds per call, empty if the file is missing
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["results"]
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(path: str, results: Dict[str, float]) -> None:
+    """
+    Write benchmark results as the new baseline.
+
+    Args:
+        path: Baseline JSON file
+        results: Mapping of benchmark name to milliseconds per call
+    """
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "results": {name: round(ms, 6) for name, ms in sorted(results.items())}
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def find_regressions(
+    results: Dict[str, float],
+    baseline: Dict[str, float],
+    threshold: float
+) -> List[Tuple[str, float, float]]:
+    """
+    Compare results with a baseline.
+
+    Args:
+        results: Mapping of benchmark name to milliseconds per call
+        baseline: Baseline in the same shape; names missing from it are skipped
+        threshold: Allowed slowdown as a fraction, e.g. 0.2 for 20%
+
+    Returns:
+        (name, baseline ms, current ms) for every benchmark slower than allowed
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is not None and current > previous * (1 + threshold):
+            regressions.append((name, previous, current))
+    return regressions
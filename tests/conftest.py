@@ -0,0 +1,28 @@
+"""
+Shared pytest configuration, fixtures and helpers.
+"""
+import os
+import tempfile
+
+import pytest
+
+# Keep the tests away from the checked-in tracking database
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "qr_tracking.db"))
+
+# Imported after DATABASE_PATH is set, since the app reads it at import time
+from app.db import Database
+from app.scan_writer import SCAN_COLUMNS
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Fresh tracking database in the test's temporary directory."""
+    database = Database(str(tmp_path / "tracking.db"))
+    yield database
+    database.close()
+
+
+def make_row(vcard_id="card-1", scan_time="2025-01-01 12:00:00", device_type=None, ip_address=None, **values):
+    """Build a scans row in SCAN_COLUMNS order; columns not given are None."""
+    values.update(vcard_id=vcard_id, scan_time=scan_time, device_type=device_type, ip_address=ip_address)
+    return tuple(values.get(column) for column in SCAN_COLUMNS)
@@ -0,0 +1,31 @@
+"""
+Tests for the benchmark harness.
+"""
+from tests.benchmarks.harness import find_regressions, load_baseline, measure, save_baseline
+
+
+def test_measure_returns_milliseconds_per_call():
+    """Test measure times repeated calls and reports a positive duration."""
+    calls = []
+    elapsed = measure(lambda: calls.append(1), repeat=2, min_time=0.001)
+    
+    assert elapsed > 0
+    assert len(calls) > 2
+
+
+def test_baseline_round_trip(tmp_path):
+    """Test saved baselines load back, and a missing file means no baseline."""
+    path = str(tmp_path / "baseline.json")
+    assert load_baseline(path) == {}
+    
+    save_baseline(path, {"qr.render.png.small": 1.25})
+    assert load_baseline(path) == {"qr.render.png.small": 1.25}
+
+
+def test_find_regressions_uses_threshold():
+    """Test only benchmarks slower than baseline by more than the threshold are reported."""
+    baseline = {"fast": 1.0, "slow": 1.0, "retired": 1.0}
+    results = {"fast": 1.1, "slow": 1.5, "new": 9.0}
+    
+    assert find_regressions(results, baseline, threshold=0.2) == [("slow", 1.0, 1.5)]
+    assert find_regressions(results, baseline, threshold=0.05) == [("fast", 1.0, 1.1), ("slow", 1.0, 1.5)]
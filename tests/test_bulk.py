@@ -0,0 +1,147 @@
+"""
+Tests for bulk vCard and QR generation.
+"""
+import io
+import csv
+import json
+import asyncio
+import zipfile
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.bulk import InvalidRecord, iter_records, stream_bulk_zip, detect_input_kind, main
+from app.db import Database
+from app.executor import RenderExecutor
+
+client = TestClient(app)
+
+CSV_INPUT = (
+    "name,company,email,ignored\n"
+    "Ada Lovelace,Analytical,ada@example.com,x\n"
+    ",Nameless,nobody@example.com,x\n"
+    "Alan Turing,,alan@example.com,x\n"
+).encode("utf-8")
+
+
+def test_iter_records_csv():
+    """Test CSV rows are read with blank values turned into None."""
+    records = list(iter_records(io.BytesIO(CSV_INPUT), "csv"))
+    
+    assert len(records) == 3
+    assert records[0]["name"] == "Ada Lovelace"
+    assert records[2]["company"] is None
+    assert "ignored" not in records[0]
+
+
+def test_iter_records_jsonl():
+    """Test JSONL objects are read one per line."""
+    data = b'{"name": "Grace Hopper", "title": "Rear Admiral"}\n\n{"name": "Linus"}\n'
+    records = list(iter_records(io.BytesIO(data), "jsonl"))
+    
+    assert [record["name"] for record in records] == ["Grace Hopper", "Linus"]
+    assert records[0]["title"] == "Rear Admiral"
+
+
+def test_iter_records_reports_unreadable_lines():
+    """Test bad JSON and non-object lines become InvalidRecords and reading carries on."""
+    data = b'{"name": "Before"}\n{not json\n["x"]\n\xff\n{"name": "After"}\n'
+    records = list(iter_records(io.BytesIO(data), "jsonl"))
+    
+    assert records[0]["name"] == "Before" and records[-1]["name"] == "After"
+    assert all(isinstance(record, InvalidRecord) for record in records[1:4])
+    assert "list" in str(records[2])
+
+
+def test_detect_input_kind():
+    """Test input type detection from the filename."""
+    assert detect_input_kind("people.jsonl") == "jsonl"
+    assert detect_input_kind("people.csv") == "csv"
+    assert detect_input_kind(None) == "csv"
+
+
+def test_stream_bulk_zip_batches(tmp_path):
+    """Test records are inserted in batches and streamed as several chunks."""
+    database = Database(str(tmp_path / "bulk.db"))
+    executor = RenderExecutor(kind="thread", max_workers=2)
+    records = ({"name": f"Person {i}", "email": f"p{i}@example.com"} for i in range(5))
+    
+    async def collect():
+        return [chunk async for chunk in stream_bulk_zip(records, ["svg"], database, executor, batch_size=2)]
+    
+    try:
+        chunks = asyncio.run(collect())
+    finally:
+        executor.shutdown()
+    
+    assert len(chunks) == 3
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    names = archive.namelist()
+    assert sum(name.endswith(".vcf") for name in names) == 5
+    assert sum(name.endswith("qr.svg") for name in names) == 5
+    
+    with database.reader() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM vcards").fetchone()[0] == 5
+    database.close()
+
+
+def test_bulk_endpoint_returns_zip():
+    """Test the bulk endpoint streams a ZIP with a manifest."""
+    response = client.post(
+        "/bulk",
+        files={"file": ("people.csv", CSV_INPUT, "text/csv")},
+        data={"formats": "png,svg"}
+    )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    manifest = list(csv.DictReader(io.StringIO(archive.read("manifest.csv").decode("utf-8"))))
+    
+    assert [row["error"] for row in manifest] == ["", "missing name", ""]
+    ada = manifest[0]
+    assert f"{ada['vcard_id']}/ada-lovelace.vcf" in archive.namelist()
+    assert f"{ada['vcard_id']}/qr.png" in archive.namelist()
+    assert f"{ada['vcard_id']}/qr.eps" not in archive.namelist()
+    assert client.get(f"/vcard/{ada['vcard_id']}").status_code == 200
+
+
+def test_bulk_endpoint_lists_unreadable_lines_in_manifest():
+    """Test bad JSONL lines are reported in the manifest instead of breaking the ZIP."""
+    data = b'{"name": "Good One"}\n{oops\n["x"]\n{"name": "Good Two"}\n'
+    response = client.post(
+        "/bulk",
+        files={"file": ("people.jsonl", data, "application/x-ndjson")},
+        data={"formats": "svg"}
+    )
+    
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    manifest = list(csv.DictReader(io.StringIO(archive.read("manifest.csv").decode("utf-8"))))
+    
+    assert [row["line"] for row in manifest] == ["1", "2", "3", "4"]
+    assert manifest[1]["error"].startswith("invalid JSON")
+    assert manifest[2]["error"].startswith("expected a JSON object")
+    assert [row["name"] for row in manifest if not row["error"]] == ["Good One", "Good Two"]
+    assert sum(name.endswith(".vcf") for name in archive.namelist()) == 2
+
+
+def test_bulk_endpoint_rejects_unknown_format():
+    """Test unsupported QR formats are rejected up front."""
+    response = client.post(
+        "/bulk",
+        files={"file": ("people.csv", CSV_INPUT, "text/csv")},
+        data={"formats": "png,gif"}
+    )
+    assert response.status_code == 400
+
+
+def test_bulk_command(tmp_path):
+    """Test the command line writes a ZIP for a JSONL file."""
+    source = tmp_path / "people.jsonl"
+    source.write_text(json.dumps({"name": "Cli Person"}) + "\n")
+    output = tmp_path / "out.zip"
+    
+    main([str(source), "-o", str(output), "--formats", "svg"])
+    
+    names = zipfile.ZipFile(output).namelist()
+    assert any(name.endswith("cli-person.vcf") for name in names)
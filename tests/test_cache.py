@@ -0,0 +1,76 @@
+"""
+Tests for the bounded vCard cache.
+"""
+from app.cache import VCardCache, VCardRecord
+
+
+def make_record(name="Test User", content="BEGIN:VCARD\nEND:VCARD"):
+    return VCardRecord(content=content, filename="test-user.vcf", name=name)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+def test_get_and_put():
+    """Test stored records are returned and counted as hits."""
+    cache = VCardCache()
+    cache.put("a", make_record())
+    
+    assert cache.get("a").name == "Test User"
+    assert cache.get("missing") is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_accepts_dict_records():
+    """Test dict values are converted to compact records."""
+    cache = VCardCache()
+    cache["a"] = {"content": "BEGIN:VCARD\nEND:VCARD", "filename": "a.vcf", "name": "A"}
+    
+    record = cache.get("a")
+    assert isinstance(record, VCardRecord)
+    assert "a" in cache
+    assert not hasattr(record, "__dict__")
+
+
+def test_max_entries_evicts_least_recently_used():
+    """Test the entry cap evicts the least recently used record."""
+    cache = VCardCache(max_entries=2)
+    cache.put("a", make_record())
+    cache.put("b", make_record())
+    cache.get("a")
+    cache.put("c", make_record())
+    
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.evictions == 1
+
+
+def test_max_bytes_bounds_size():
+    """Test the byte cap is enforced."""
+    record_size = make_record().size
+    cache = VCardCache(max_bytes=record_size * 2)
+    for key in "abc":
+        cache.put(key, make_record())
+    
+    assert len(cache) == 2
+    assert cache.current_bytes == record_size * 2
+
+
+def test_ttl_expires_entries():
+    """Test records older than the TTL are treated as misses."""
+    clock = FakeClock()
+    cache = VCardCache(ttl=10, clock=clock)
+    cache.put("a", make_record())
+    
+    clock.now = 9
+    assert cache.get("a") is not None
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+    assert len(cache) == 0
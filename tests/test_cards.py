@@ -0,0 +1,69 @@
+"""
+Tests for card creation and the shared lookup path.
+"""
+import pytest
+import app.cards as cards
+from app.cards import INSERT_VCARD_SQL, build_card, card_row, load_card, resolve_card
+from app.conditional import make_etag
+from app.storage import MemoryStore
+
+
+FIELDS = {"name": "Jane Smith", "company": "Acme Corp", "email": "jane@acme.com"}
+
+
+@pytest.fixture
+def database(database):
+    record = build_card(FIELDS)
+    with database.writer() as conn:
+        conn.execute(INSERT_VCARD_SQL, card_row("card-1", FIELDS, record))
+    return database
+
+
+def test_build_card_serializes_once():
+    """Test a built card carries its vCard text, ETag and filename."""
+    record = build_card(FIELDS)
+
+    assert "ORG:Acme Corp" in record.content
+    assert record.etag == make_etag(record.content)
+    assert record.filename == "jane-smith.vcf"
+
+
+def test_load_card_reads_stored_vcard(database, monkeypatch):
+    """Test a cold lookup returns the stored vCard without formatting or hashing it."""
+    def fail(*args, **kwargs):
+        raise AssertionError("the read path must not rebuild the vCard")
+    monkeypatch.setattr(cards, "generate_vcard", fail)
+    monkeypatch.setattr("app.cache.make_etag", fail)
+
+    record = load_card("card-1", database)
+
+    assert record.name == "Jane Smith"
+    assert "EMAIL:jane@acme.com" in record.content
+    assert record.filename == "jane-smith.vcf"
+    assert load_card("missing", database) is None
+
+
+def test_load_card_is_one_primary_key_read(database):
+    """Test the cold lookup is a single search on the vcards primary key."""
+    statements = []
+    with database.reader() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        load_card("card-1", database)
+    finally:
+        with database.reader() as conn:
+            conn.set_trace_callback(None)
+
+    assert len(statements) == 1
+    with database.reader() as conn:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statements[0]}")]
+    assert len(plan) == 1 and plan[0].startswith("SEARCH vcards USING INDEX"), plan
+
+
+def test_resolve_card_fills_the_store(database):
+    """Test a database hit is put in the store so the next lookup stays in memory."""
+    store = MemoryStore()
+
+    assert resolve_card("card-1", store, database).name == "Jane Smith"
+    assert store.get("card-1") is not None
+    assert resolve_card("missing", store, database) is None
@@ -0,0 +1,203 @@
+"""
+Tests for the pooled SQLite access layer.
+"""
+import asyncio
+import sqlite3
+import threading
+import pytest
+from app.db import Database
+
+
+def test_schema_created_on_first_use(database):
+    """Test tables exist as soon as a connection is borrowed."""
+    with database.reader() as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    
+    assert {"scans", "vcards"} <= tables
+
+
+def test_connections_are_tuned(database):
+    """Test WAL mode and pragmas are applied to pooled connections."""
+    with database.writer() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] > 0
+
+
+def test_readers_are_read_only(database):
+    """Test pooled readers cannot write."""
+    with database.reader() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO vcards (id, name) VALUES ('x', 'X')")
+
+
+def test_writer_commits_and_rolls_back(database):
+    """Test the writer commits on success and rolls back on error."""
+    with database.writer() as conn:
+        conn.execute("INSERT INTO vcards (id, name) VALUES ('kept', 'Kept')")
+    with pytest.raises(RuntimeError):
+        with database.writer() as conn:
+            conn.execute("INSERT INTO vcards (id, name) VALUES ('lost', 'Lost')")
+            raise RuntimeError("boom")
+    
+    with database.reader() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM vcards")]
+    assert ids == ["kept"]
+
+
+def test_reader_does_not_wait_for_open_write(database):
+    """Test pooled reads go ahead while a write transaction is open."""
+    database.initialize()
+    writing, release = threading.Event(), threading.Event()
+    counts = []
+    
+    def hold_writer():
+        with database.writer() as conn:
+            conn.execute("INSERT INTO vcards (id, name) VALUES ('pending', 'Pending')")
+            writing.set()
+            release.wait(5)
+    
+    def read():
+        with database.reader() as conn:
+            counts.append(conn.execute("SELECT COUNT(*) FROM vcards WHERE id = 'pending'").fetchone()[0])
+    
+    writer = threading.Thread(target=hold_writer)
+    writer.start()
+    try:
+        assert writing.wait(5)
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(1)
+        # The read finished while the write was still open, without seeing its row
+        assert counts == [0]
+    finally:
+        release.set()
+        writer.join()
+
+
+def test_reader_pool_reuses_connections(database):
+    """Test readers are returned to the pool and never exceed its size."""
+    with database.reader() as first:
+        with database.reader() as second:
+            assert first is not second
+    with database.reader() as again:
+        assert again in (first, second)
+    
+    assert len(database._all_readers) == 2
+
+
+def test_migrations_record_schema_version(database):
+    """Test every migration runs once and bumps user_version."""
+    from app.db import MIGRATIONS, init_schema
+    with database.writer() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    
+    # Running again is a no-op
+    init_schema(database._get_writer())
+    with database.reader() as conn:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_scans_vcard_time", "idx_scans_scan_time"} <= indexes
+
+
+def test_migrations_upgrade_unversioned_database(tmp_path):
+    """Test a database created before versioning is migrated in place."""
+    path = str(tmp_path / "legacy.db")
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE scans (id INTEGER PRIMARY KEY AUTOINCREMENT, vcard_id TEXT NOT NULL, scan_time TIMESTAMP, ip_address TEXT, user_agent TEXT, country TEXT, city TEXT, latitude REAL, longitude REAL, referer TEXT, device_type TEXT)")
+    legacy.execute("CREATE INDEX idx_scans_vcard_id ON scans (vcard_id)")
+    legacy.execute("INSERT INTO scans (vcard_id, scan_time, ip_address, user_agent, device_type) VALUES ('old', '2024-01-01 10:00:00', '1.2.3.4', 'Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) Mobile/15E148 Safari/604.1', 'mobile')")
+    legacy.commit()
+    legacy.close()
+    
+    database = Database(path)
+    with database.reader() as conn:
+        rollup = conn.execute("SELECT device_type, scans FROM scan_rollup_daily WHERE vcard_id = 'old'").fetchone()
+        client = conn.execute("SELECT os, browser, is_bot FROM scans WHERE vcard_id = 'old'").fetchone()
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    database.close()
+    
+    # The old substring checks called iPads mobile; the migration reclassifies them
+    assert rollup == ("tablet", 1)
+    assert client == ("iOS", "Safari", 0)
+    assert "idx_scans_vcard_id" not in indexes
+
+
+def test_db_executor_runs_calls_off_the_loop():
+    """Test the database pool returns results, raises errors and counts calls."""
+    import threading
+    from app.db import DBExecutor
+    executor = DBExecutor(max_workers=2)
+    
+    async def calls():
+        thread = await executor.run(lambda: threading.current_thread().name)
+        total = await executor.run(sum, [1, 2, 3])
+        with pytest.raises(ZeroDivisionError):
+            await executor.run(lambda: 1 / 0)
+        return thread, total
+    
+    thread, total = asyncio.run(calls())
+    executor.shutdown()
+    
+    assert thread.startswith("db") and total == 6
+    assert executor.stats()["completed"] == 3 and executor.stats()["in_flight"] == 0
+
+
+def test_migration_serializes_existing_vcards(tmp_path):
+    """Test cards created before the content columns get their vCard stored once."""
+    from app.db import MIGRATIONS, init_schema
+    path = str(tmp_path / "cards.db")
+    conn = sqlite3.connect(path)
+    conn.isolation_level = None
+    for migration in MIGRATIONS[:7]:
+        migration(conn)
+    conn.execute("PRAGMA user_version = 7")
+    conn.execute("INSERT INTO vcards (id, name, email) VALUES ('old-card', 'Old Card', 'old@test.com')")
+    
+    init_schema(conn)
+    content, etag, filename = conn.execute(
+        "SELECT content, etag, filename FROM vcards WHERE id = 'old-card'"
+    ).fetchone()
+    conn.close()
+    
+    assert "FN:Old Card" in content and "EMAIL:old@test.com" in content
+    assert etag.startswith('"') and filename == "old-card.vcf"
+
+
+@pytest.mark.parametrize("vcard_id", [None, "card-1"])
+def test_dashboard_queries_use_indexes(tmp_path, monkeypatch, vcard_id):
+    """Test no dashboard query plan falls back to a full table scan."""
+    import app.main as main
+    from app.shortcodes import resolve_short_code, short_code_for
+    database = Database(str(tmp_path / "plans.db"), read_pool_size=1)
+    monkeypatch.setattr(main, "db", database)
+    
+    statements = []
+    with database.reader() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        assert main.get_scan_stats(vcard_id) is not None
+        assert main.get_scan_history(vcard_id, cursor=main.encode_scan_cursor("2025-01-01 00:00:00", 10)) is not None
+        start, end = main.parse_series_range("hour", "2025-01-01", "2025-01-03")
+        assert main.get_scan_series(vcard_id, "hour", start, end) is not None
+        if vcard_id:
+            asyncio.run(main.resolve_vcard(vcard_id))
+            short_code_for(vcard_id, database)
+            resolve_short_code("Ab3dE5g", database)
+    finally:
+        with database.reader() as conn:
+            conn.set_trace_callback(None)
+    
+    queries = [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+    assert queries
+    with database.reader() as conn:
+        for sql in queries:
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+            for detail in plan:
+                assert "TEMP B-TREE" not in detail, (sql, plan)
+                if detail.startswith("SCAN scan_archives"):
+                    # The archive registry holds one row per archived month
+                    continue
+                if detail.startswith("SCAN "):
+                    # Only the global recent-scans query may walk an index, and it stops at the LIMIT
+                    assert vcard_id is None and "USING" in detail and "INDEX" in detail, (sql, plan)
+    database.close()
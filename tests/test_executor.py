@@ -0,0 +1,67 @@
+"""
+Tests for the QR render executor.
+"""
+import asyncio
+import pytest
+from app.executor import RenderExecutor
+from app.qr import encode_qr, generate_qr_code, render_cache
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_render_matches_direct_generation(kind):
+    """Test pooled renders produce the same bytes as generate_qr_code."""
+    executor = RenderExecutor(kind=kind, max_workers=2)
+    render_cache.clear()
+    try:
+        qr_bytes = asyncio.run(executor.render(f"pooled {kind}", "svg"))
+    finally:
+        executor.shutdown()
+    
+    render_cache.clear()
+    assert qr_bytes == generate_qr_code(f"pooled {kind}", "svg")
+
+
+def test_render_many_runs_all_formats():
+    """Test render_many returns every format and reports failures as None."""
+    executor = RenderExecutor(kind="thread", max_workers=4)
+    render_cache.clear()
+    try:
+        qr_files = asyncio.run(executor.render_many("many formats", ["png", "svg", "eps", "pdf", "bogus"]))
+    finally:
+        executor.shutdown()
+    
+    assert all(qr_files[fmt] for fmt in ["png", "svg", "eps", "pdf"])
+    assert qr_files["bogus"] is None
+    assert executor.stats()["in_flight"] == 0
+    assert executor.stats()["queue_depth"] == 0
+    # One pool job covers every format
+    assert executor.completed == 1
+
+
+def test_render_many_encodes_once():
+    """Test a cold payload is encoded once however many formats are rendered."""
+    executor = RenderExecutor(kind="thread", max_workers=4)
+    render_cache.clear()
+    encode_qr.cache_clear()
+    try:
+        asyncio.run(executor.render_many("encode me once", ["png", "svg", "eps", "pdf"]))
+    finally:
+        executor.shutdown()
+
+    info = encode_qr.cache_info()
+    assert info.misses == 1 and info.hits == 0
+
+
+def test_queue_depth_and_in_flight():
+    """Test pending renders split into in-flight and queued counts."""
+    executor = RenderExecutor(kind="thread", max_workers=2)
+    executor.pending = 5
+    
+    assert executor.in_flight == 2
+    assert executor.queue_depth == 3
+
+
+def test_unknown_executor_kind():
+    """Test an unknown pool type is rejected."""
+    with pytest.raises(ValueError):
+        RenderExecutor(kind="gpu")
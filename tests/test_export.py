@@ -0,0 +1,84 @@
+"""
+Tests for the streaming scan export.
+"""
+import csv
+import gzip
+import io
+import json
+import pytest
+from app.export import build_export_query, iter_scan_export, main, normalize_time
+from app.scan_writer import ScanWriter
+from tests.conftest import make_row
+
+
+@pytest.fixture
+def database(database):
+    writer = ScanWriter(database, autostart=False)
+    for i in range(25):
+        writer.submit(make_row(
+            vcard_id="card-a" if i % 5 else "card-b",
+            scan_time=f"2025-05-{1 + i // 10:02d} 12:00:{i:02d}",
+            ip_address=f"10.0.0.{i}",
+            device_type="mobile"
+        ))
+    writer.flush()
+    return database
+
+
+def test_ndjson_export_streams_in_batches(database):
+    """Test NDJSON export yields one chunk per batch with one object per line."""
+    chunks = list(iter_scan_export("ndjson", database=database, batch_size=10))
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    
+    assert len(chunks) == 3
+    assert len(rows) == 25
+    assert rows[0]["ip_address"] == "10.0.0.0"
+    assert [row["scan_time"] for row in rows] == sorted(row["scan_time"] for row in rows)
+
+
+def test_csv_export_filters_and_gzip(database):
+    """Test CSV export honours the card and time range filters and gzips on request."""
+    data = b"".join(iter_scan_export(
+        "csv", vcard_id="card-a", start="2025-05-02 00:00:00", end="2025-05-03 00:00:00",
+        compress=True, database=database, batch_size=3
+    ))
+    rows = list(csv.reader(io.StringIO(gzip.decompress(data).decode())))
+    
+    assert rows[0][:3] == ["id", "vcard_id", "scan_time"]
+    assert len(rows) == 1 + 8
+    assert {row[1] for row in rows[1:]} == {"card-a"}
+
+
+def test_export_query_uses_index(database):
+    """Test per-card and time-range exports are driven by an index, not a table scan."""
+    with database.reader() as conn:
+        for args in (("card-a", None, None), (None, "2025-05-02 00:00:00", None)):
+            sql, params = build_export_query(*args)
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            assert all("TEMP B-TREE" not in detail and not detail.startswith("SCAN") for detail in plan), plan
+
+
+def test_export_command(database, tmp_path):
+    """Test the command line export writes the matching scans."""
+    output = tmp_path / "scans.ndjson"
+    
+    main(["-o", str(output), "--vcard-id", "card-b", "--from", "2025-05-01", "--db", database.path])
+    
+    assert len(output.read_text().splitlines()) == 5
+    assert normalize_time("2025-05-01") == "2025-05-01 00:00:00"
+    assert normalize_time("2025-05-01T02:30:00+02:00") == "2025-05-01 00:30:00"
+    assert normalize_time("2025-05-01T00:30:00Z") == "2025-05-01 00:30:00"
+
+
+def test_open_export_does_not_block_writer(database):
+    """Test scans can be written while an export holds its cursor open."""
+    chunks = iter_scan_export("ndjson", database=database, batch_size=5)
+    next(chunks)
+    
+    writer = ScanWriter(database, autostart=False)
+    writer.submit(make_row("card-c", "2025-06-01 00:00:00"))
+    writer.flush()
+    
+    assert writer.written == 1
+    # The export keeps reading the snapshot it started with
+    assert sum(chunk.count(b"\n") for chunk in chunks) == 20
@@ -0,0 +1,49 @@
+"""
+Tests for HyperLogLog unique counting.
+"""
+import pytest
+from app.hll import HyperLogLog
+
+
+@pytest.mark.parametrize("cardinality", [10, 1000, 50000])
+def test_estimate_within_error_bound(cardinality):
+    """Test estimates stay within 5% of the exact distinct count."""
+    sketch = HyperLogLog()
+    for i in range(cardinality):
+        ip = f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"
+        sketch.add(ip)
+        sketch.add(ip)
+    
+    assert abs(sketch.count() - cardinality) <= max(1, 0.05 * cardinality)
+
+
+def test_merge_equals_union():
+    """Test merging sketches estimates the union of their inputs."""
+    first, second, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        first.add(f"visitor-{i}")
+        union.add(f"visitor-{i}")
+    for i in range(2000, 6000):
+        second.add(f"visitor-{i}")
+        union.add(f"visitor-{i}")
+    
+    first.merge(second)
+    
+    assert first.registers == union.registers
+    assert abs(first.count() - 6000) <= 0.05 * 6000
+
+
+def test_serialization_round_trip():
+    """Test sketches survive serialization and compress when sparse."""
+    sketch = HyperLogLog()
+    sketch.update(["a", "b", "c"])
+    data = sketch.to_bytes()
+    
+    assert len(data) < 200
+    assert HyperLogLog.from_bytes(data).registers == sketch.registers
+
+
+def test_merge_rejects_mismatched_precision():
+    """Test sketches of different precision cannot be merged."""
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=10).merge(HyperLogLog(precision=12))
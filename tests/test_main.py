@@ -1,6 +1,7 @@
 """
 Tests for FastAPI main application.
 """
+from datetime import datetime, timedelta
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
@@ -139,3 +140,378 @@ def test_generate_with_vcard_mode():
     
     assert response.status_code == 200
     assert "Direct Mode" in response.text
+
+
+def _cached_formats(vcard_content):
+    """Return the QR formats of vcard_content currently in the render cache."""
+    from app.qr import RenderCache, render_cache
+    return [
+        fmt for fmt in ["png", "svg", "eps", "pdf"]
+        if render_cache.get(RenderCache.make_key(vcard_content, fmt, 10, 4)) is not None
+    ]
+
+
+def test_generate_lazy_mode_renders_only_preview(monkeypatch):
+    """Test lazy mode renders the preview and still links every format."""
+    import app.main as main
+    from app.qr import render_cache
+    from app.vcard import generate_vcard
+    monkeypatch.setattr(main, "QR_RENDER_MODE", "lazy")
+    render_cache.clear()
+    
+    response = client.post("/generate", data={"name": "Lazy Mode"})
+    
+    assert response.status_code == 200
+    assert _cached_formats(generate_vcard(name="Lazy Mode")) == ["png"]
+    for fmt in ["svg", "eps", "pdf"]:
+        assert f".{fmt}\"" in response.text
+
+
+def test_generate_background_mode_warms_other_formats(monkeypatch):
+    """Test background mode renders the remaining formats after responding."""
+    import app.main as main
+    from app.qr import render_cache
+    from app.vcard import generate_vcard
+    monkeypatch.setattr(main, "QR_RENDER_MODE", "background")
+    render_cache.clear()
+    
+    response = client.post("/generate", data={"name": "Background Mode"})
+    
+    assert response.status_code == 200
+    assert _cached_formats(generate_vcard(name="Background Mode")) == ["png", "svg", "eps", "pdf"]
+
+
+def test_analytics_counts_logged_scans():
+    """Test scans logged through /scan show up in the analytics totals."""
+    from app.main import vcard_storage
+    from app.scan_writer import scan_writer
+    vcard_id = "test-analytics-id"
+    vcard_storage[vcard_id] = {
+        "content": "BEGIN:VCARD\nVERSION:3.0\nFN:Analytics Test\nEND:VCARD",
+        "filename": "analytics-test.vcf",
+        "name": "Analytics Test"
+    }
+    
+    client.get(f"/scan/{vcard_id}", headers={"user-agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0) Mobile"})
+    client.get(f"/scan/{vcard_id}", headers={"user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"})
+    scan_writer.flush()
+    
+    analytics = client.get(f"/analytics/{vcard_id}").json()["analytics"]
+    assert analytics["total_scans"] == 2
+    assert analytics["mobile_scans"] == 1
+    assert analytics["desktop_scans"] == 1
+    assert analytics["os_breakdown"] == {"Windows": 1, "iOS": 1}
+
+
+def test_analytics_exact_unique_visitors():
+    """Test exact=true counts unique visitors from the scans table."""
+    from app.main import vcard_storage
+    from app.scan_writer import scan_writer
+    vcard_id = "test-exact-id"
+    vcard_storage[vcard_id] = {
+        "content": "BEGIN:VCARD\nVERSION:3.0\nFN:Exact Test\nEND:VCARD",
+        "filename": "exact-test.vcf",
+        "name": "Exact Test"
+    }
+    
+    for ip in ["10.1.0.1", "10.1.0.2", "10.1.0.1"]:
+        client.get(f"/scan/{vcard_id}", headers={"x-forwarded-for": ip})
+    scan_writer.flush()
+    
+    approximate = client.get(f"/analytics/{vcard_id}").json()["analytics"]
+    exact = client.get(f"/analytics/{vcard_id}?exact=true").json()["analytics"]
+    assert exact["unique_visitors"] == 2
+    assert approximate["unique_visitors"] == 2
+
+
+def test_evicted_vcard_falls_back_to_database():
+    """Test cards missing from the cache are loaded from the database."""
+    from app.main import vcard_storage
+    response = client.post("/generate", data={"name": "Evicted Card"})
+    assert response.status_code == 200
+    
+    vcard_id = response.text.split("/vcard/")[1].split('"')[0]
+    vcard_storage.clear()
+    
+    assert client.get(f"/analytics/{vcard_id}").json()["vcard_name"] == "Evicted Card"
+    assert "FN:Evicted Card" in client.get(f"/vcard/{vcard_id}").text
+    assert vcard_storage.get(vcard_id) is not None
+
+
+def _store_test_card(vcard_id, name="Conditional Test"):
+    from app.main import vcard_storage
+    vcard_storage[vcard_id] = {
+        "content": f"BEGIN:VCARD\nVERSION:3.0\nFN:{name}\nEND:VCARD",
+        "filename": "conditional-test.vcf",
+        "name": name
+    }
+
+
+def test_vcard_conditional_get():
+    """Test /vcard returns an ETag and answers a matching If-None-Match with 304."""
+    _store_test_card("test-etag-vcard")
+    response = client.get("/vcard/test-etag-vcard")
+    etag = response.headers["etag"]
+    
+    assert response.headers["cache-control"]
+    
+    cached = client.get("/vcard/test-etag-vcard", headers={"if-none-match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+    
+    stale = client.get("/vcard/test-etag-vcard", headers={"if-none-match": '"other"'})
+    assert stale.status_code == 200
+
+
+def test_qr_conditional_get_skips_rendering():
+    """Test /qr answers a matching If-None-Match without rendering."""
+    from app.qr import render_cache
+    _store_test_card("test-etag-qr")
+    etag = client.get("/qr/test-etag-qr.svg").headers["etag"]
+    assert etag != client.get("/qr/test-etag-qr.png").headers["etag"]
+    
+    render_cache.clear()
+    cached = client.get("/qr/test-etag-qr.svg", headers={"if-none-match": f"W/{etag}"})
+    
+    assert cached.status_code == 304
+    assert render_cache.misses == 0
+    assert len(render_cache) == 0
+
+
+def test_scan_conditional_get_still_logs():
+    """Test /scan logs the scan even when it answers 304."""
+    from app.scan_writer import scan_writer
+    _store_test_card("test-etag-scan")
+    etag = client.get("/scan/test-etag-scan").headers["etag"]
+    
+    cached = client.get("/scan/test-etag-scan", headers={"if-none-match": etag})
+    scan_writer.flush()
+    
+    assert cached.status_code == 304
+    assert client.get("/analytics/test-etag-scan").json()["analytics"]["total_scans"] == 2
+
+
+def test_metrics_endpoint():
+    """Test /metrics reports route latency, render timings and cache counters."""
+    _store_test_card("test-metrics")
+    client.get("/scan/test-metrics")
+    client.get("/qr/test-metrics.svg")
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'route="/scan/{vcard_id}",status="200"' in response.text
+    assert 'qr_render_seconds_count{format="svg"}' in response.text
+    assert 'cache_hit_ratio{cache="vcard"}' in response.text
+    assert 'scan_events_total{outcome="written"}' in response.text
+
+
+def test_profile_admin_routes(monkeypatch, tmp_path):
+    """Test the profile admin routes honour the switch and the token."""
+    import app.main as main
+    from app.profiling import ProfileStore
+    assert client.get("/admin/profiles").status_code == 404
+    
+    store = ProfileStore(str(tmp_path))
+    (tmp_path / "20250101-000000-000000001-GET-scan.prof").write_bytes(b"profile")
+    monkeypatch.setattr(main, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(main, "profile_store", store)
+    # An empty token denies every caller
+    monkeypatch.setattr("app.profiling.PROFILE_TOKEN", "")
+    assert client.get("/admin/profiles", headers={"x-profile": ""}).status_code == 403
+    assert client.get("/admin/profiles", headers={"x-profile": "anything"}).status_code == 403
+    monkeypatch.setattr("app.profiling.PROFILE_TOKEN", "secret")
+    
+    assert client.get("/admin/profiles", headers={"x-profile": "wrong"}).status_code == 403
+    listing = client.get("/admin/profiles", headers={"x-profile": "secret"}).json()["profiles"]
+    assert [profile["name"] for profile in listing] == ["20250101-000000-000000001-GET-scan.prof"]
+    
+    download = client.get(f"/admin/profiles/{listing[0]['name']}", headers={"x-profile": "secret"})
+    assert download.content == b"profile"
+    assert client.get("/admin/profiles/missing.prof", headers={"x-profile": "secret"}).status_code == 404
+
+
+def test_health_and_readiness(monkeypatch):
+    """Test /healthz always answers and /readyz waits for warm-up and the tunnel."""
+    import app.main as main
+    monkeypatch.setitem(main.startup_state, "warmed", False)
+    monkeypatch.setitem(main.startup_state, "tunnel", "disabled")
+    monkeypatch.delenv("BASE_URL", raising=False)
+    
+    assert client.get("/healthz").json() == {"status": "ok"}
+    
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.json()["checks"] == {"database": True, "warmed": False, "base_url": True}
+    
+    main.warm_up()
+    assert client.get("/readyz").status_code == 200
+    
+    monkeypatch.setitem(main.startup_state, "tunnel", "pending")
+    assert client.get("/readyz").status_code == 503
+    monkeypatch.setitem(main.startup_state, "tunnel", "failed")
+    assert client.get("/readyz").status_code == 200
+
+
+def test_scan_history_keyset_pagination():
+    """Test /analytics/{id}/scans pages through scans newest first without repeats."""
+    from app.scan_writer import scan_writer
+    _store_test_card("test-history")
+    for i in range(5):
+        client.get("/scan/test-history", headers={"x-forwarded-for": f"10.2.0.{i}"})
+    scan_writer.flush()
+    
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/analytics/test-history/scans", params=params).json()
+        assert len(page["scans"]) <= 2
+        seen.extend(scan["ip_address"] for scan in page["scans"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    
+    assert seen == [f"10.2.0.{i}" for i in reversed(range(5))]
+    assert client.get("/analytics/test-history/scans", params={"cursor": "bogus"}).status_code == 400
+    assert client.get("/analytics/missing-card/scans").status_code == 404
+    assert client.get("/analytics/scans").json()["vcard_id"] is None
+
+
+def test_scan_series_buckets():
+    """Test /analytics/{id}/series returns filled buckets from the rollups."""
+    from app.scan_writer import scan_writer
+    _store_test_card("test-series")
+    client.get("/scan/test-series", headers={"user-agent": "Mozilla/5.0 (iPhone) Mobile"})
+    client.get("/scan/test-series", headers={"user-agent": "Mozilla/5.0 (Windows NT 10.0)"})
+    scan_writer.flush()
+    
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    yesterday = (datetime.utcnow() - timedelta(days=1)).strftime("%Y-%m-%d")
+    response = client.get("/analytics/test-series/series", params={"bucket": "day", "from": yesterday, "to": today})
+    series = response.json()["series"]
+    
+    assert [point["bucket"] for point in series] == [yesterday, today]
+    assert series[0]["scans"] == 0
+    assert series[1] == {"bucket": today, "scans": 2, "mobile": 1, "desktop": 1, "tablet": 0}
+    
+    hourly = client.get("/analytics/test-series/series", params={"bucket": "hour"}).json()["series"]
+    assert len(hourly) == 49
+    assert sum(point["scans"] for point in hourly) == 2
+    
+    assert client.get("/analytics/series", params={"bucket": "week"}).status_code == 400
+    assert client.get("/analytics/series", params={"bucket": "hour", "from": "2000-01-01"}).status_code == 400
+    assert client.get("/analytics/series", params={"to": "0001-01-01"}).status_code == 400
+
+
+def test_scan_series_range_converts_offsets_to_utc():
+    """Test from/to values with a UTC offset are converted, and can be mixed with naive ones."""
+    from app.main import parse_series_range
+    start, end = parse_series_range("hour", "2025-01-05T10:30:00+02:00", "2025-01-05T12:00:00+02:00")
+    
+    assert (start, end) == (datetime(2025, 1, 5, 8), datetime(2025, 1, 5, 10))
+    
+    response = client.get("/analytics/series", params={"from": "2025-01-01", "to": "2025-01-05T10:00:00+02:00"})
+    assert response.status_code == 200
+    assert len(response.json()["series"]) == 5
+
+
+def test_analytics_export_endpoint():
+    """Test /analytics/export streams a card's scans and validates its parameters."""
+    import gzip
+    from app.scan_writer import scan_writer
+    _store_test_card("test-export")
+    for i in range(3):
+        client.get("/scan/test-export", headers={"x-forwarded-for": f"10.3.0.{i}"})
+    scan_writer.flush()
+    
+    response = client.get("/analytics/export", params={"vcard_id": "test-export", "format": "csv", "gzip": "true"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="scans-test-export.csv.gz"' in response.headers["content-disposition"]
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert len(lines) == 4
+    
+    ndjson = client.get("/analytics/export", params={"vcard_id": "test-export", "from": "2000-01-01"})
+    assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+    assert len(ndjson.text.splitlines()) == 3
+    
+    assert client.get("/analytics/export", params={"format": "xml"}).status_code == 400
+    assert client.get("/analytics/export", params={"from": "yesterday"}).status_code == 400
+    assert client.get("/analytics/export", params={"vcard_id": "missing-card"}).status_code == 404
+
+
+def test_url_mode_encodes_short_scan_link():
+    """Test url mode encodes a short /scan link that resolves to the card."""
+    from app.conditional import QR_URL_CACHE_CONTROL, make_etag
+    from app.shortcodes import short_code_for
+    response = client.post("/generate", data={"name": "Short Link", "qr_mode": "url"})
+    assert response.status_code == 200
+    assert "Short Link Mode" in response.text
+    assert "The full vCard would need version" in response.text
+    
+    vcard_id = response.text.split("/vcard/")[1].split('"')[0]
+    code = short_code_for(vcard_id)
+    assert code
+    
+    scanned = client.get(f"/scan/{code}")
+    assert scanned.status_code == 200
+    assert "FN:Short Link" in scanned.text
+    
+    qr = client.get(f"/qr/{vcard_id}.svg")
+    assert qr.headers["etag"] == make_etag(f"http://testserver/scan/{code}", "svg")
+    # The link depends on the base URL, so the image must not be cached as immutable
+    assert qr.headers["cache-control"] == QR_URL_CACHE_CONTROL
+    
+    assert client.post("/generate", data={"name": "Bad Mode", "qr_mode": "nfc"}).status_code == 400
+
+
+def test_compare_qr_modes_reports_savings():
+    """Test the mode comparison reports versions and bytes saved by url mode."""
+    import asyncio
+    from app.main import compare_qr_modes
+    from app.vcard import generate_vcard
+    vcard_content = generate_vcard(
+        name="Jane Smith", company="Acme Corp", title="Software Engineer",
+        email="jane@acme.com", phone="+1-555-123-4567", website="https://acme.com"
+    )
+    
+    comparison = asyncio.run(compare_qr_modes(vcard_content, "https://example.com/scan/Ab3dE5g"))
+    
+    assert comparison["url"]["version"] < comparison["vcard"]["version"]
+    assert comparison["bytes_saved"] == len(vcard_content.encode()) - len("https://example.com/scan/Ab3dE5g")
+
+
+def test_concurrent_scans_overlap(monkeypatch):
+    """Test concurrent /scan requests wait on the database together instead of in turn."""
+    import asyncio
+    import threading
+    import time
+    import httpx
+    import app.cards as cards
+    from app.cache import VCardRecord
+    active, peak, lock = set(), [0], threading.Lock()
+    
+    def slow_load_card(vcard_id, database=None):
+        with lock:
+            active.add(vcard_id)
+            peak[0] = max(peak[0], len(active))
+        time.sleep(0.2)
+        with lock:
+            active.discard(vcard_id)
+        return VCardRecord(f"BEGIN:VCARD\nVERSION:3.0\nFN:{vcard_id}\nEND:VCARD", "slow.vcf", vcard_id)
+    monkeypatch.setattr(cards, "load_card", slow_load_card)
+    
+    async def scan_all():
+        async with httpx.AsyncClient(app=app, base_url="http://testserver") as async_client:
+            return await asyncio.gather(*(async_client.get(f"/scan/slow-card-{i}") for i in range(4)))
+    
+    start = time.perf_counter()
+    responses = asyncio.run(scan_all())
+    elapsed = time.perf_counter() - start
+    
+    assert [response.status_code for response in responses] == [200] * 4
+    assert peak[0] == 4
+    # Serialized lookups would take at least 0.8s
+    assert elapsed < 0.6
@@ -0,0 +1,40 @@
+"""
+Tests for the Prometheus metrics registry.
+"""
+from app.metrics import Registry, cache_family
+
+
+def test_counter_and_histogram_exposition():
+    """Test counters and histograms render in the Prometheus text format."""
+    registry = Registry()
+    errors = registry.counter("errors_total", "Errors", ("source",))
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.01, 0.1))
+    
+    errors.inc("log_scan")
+    errors.inc("log_scan")
+    latency.observe(0.005, "/scan/{vcard_id}")
+    latency.observe(0.05, "/scan/{vcard_id}")
+    latency.observe(3.0, "/scan/{vcard_id}")
+    
+    text = registry.render()
+    assert "# TYPE errors_total counter" in text
+    assert 'errors_total{source="log_scan"} 2' in text
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{route="/scan/{vcard_id}",le="0.01"} 1' in text
+    assert 'latency_seconds_bucket{route="/scan/{vcard_id}",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="/scan/{vcard_id}",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{route="/scan/{vcard_id}"} 3' in text
+
+
+def test_collectors_run_at_scrape_time():
+    """Test collectors report current values and a failing collector is skipped."""
+    registry = Registry()
+    stats = {"render": {"hits": 0, "misses": 0}}
+    registry.add_collector(lambda: cache_family("cache", stats))
+    registry.add_collector(lambda: 1 / 0)
+    
+    stats["render"] = {"hits": 3, "misses": 1}
+    text = registry.render()
+    
+    assert 'cache_hits_total{cache="render"} 3' in text
+    assert 'cache_hit_ratio{cache="render"} 0.75' in text
@@ -0,0 +1,68 @@
+"""
+Tests for the opt-in profiling middleware and profile store.
+"""
+import pstats
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.profiling import ProfileStore, ProfilingMiddleware
+
+
+def make_client(store, enabled=True, sample_rate=0, token="secret"):
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"item": item_id}
+
+    app.add_middleware(ProfilingMiddleware, store=store, enabled=enabled, sample_rate=sample_rate,
+                       token=token)
+    return TestClient(app)
+
+
+def test_header_triggers_profile(tmp_path):
+    """Test a request with X-Profile is profiled and its profile is saved."""
+    store = ProfileStore(str(tmp_path), max_profiles=10)
+    client = make_client(store)
+    
+    assert "x-profile-id" not in client.get("/items/1").headers
+    assert "x-profile-id" not in client.get("/items/1", headers={"x-profile": "wrong"}).headers
+    response = client.get("/items/2", headers={"x-profile": "secret"})
+    
+    name = response.headers["x-profile-id"]
+    assert "GET-items-item_id" in name
+    assert [profile["name"] for profile in store.list()] == [name]
+    assert pstats.Stats(store.path(name)).total_calls > 0
+
+
+def test_sampling_and_disabled(tmp_path):
+    """Test 1-in-N sampling, and that nothing is profiled when disabled."""
+    store = ProfileStore(str(tmp_path / "sampled"), max_profiles=10)
+    client = make_client(store, sample_rate=3)
+    for i in range(6):
+        client.get(f"/items/{i}")
+    assert len(store.list()) == 2
+    
+    disabled = ProfileStore(str(tmp_path / "disabled"))
+    client = make_client(disabled, enabled=False, sample_rate=1)
+    client.get("/items/1", headers={"x-profile": "secret"})
+    assert disabled.list() == []
+
+
+def test_empty_token_disables_profiling(tmp_path):
+    """Test that without a token no header value, and no sample, triggers a profile."""
+    store = ProfileStore(str(tmp_path))
+    client = make_client(store, sample_rate=1, token="")
+    
+    assert "x-profile-id" not in client.get("/items/1", headers={"x-profile": "anything"}).headers
+    assert store.list() == []
+
+
+def test_store_keeps_newest_profiles(tmp_path):
+    """Test the ring drops the oldest profiles and rejects unsafe names."""
+    store = ProfileStore(str(tmp_path), max_profiles=2)
+    client = make_client(store)
+    names = [client.get(f"/items/{i}", headers={"x-profile": "secret"}).headers["x-profile-id"] for i in range(4)]
+    
+    assert {profile["name"] for profile in store.list()} == set(names[2:])
+    assert store.path(names[0]) is None
+    assert store.path("../secrets.prof") is None
@@ -2,7 +2,10 @@
 Tests for QR code generation functionality.
 """
 import pytest
-from app.qr import generate_qr_code, get_qr_content_type, create_qr_response
+from app.qr import (
+    generate_qr_code, get_qr_content_type, create_qr_response,
+    RenderCache, render_cache, encode_qr, serialize_qr
+)
 
 
 def test_generate_qr_code_png():
@@ -57,3 +60,84 @@ def test_create_qr_response():
     assert response.media_type == "image/png"
     assert "attachment; filename=\"test_qr.png\"" in response.headers["Content-Disposition"]
     assert len(response.body) > 0
+
+
+def test_render_cache_hit_returns_same_bytes():
+    """Test repeated renders are served from the render cache."""
+    render_cache.clear()
+    first = generate_qr_code("cached data", "png")
+    second = generate_qr_code("cached data", "png")
+    
+    assert first is second
+    assert render_cache.hits == 1
+    assert render_cache.misses == 1
+
+
+def test_render_cache_key_includes_parameters():
+    """Test different formats and scales are cached separately."""
+    render_cache.clear()
+    generate_qr_code("cached data", "png", size=10)
+    generate_qr_code("cached data", "png", size=5)
+    generate_qr_code("cached data", "svg", size=10)
+    
+    assert len(render_cache) == 3
+    assert render_cache.hits == 0
+
+
+def test_render_cache_evicts_least_recently_used():
+    """Test the byte budget is enforced with LRU eviction."""
+    cache = RenderCache(max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    cache.get("a")
+    cache.put("c", b"12345")
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.get("c") == b"12345"
+    assert cache.evictions == 1
+    assert cache.current_bytes == 10
+
+
+def test_encode_qr_reused_across_formats():
+    """Test all formats for one payload share a single encode."""
+    render_cache.clear()
+    encode_qr.cache_clear()
+    for fmt in ["png", "svg", "eps", "pdf"]:
+        generate_qr_code("shared payload", fmt)
+    
+    info = encode_qr.cache_info()
+    assert info.misses == 1
+    assert info.hits == 3
+
+
+def test_serialize_qr_matches_generate():
+    """Test the serialize stage produces the same bytes as the full pipeline."""
+    render_cache.clear()
+    qr = encode_qr("serialize me")
+    assert serialize_qr(qr, "svg", 5, 2) == generate_qr_code("serialize me", "svg", 5, 2)
+
+
+@pytest.mark.parametrize("data", ["hi", "test data", "BEGIN:VCARD\nVERSION:3.0\nFN:Test User\nEND:VCARD"])
+@pytest.mark.parametrize("scale,border", [(10, 4), (1, 0), (3, 2)])
+def test_numpy_png_matches_segno(data, scale, border):
+    """Test the NumPy PNG writer is byte-for-byte identical to segno's."""
+    pytest.importorskip("numpy")
+    import io
+    from app.qr import write_png_numpy
+    
+    qr = encode_qr(data)
+    buffer = io.BytesIO()
+    qr.save(buffer, kind="png", scale=scale, border=border)
+    
+    assert write_png_numpy(qr, scale, border) == buffer.getvalue()
+
+
+def test_png_falls_back_to_segno_without_numpy(monkeypatch):
+    """Test PNG output is unchanged when the NumPy engine is unavailable."""
+    import app.qr as qr_module
+    qr = encode_qr("fallback")
+    fast = serialize_qr(qr, "png")
+    monkeypatch.setattr(qr_module, "np", None)
+    
+    assert serialize_qr(qr, "png") == fast
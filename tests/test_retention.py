@@ -0,0 +1,167 @@
+"""
+Tests for scan retention: archiving, rollup preservation and compaction.
+"""
+import json
+import sqlite3
+from datetime import datetime
+import pytest
+import app.main as main_module
+from app.export import iter_scan_export
+import app.retention as retention
+from app.retention import (
+    archive_path, archive_scans, compact, list_archives, main, retention_lock, run_retention
+)
+from app.rollups import backfill_rollups, read_totals
+from app.scan_writer import ScanWriter
+from tests.conftest import make_row
+
+
+NOW = datetime(2025, 6, 15, 12, 0, 0)
+
+
+@pytest.fixture
+def database(database):
+    writer = ScanWriter(database, autostart=False)
+    # Ten scans a month from March to June, two visitors reused across months
+    for month in (3, 4, 5, 6):
+        for i in range(10):
+            writer.submit(make_row(
+                vcard_id="card-a",
+                scan_time=f"2025-{month:02d}-{1 + i:02d} 12:00:00",
+                ip_address=f"10.0.{month}.{i % 2}",
+                device_type="mobile" if i % 2 else "desktop"
+            ))
+    writer.flush()
+    return database
+
+
+def test_archive_moves_old_scans_to_month_files(database, tmp_path):
+    """Test scans past the retention window move to one archive per month."""
+    archive_dir = str(tmp_path / "archives")
+
+    moved = archive_scans(database, retention_days=45, archive_dir=archive_dir, batch_size=3, now=NOW)
+
+    # The cutoff is 2025-05-01, so March and April are archived
+    assert moved == {"2025-03": 10, "2025-04": 10}
+    assert [month for month, _ in list_archives(database)] == ["2025-03", "2025-04"]
+    with database.reader() as conn:
+        assert conn.execute("SELECT MIN(scan_time) FROM scans").fetchone()[0] == "2025-05-01 12:00:00"
+    with sqlite3.connect(archive_path("2025-03", archive_dir)) as archive:
+        assert archive.execute("SELECT COUNT(*) FROM scans").fetchone()[0] == 10
+
+    # A second run finds nothing left to move
+    assert archive_scans(database, retention_days=45, archive_dir=archive_dir, now=NOW) == {}
+
+
+def test_archived_count_skips_rows_another_run_deleted(database, tmp_path, monkeypatch):
+    """Test scan_archives counts only the rows this run deleted when runs overlap."""
+    archive_dir = str(tmp_path / "archives")
+    connect = sqlite3.connect
+
+    class RacingArchive:
+        """Archive connection whose commits let a concurrent run delete the copied rows first."""
+
+        def __init__(self, path):
+            self.conn = connect(path)
+            self.commits = 0
+
+        def __getattr__(self, name):
+            return getattr(self.conn, name)
+
+        def commit(self):
+            self.conn.commit()
+            self.commits += 1
+            # The first commit creates the schema; later ones follow a copied batch
+            if self.commits > 1:
+                with database.writer() as conn:
+                    conn.execute("DELETE FROM scans WHERE scan_time < '2025-04-01'")
+
+    def racing_connect(path, *args, **kwargs):
+        if path.startswith(archive_dir):
+            return RacingArchive(path)
+        return connect(path, *args, **kwargs)
+
+    monkeypatch.setattr(retention.sqlite3, "connect", racing_connect)
+    moved = archive_scans(database, retention_days=75, archive_dir=archive_dir, now=NOW)
+
+    assert moved == {"2025-03": 0}
+    with database.reader() as conn:
+        assert conn.execute("SELECT scans FROM scan_archives WHERE month = '2025-03'").fetchone()[0] == 0
+
+
+def test_run_retention_skips_while_another_process_holds_the_lock(database, monkeypatch):
+    """Test only one process runs retention at a time."""
+    calls = []
+    monkeypatch.setattr(retention, "archive_scans", lambda database: calls.append(database) or {})
+
+    with retention_lock(database) as locked:
+        assert locked
+        run_retention(database)
+    assert calls == []
+
+    run_retention(database)
+    assert calls == [database]
+
+
+def test_rollups_survive_archive_and_backfill(database, tmp_path):
+    """Test totals keep counting archived scans, even after a rollup rebuild."""
+    with database.reader() as conn:
+        before = read_totals(conn, "card-a")
+
+    archive_scans(database, retention_days=45, archive_dir=str(tmp_path / "archives"), now=NOW)
+    with database.writer() as conn:
+        backfill_rollups(conn)
+
+    with database.reader() as conn:
+        after = read_totals(conn, "card-a")
+    assert after == before
+    assert after["total_scans"] == 40
+
+
+def test_history_export_and_exact_visitors_include_archives(database, tmp_path, monkeypatch):
+    """Test history paging, exports and exact counts continue into the archives."""
+    archive_scans(database, retention_days=45, archive_dir=str(tmp_path / "archives"), now=NOW)
+    monkeypatch.setattr(main_module, "db", database)
+
+    scan_times = []
+    cursor = None
+    while True:
+        page = main_module.get_scan_history("card-a", limit=15, cursor=cursor)
+        scan_times += [scan["scan_time"] for scan in page["scans"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert len(scan_times) == 40
+    assert scan_times == sorted(scan_times, reverse=True)
+
+    rows = [json.loads(line) for line in b"".join(iter_scan_export(
+        "ndjson", vcard_id="card-a", start="2025-04-05 00:00:00", end="2025-05-05 00:00:00", database=database
+    )).decode().splitlines()]
+    assert [row["scan_time"][:10] for row in rows][:2] == ["2025-04-05", "2025-04-06"]
+    assert len(rows) == 10
+
+    assert main_module.get_scan_stats("card-a", exact=True)["unique_visitors"] == 8
+
+
+def test_compact_releases_free_pages(database, tmp_path):
+    """Test incremental vacuum returns the pages freed by archiving."""
+    archive_scans(database, retention_days=45, archive_dir=str(tmp_path / "archives"), now=NOW)
+    with database.writer() as conn:
+        conn.execute("CREATE TABLE filler (data BLOB)")
+        conn.executemany("INSERT INTO filler VALUES (zeroblob(4096))", [()] * 50)
+    with database.writer() as conn:
+        conn.execute("DROP TABLE filler")
+
+    assert compact(database, step_pages=8) >= 50
+    with database.reader() as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+
+
+def test_retention_command(database, tmp_path, capsys):
+    """Test the command line archive run."""
+    archive_dir = tmp_path / "cli-archives"
+    database.close()
+
+    main(["archive", "--db", database.path, "--days", "3650", "--archive-dir", str(archive_dir)])
+
+    assert "Archived 0 scans" in capsys.readouterr().out
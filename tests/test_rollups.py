@@ -0,0 +1,121 @@
+"""
+Tests for the incrementally maintained scan rollups.
+"""
+import pytest
+from app.db import Database
+from app.rollups import (
+    ALL_VCARDS, backfill_rollups, bucket_for, main, read_breakdown, read_totals,
+    read_unique_visitors
+)
+from app.scan_writer import ScanWriter
+from tests.conftest import make_row
+
+
+ROWS = [
+    make_row("card-a", "2025-03-01 09:15:00", "mobile", "10.0.0.1", os="iOS", browser="Safari"),
+    make_row("card-a", "2025-03-01 09:45:00", "mobile", "10.0.0.1", os="iOS", browser="Safari"),
+    make_row("card-a", "2025-03-01 17:00:00", "desktop", "10.0.0.2", os="Windows", browser="Chrome"),
+    make_row("card-a", "2025-03-02 08:00:00", "tablet", "10.0.0.1", os="iOS", browser="Chrome"),
+    make_row("card-b", "2025-03-02 10:30:00", None, "10.0.0.3"),
+]
+
+
+def rollup_rows(database, table):
+    with database.reader() as conn:
+        return sorted(conn.execute(f"SELECT * FROM {table}").fetchall())
+
+
+def test_bucket_for():
+    """Test scan times map to hour and day buckets."""
+    assert bucket_for("2025-03-01 09:15:00", "hour") == "2025-03-01 09:00:00"
+    assert bucket_for("2025-03-01T09:15:00.000Z", "hour") == "2025-03-01 09:00:00"
+    assert bucket_for("2025-03-01 09:15:00", "day") == "2025-03-01"
+
+
+def test_writer_maintains_rollups(database):
+    """Test the scan writer updates rollups in the same transaction."""
+    writer = ScanWriter(database, batch_size=2, autostart=False)
+    for row in ROWS:
+        writer.submit(row)
+    writer.flush()
+    
+    with database.reader() as conn:
+        card_a = read_totals(conn, "card-a")
+        everything = read_totals(conn)
+    
+    assert card_a == {
+        "total_scans": 4,
+        "mobile_scans": 2,
+        "desktop_scans": 1,
+        "tablet_scans": 1,
+        "first_scan": "2025-03-01 09:15:00",
+        "last_scan": "2025-03-02 08:00:00"
+    }
+    assert everything["total_scans"] == 5
+    
+    hourly = [row for row in rollup_rows(database, "scan_rollup_hourly") if row[0] == "card-a"]
+    assert ("card-a", "2025-03-01 09:00:00", "mobile", 2, "2025-03-01 09:15:00", "2025-03-01 09:45:00") in hourly
+
+
+def test_backfill_matches_incremental(database):
+    """Test rebuilding from the scans table gives the same rollups."""
+    writer = ScanWriter(database, autostart=False)
+    for row in ROWS:
+        writer.submit(row)
+    writer.flush()
+    tables = ("scan_rollup_hourly", "scan_rollup_daily", "scan_rollup_dimensions", "scan_visitor_sketches")
+    incremental = {table: rollup_rows(database, table) for table in tables}
+    
+    with database.writer() as conn:
+        backfill_rollups(conn)
+    
+    for table, rows in incremental.items():
+        assert rollup_rows(database, table) == rows
+    assert any(row[0] == ALL_VCARDS for row in incremental["scan_rollup_daily"])
+
+
+def test_backfill_command(tmp_path, capsys):
+    """Test the backfill command rebuilds rollups for existing scans."""
+    path = str(tmp_path / "cli.db")
+    database = Database(path)
+    with database.writer() as conn:
+        conn.execute("INSERT INTO scans (vcard_id, scan_time, device_type) VALUES ('card-c', '2025-04-01 10:00:00', 'mobile')")
+    database.close()
+    
+    main(["backfill", "--db", path])
+    
+    database = Database(path)
+    with database.reader() as conn:
+        assert read_totals(conn, "card-c")["mobile_scans"] == 1
+    database.close()
+    assert "Rebuilt rollups" in capsys.readouterr().out
+
+
+def test_unique_visitors_merge_across_buckets(database):
+    """Test visitor sketches merge across days, cards and ranges."""
+    writer = ScanWriter(database, autostart=False)
+    for row in ROWS:
+        writer.submit(row)
+    writer.flush()
+    
+    with database.reader() as conn:
+        assert read_unique_visitors(conn, "card-a") == 2
+        assert read_unique_visitors(conn, "card-a", start="2025-03-02") == 1
+        assert read_unique_visitors(conn, "card-a", end="2025-03-01") == 2
+        assert read_unique_visitors(conn) == 3
+
+
+def test_breakdown_by_os_and_browser(database):
+    """Test OS and browser counts come from the dimension rollup."""
+    writer = ScanWriter(database, autostart=False)
+    for row in ROWS:
+        writer.submit(row)
+    writer.flush()
+    
+    with database.reader() as conn:
+        assert read_breakdown(conn, "os", "card-a") == {"iOS": 3, "Windows": 1}
+        assert read_breakdown(conn, "browser", "card-a", start="2025-03-02") == {"Chrome": 1}
+        assert read_breakdown(conn, "os") == {"iOS": 3, "Windows": 1, "unknown": 1}
+    
+    with pytest.raises(ValueError):
+        read_breakdown(conn, "country")
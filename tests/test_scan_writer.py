@@ -0,0 +1,139 @@
+"""
+Tests for the batched scan writer.
+"""
+import json
+import asyncio
+import pytest
+import app.scan_writer as scan_writer_module
+from app.scan_writer import ScanWriter
+from tests.conftest import make_row
+
+
+def count_scans(database):
+    with database.reader() as conn:
+        return conn.execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+
+
+def test_flush_writes_queued_rows_in_batches(database):
+    """Test queued rows are committed in batches by the writer thread."""
+    writer = ScanWriter(database, batch_size=4, flush_interval=0.05, policy="block")
+    try:
+        for i in range(10):
+            writer.submit(make_row(ip_address=f"10.0.0.{i}"))
+        writer.flush()
+        
+        assert count_scans(database) == 10
+        assert writer.written == 10
+        assert writer.batches < 10
+    finally:
+        writer.stop()
+
+
+def test_stop_flushes_pending_rows(database):
+    """Test stopping the writer commits whatever is still queued."""
+    writer = ScanWriter(database, flush_interval=60, policy="block")
+    writer.submit(make_row())
+    writer.stop()
+    
+    assert count_scans(database) == 1
+
+
+def test_drop_policy_discards_overflow(database):
+    """Test the drop policy rejects rows once the queue is full."""
+    writer = ScanWriter(database, queue_size=2, policy="drop", autostart=False)
+    results = [writer.submit(make_row()) for _ in range(3)]
+    writer.flush()
+    
+    assert results == [True, True, False]
+    assert writer.dropped == 1
+    assert count_scans(database) == 2
+
+
+def test_spill_policy_replays_overflow(database, tmp_path):
+    """Test the spill policy keeps overflow on disk and replays it."""
+    spill_path = tmp_path / "spill.jsonl"
+    writer = ScanWriter(database, queue_size=1, policy="spill", spill_path=str(spill_path), autostart=False)
+    for i in range(3):
+        assert writer.submit(make_row(ip_address=f"10.0.0.{i}"))
+    
+    assert writer.spilled == 2
+    assert spill_path.exists()
+    
+    writer.flush()
+    
+    assert count_scans(database) == 3
+    assert not spill_path.exists()
+
+
+def test_torn_spill_line_is_set_aside(database, tmp_path):
+    """Test a truncated spill line is skipped and the writer thread keeps running."""
+    spill_path = tmp_path / "spill.jsonl"
+    good = json.dumps(list(make_row(ip_address="10.0.0.1")))
+    spill_path.write_text(good + "\n" + good[:20] + "\n")
+    writer = ScanWriter(database, flush_interval=0.01, policy="spill", spill_path=str(spill_path))
+    try:
+        writer.submit(make_row(ip_address="10.0.0.2"))
+        writer.flush()
+        
+        assert writer._thread.is_alive()
+        assert count_scans(database) == 2
+        assert writer.failed == 1
+        assert (tmp_path / "spill.jsonl.bad").read_text() == good[:20] + "\n"
+        assert not (tmp_path / "spill.jsonl.replay").exists()
+        
+        # Later scans are still written
+        writer.submit(make_row(ip_address="10.0.0.3"))
+        writer.flush()
+        assert count_scans(database) == 3
+    finally:
+        writer.stop()
+
+
+def test_writer_thread_survives_errors(database, monkeypatch):
+    """Test an unexpected error in a write does not end the writer thread."""
+    writer = ScanWriter(database, flush_interval=0.01, policy="block")
+    original = writer._write_batch
+    calls = []
+    
+    def flaky(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        original(batch)
+    monkeypatch.setattr(writer, "_write_batch", flaky)
+    try:
+        writer.submit(make_row())
+        writer.flush()
+        writer.submit(make_row())
+        writer.flush()
+        
+        assert writer._thread.is_alive()
+        assert count_scans(database) == 1
+    finally:
+        writer.stop()
+
+
+def test_submit_async_waits_on_the_loop(database, monkeypatch):
+    """Test async submits wait for room without a thread, and drop after the block timeout."""
+    monkeypatch.setattr(scan_writer_module, "SCAN_QUEUE_BLOCK_TIMEOUT", 0.2)
+    writer = ScanWriter(database, queue_size=1, policy="block", autostart=False)
+    writer.submit(make_row())
+    
+    async def submit_then_drain():
+        waiting = asyncio.ensure_future(writer.submit_async(make_row()))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        writer._drain()
+        return await waiting
+    
+    assert asyncio.run(submit_then_drain())
+    assert not asyncio.run(writer.submit_async(make_row()))
+    assert writer.dropped == 1
+    writer.flush()
+    assert count_scans(database) == 2
+
+
+def test_unknown_policy():
+    """Test an unknown queue policy is rejected."""
+    with pytest.raises(ValueError):
+        ScanWriter(policy="ignore")
@@ -0,0 +1,63 @@
+"""
+Tests for url-mode short codes.
+"""
+import app.shortcodes as shortcodes
+from app.shortcodes import (
+    BASE62_ALPHABET, allocate_short_code, generate_code, is_short_code, peek_short_code, resolve_short_code,
+    short_code_for
+)
+
+
+def test_generate_code_is_base62():
+    """Test codes have the requested length and only base62 characters."""
+    code = generate_code(9)
+
+    assert len(code) == 9
+    assert set(code) <= set(BASE62_ALPHABET)
+    assert is_short_code(code)
+    assert not is_short_code("6f1c2a9e-8d2b-4c55-9d0b-2f0b4a4e2c11")
+
+
+def test_allocate_and_resolve(database):
+    """Test a card keeps one code and the code resolves back to the card."""
+    code = allocate_short_code("card-1", database)
+
+    assert allocate_short_code("card-1", database) == code
+    assert resolve_short_code(code, database) == "card-1"
+    assert short_code_for("card-1", database) == code
+    assert resolve_short_code("Zz9Zz9Z", database) is None
+    assert short_code_for("card-2", database) is None
+
+
+def test_allocation_retries_collisions_then_grows(database, monkeypatch):
+    """Test a taken code is retried, and repeated collisions move to a longer code."""
+    codes = iter(["aaaa", "aaaa", "aaaa", "bbbbb"])
+    monkeypatch.setattr(shortcodes, "generate_code", lambda length: next(codes)[:length])
+
+    assert allocate_short_code("card-1", database, length=4) == "aaaa"
+    assert allocate_short_code("card-2", database, length=4, attempts=2) == "bbbbb"
+
+
+def test_unknown_codes_are_not_cached(database):
+    """Test a code that missed once resolves after it is allocated."""
+    assert resolve_short_code("Later42", database) is None
+
+    with database.writer() as conn:
+        conn.execute("INSERT INTO short_codes (code, vcard_id) VALUES ('Later42', 'card-9')")
+
+    assert resolve_short_code("Later42", database) == "card-9"
+
+
+def test_card_codes_are_cached_per_process(database, monkeypatch):
+    """Test repeat lookups of a card's code, including "no code", skip the database."""
+    code = allocate_short_code("card-1", database)
+    assert short_code_for("card-2", database) is None
+
+    def fail(*args):
+        raise AssertionError("cached answers must not query the database")
+    monkeypatch.setattr(shortcodes, "_lookup_code", fail)
+
+    assert peek_short_code("card-1", database) == (True, code)
+    assert short_code_for("card-1", database) == code
+    assert short_code_for("card-2", database) is None
+    assert peek_short_code("card-3", database) == (False, None)
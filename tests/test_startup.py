@@ -0,0 +1,34 @@
+"""
+Tests for import time and startup behaviour.
+"""
+import os
+import sys
+import json
+import subprocess
+
+
+# Seconds app.main may take to import in a fresh interpreter
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "2.0"))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+print(json.dumps({"seconds": time.perf_counter() - start, "pyngrok": "pyngrok" in sys.modules}))
+"""
+
+
+def test_import_time_within_budget():
+    """Test app.main imports within budget and without loading pyngrok."""
+    env = dict(os.environ, NGROK_ENABLED="false")
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE], cwd=ROOT, env=env,
+        capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    
+    assert not measured["pyngrok"]
+    assert measured["seconds"] < IMPORT_TIME_BUDGET, measured
@@ -0,0 +1,232 @@
+"""
+Tests for the vCard storage backends.
+"""
+import json
+import fnmatch
+import socketserver
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+import app.cards as cards
+from app.cards import build_card, save_card
+import app.main as main_module
+from app.cache import VCardRecord
+from app.metrics import ERRORS
+from app.storage import (
+    MemoryStore, RedisStore, RESPClient, RESPError, SQLiteStore, TieredStore, create_store
+)
+
+
+class _RESPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough of the Redis protocol for the store."""
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _bulk(self, value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            command = args[0].upper()
+            self.server.commands.append(command)
+            if command == b"PING":
+                reply = b"+PONG\r\n"
+            elif command == b"GET":
+                value, expires = data.get(args[1], (None, None))
+                if expires is not None and expires <= time.time():
+                    data.pop(args[1], None)
+                    value = None
+                reply = self._bulk(value)
+            elif command == b"SET":
+                ttl = int(args[4]) if len(args) > 4 and args[3].upper() == b"EX" else None
+                data[args[1]] = (args[2], time.time() + ttl if ttl else None)
+                reply = b"+OK\r\n"
+            elif command == b"DEL":
+                removed = sum(data.pop(key, None) is not None for key in args[1:])
+                reply = b":%d\r\n" % removed
+            elif command == b"SCAN":
+                pattern = args[args.index(b"MATCH") + 1].decode()
+                keys = [key for key in data if fnmatch.fnmatch(key.decode(), pattern)]
+                reply = b"*2\r\n" + self._bulk(b"0") + b"*%d\r\n" % len(keys)
+                reply += b"".join(self._bulk(key) for key in keys)
+            else:
+                reply = b"-ERR unknown command\r\n"
+            self.wfile.write(reply)
+
+
+@pytest.fixture
+def resp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _RESPHandler)
+    server.daemon_threads = True
+    server.data = {}
+    server.commands = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _record(name="Jane Smith"):
+    return VCardRecord(f"BEGIN:VCARD\nVERSION:3.0\nFN:{name}\nEND:VCARD", "jane-smith.vcf", name)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, resp_server):
+    # The SQLite store reads the vcards rows written by save_card; it is tested on its own below
+    if request.param == "memory":
+        return MemoryStore()
+    return RedisStore(RESPClient(f"redis://127.0.0.1:{resp_server.server_address[1]}/0"))
+
+
+def test_backends_share_one_interface(store):
+    """Test every backend stores, returns, deletes and counts the same way."""
+    assert store.get("card-1") is None
+
+    store["card-1"] = {"content": "BEGIN:VCARD\nEND:VCARD", "filename": "a.vcf", "name": "A"}
+    record = store.get("card-1")
+
+    assert record.content == "BEGIN:VCARD\nEND:VCARD"
+    assert record.etag == VCardRecord(record.content, "a.vcf", "A").etag
+    assert "card-1" in store
+
+    store.delete("card-1")
+    assert store.get("card-1") is None
+    stats = store.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+
+    store.put("card-2", _record())
+    store.clear()
+    assert store.get("card-2") is None
+
+
+def test_hits_reuse_the_stored_etag(store, monkeypatch):
+    """Test a store hit carries the ETag it was stored with instead of rehashing the vCard."""
+    record = _record()
+    store.put("card-1", record)
+
+    def fail(*args):
+        raise AssertionError("store hits must not rehash the vCard")
+    monkeypatch.setattr("app.cache.make_etag", fail)
+
+    assert store.get("card-1").etag == record.etag
+
+
+def test_redis_entries_without_etag_still_load(resp_server):
+    """Test entries written before the ETag was stored are read and hashed once."""
+    store = RedisStore(RESPClient(f"redis://127.0.0.1:{resp_server.server_address[1]}/0"))
+    resp_server.data[store.prefix.encode() + b"card-1"] = (
+        json.dumps({"content": "BEGIN:VCARD\nEND:VCARD", "filename": "a.vcf", "name": "A"}).encode(), None
+    )
+
+    assert store.get("card-1").etag == VCardRecord("BEGIN:VCARD\nEND:VCARD", "a.vcf", "A").etag
+
+
+def test_sqlite_store_reads_vcards_rows(database, monkeypatch):
+    """Test the SQLite store serves saved cards from their vcards row and never writes."""
+    store = SQLiteStore(database)
+    record = build_card({"name": "Jane Smith"})
+    save_card("card-1", {"name": "Jane Smith"}, record, store, database)
+
+    statements = []
+    with database.writer() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        store.put("card-2", _record())
+        store.delete("card-1")
+        store.clear()
+    finally:
+        with database.writer() as conn:
+            conn.set_trace_callback(None)
+    assert statements == []
+
+    def fail(*args):
+        raise AssertionError("store hits must not rehash the vCard")
+    monkeypatch.setattr("app.cache.make_etag", fail)
+
+    assert store.get("card-1").etag == record.etag
+    assert store.get("card-2") is None
+    assert store.stats()["hits"] == 1 and store.stats()["misses"] == 1
+
+
+def test_shared_store_serves_every_worker(database):
+    """Test a card saved through one worker's store is a hit on another's."""
+    shared = SQLiteStore(database)
+    worker_a, worker_b = TieredStore(shared), TieredStore(shared)
+
+    save_card("card-1", {"name": "Jane Smith"}, build_card({"name": "Jane Smith"}), worker_a, database)
+
+    assert worker_b.get("card-1").name == "Jane Smith"
+    # The second lookup is answered by worker B's local cache
+    assert worker_b.get("card-1") is not None
+    assert worker_b.local.stats()["hits"] == 1
+    assert worker_b.stats()["hits"] == 2
+
+
+def test_resp_client_round_trip(resp_server):
+    """Test the RESP client encodes commands and parses each reply type."""
+    client = RESPClient(f"redis://127.0.0.1:{resp_server.server_address[1]}")
+
+    assert RESPClient.encode(("SET", "k", b"v")) == b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$1\r\nv\r\n"
+    assert client.execute("PING") == "PONG"
+    assert client.execute("SET", "k", "ünïcode", "EX", 10) == "OK"
+    assert client.execute("GET", "k").decode() == "ünïcode"
+    assert client.execute("DEL", "k", "missing") == 1
+    assert client.execute("GET", "k") is None
+    with pytest.raises(RESPError):
+        client.execute("NOPE")
+    # The connection survives an error reply
+    assert client.execute("PING") == "PONG"
+
+
+def test_redis_store_unreachable_is_a_miss(resp_server):
+    """Test a store server that is down degrades to misses instead of errors."""
+    port = resp_server.server_address[1]
+    resp_server.shutdown()
+    resp_server.server_close()
+    store = RedisStore(RESPClient(f"redis://127.0.0.1:{port}", timeout=0.2))
+    errors = ERRORS.value("vcard_store")
+
+    assert store.put("card-1", _record()).name == "Jane Smith"
+    assert store.get("card-1") is None
+    assert ERRORS.value("vcard_store") == errors + 2
+    assert store.stats()["errors"] == 2
+
+
+def test_create_store():
+    """Test the backend is chosen by name and shared backends get a local tier."""
+    assert isinstance(create_store("memory"), MemoryStore)
+    assert isinstance(create_store("sqlite").shared, SQLiteStore)
+    assert isinstance(create_store("redis", "redis://127.0.0.1:1/0").shared, RedisStore)
+    with pytest.raises(ValueError):
+        create_store("memcached")
+
+
+def test_handlers_read_cards_created_by_another_worker(resp_server, monkeypatch):
+    """Test every route finds a card that only exists in the shared store."""
+    url = f"redis://127.0.0.1:{resp_server.server_address[1]}/0"
+    TieredStore(RedisStore(RESPClient(url))).put("other-worker-card", _record("Other Worker"))
+
+    monkeypatch.setattr(main_module, "vcard_storage", TieredStore(RedisStore(RESPClient(url))))
+    # Nothing may fall through to the database and regenerate the card
+    monkeypatch.setattr(cards, "load_card", lambda vcard_id, database=None: None)
+    client = TestClient(main_module.app)
+
+    assert "FN:Other Worker" in client.get("/scan/other-worker-card").text
+    assert "FN:Other Worker" in client.get("/vcard/other-worker-card").text
+    assert client.get("/qr/other-worker-card.svg").status_code == 200
+    assert client.get("/analytics/other-worker-card").json()["vcard_name"] == "Other Worker"
+    assert resp_server.commands.count(b"GET") == 1
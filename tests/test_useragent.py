@@ -0,0 +1,52 @@
+"""
+Tests for the user-agent classifier.
+"""
+import pytest
+from app.useragent import UserAgentInfo, classify_user_agent
+
+
+@pytest.mark.parametrize("user_agent,expected", [
+    (
+        "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1",
+        UserAgentInfo("mobile", "iOS", "Safari", False)
+    ),
+    (
+        "Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) CriOS/120.0 Mobile/15E148 Safari/604.1",
+        UserAgentInfo("tablet", "iOS", "Chrome", False)
+    ),
+    (
+        "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Mobile Safari/537.36",
+        UserAgentInfo("mobile", "Android", "Chrome", False)
+    ),
+    (
+        "Mozilla/5.0 (Linux; Android 13; SM-X700) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/23.0 Chrome/115.0 Safari/537.36",
+        UserAgentInfo("tablet", "Android", "Samsung Internet", False)
+    ),
+    (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36 Edg/120.0",
+        UserAgentInfo("desktop", "Windows", "Edge", False)
+    ),
+    (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 14.1; rv:121.0) Gecko/20100101 Firefox/121.0",
+        UserAgentInfo("desktop", "macOS", "Firefox", False)
+    ),
+    (
+        "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+        UserAgentInfo("bot", "unknown", "unknown", True)
+    ),
+    ("curl/8.4.0", UserAgentInfo("bot", "unknown", "unknown", True)),
+    ("", UserAgentInfo("unknown", "unknown", "unknown", False)),
+])
+def test_classify_user_agent(user_agent, expected):
+    """Test device, OS, browser and bot detection."""
+    assert classify_user_agent(user_agent) == expected
+
+
+def test_classification_is_memoized():
+    """Test repeat user agents are served from the memo."""
+    user_agent = "Mozilla/5.0 (X11; Linux x86_64; memo-test) Gecko/20100101 Firefox/120.0"
+    classify_user_agent(user_agent)
+    hits = classify_user_agent.cache_info().hits
+    
+    assert classify_user_agent(user_agent).device_type == "desktop"
+    assert classify_user_agent.cache_info().hits == hits + 1